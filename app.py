@@ -1,24 +1,281 @@
+import atexit
+import json
+import os
+import sys
 import threading
 import uuid
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash
-from flask_migrate import Migrate
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Make `from app import app` in the workers reuse this module when run as a script
+if __name__ == '__main__':
+    sys.modules.setdefault('app', sys.modules[__name__])
+
+from flask import Flask, Response, abort, render_template, request, redirect, url_for, jsonify, flash
+from flask_migrate import Migrate, stamp, upgrade
+from sqlalchemy import event, inspect, or_, text
 
 import config
-from models import db, Job
-from workers import process_scraping_job
+from events import event_bus, format_sse
+from job_store import FINISHED_STATUSES
+from logs import setup_logging
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, counter, gauge, registry as metrics_registry
+from models import create_indexes, db, Job, paginate_jobs, set_sqlite_pragmas
+from retention import get_retention_stats, run_retention
+from scheduler import JobPipeline, QueueFullError, SchedulerStoppedError
+from scrapers.ai_modules.response_cache import get_response_cache
+from scrapers.ai_service import get_session_pool
+from scrapers.api_client import get_api_client_stats
+from scrapers.manage_browser import get_browser_pool
+from scrapers.social_scraper import get_caption_stats
+from scrapers.stock_thumbnails import get_stock_thumbnail_cache, get_stock_thumbnail_stats
+from scrapers.url_utils import prepare_batch
+from tracing import get_trace
+from workers import apply_cancel_requests, cancel_job, extract_job, fetch_job, get_job_state, job_event, job_store, upload_job
+
+logger = setup_logging("app")
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+# Revision matching the schema db.create_all() created before there were migrations
+BASELINE_REVISION = '3f2a9c1d7b10'
+MIGRATION_LOCK_KEY = 7310421
+RETENTION_LOCK_KEY = 7310422
+# Seconds between queue position checks and between keep-alive comments of event streams
+EVENT_POSITION_INTERVAL = 1
+EVENT_KEEPALIVE_INTERVAL = 15
+# Seconds between database reads of the history stream for jobs of other processes
+EVENT_POLL_INTERVAL = 5
+
+# Copied from the stats() of the scheduler, pools and caches on every scrape
+QUEUE_DEPTH = gauge('recipe_queue_depth', 'Jobs waiting for a worker of a pipeline stage', ('stage',))
+STAGE_RUNNING = gauge('recipe_stage_running', 'Jobs processed by the workers of a pipeline stage', ('stage',))
+BROWSER_POOL = gauge('recipe_browser_pool_browsers', 'Browsers in the browser pool', ('state',))
+AI_SESSIONS = gauge('recipe_ai_sessions', 'AI module sessions in the session pool', ('state',))
+CACHE_LOOKUPS = counter('recipe_cache_lookups_total', 'Lookups of the AI response, caption and stock image caches', ('cache', 'result'))
+CACHE_HIT_RATIO = gauge('recipe_cache_hit_ratio', 'Share of lookups answered by a cache since the start of the process', ('cache',))
+JOBS_IN_MEMORY = gauge('recipe_job_states', 'Jobs held in the in-memory job store', ('state',))
+EVENT_SUBSCRIBERS = gauge('recipe_event_subscribers', 'Open job event streams')
 
 app = Flask(__name__)
 app.config.from_object(config.Config)
 
 # Initialize database
 db.init_app(app)
-migrate = Migrate(app, db)
+migrate = Migrate(app, db, directory=MIGRATIONS_DIR, render_as_batch=True)
+
+@contextmanager
+def database_lock(key, name, blocking=True):
+    """
+    Lock shared by all processes using the database: an advisory lock on
+    PostgreSQL, a lock file in the instance folder otherwise.
+
+    Args:
+        key (int): Advisory lock key on PostgreSQL.
+        name (str): Name of the lock file.
+        blocking (bool): Wait for the lock instead of giving up.
+
+    Yields:
+        bool: Whether the lock was acquired, always True if `blocking`.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.connect() as connection:
+            if blocking:
+                connection.execute(text('SELECT pg_advisory_lock(:key)'), {'key': key})
+            elif not connection.execute(text('SELECT pg_try_advisory_lock(:key)'), {'key': key}).scalar():
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': key})
+        return
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(app.instance_path, exist_ok=True)
+    with open(os.path.join(app.instance_path, f'{name}.lock'), 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def init_database():
+    """Brings the database schema up to date. Databases created before the migrations are stamped first."""
+    app.config['MIGRATIONS_CONFIGURE_LOGGING'] = False
+    try:
+        # Keeps processes that start at the same time from migrating the database concurrently
+        with database_lock(MIGRATION_LOCK_KEY, 'migrate'):
+            tables = inspect(db.engine).get_table_names()
+            if 'job' in tables and 'alembic_version' not in tables:
+                logger.info("Stamping database created without migrations")
+                create_indexes()
+                stamp(directory=MIGRATIONS_DIR, revision=BASELINE_REVISION)
+            upgrade(directory=MIGRATIONS_DIR)
+    finally:
+        app.config.pop('MIGRATIONS_CONFIGURE_LOGGING', None)
 
-# Create tables
 with app.app_context():
-    db.create_all()
+    event.listen(db.engine, 'connect', set_sqlite_pragmas)
+    init_database()
+
+feed_lock = threading.Lock()
+
+def job_options(bypass_cache, timeout):
+    """Keyword arguments for `fetch_job` from the options stored with a job"""
+    options = {'bypass_cache': True} if bypass_cache else {}
+    if timeout is not None:
+        options['timeout'] = timeout
+    return options
+
+def feed_pending_jobs(free_slots=None):
+    """Submit pending jobs that are not queued yet (e.g. the rest of a bulk import) until the queue is full"""
+    with feed_lock:
+        stats = scheduler.stats()
+        free_slots = scheduler.free_slots() if free_slots is None else free_slots
+        if free_slots <= 0:
+            return
+        with app.app_context():
+            # Queued jobs are pending as well, skip over them. Started jobs can
+            # still be pending in the database until their progress is written.
+            rows = db.session.query(Job.id, Job.bypass_cache, Job.timeout).filter(Job.status == 'pending', Job.id.notin_(job_store.job_ids())) \
+                .order_by(Job.created_at.asc()) \
+                .limit(free_slots + stats['queued'] + stats['workers']).all()
+        for job_id, bypass_cache, timeout in rows:
+            if scheduler.position(job_id) is not None:
+                continue
+            try:
+                scheduler.submit(job_id, **job_options(bypass_cache, timeout))
+            except (QueueFullError, SchedulerStoppedError):
+                return
+
+# Scraping jobs pass three stages, each with its own bounded queue and workers
+scheduler = JobPipeline(
+    [
+        ('fetch', fetch_job, app.config['FETCH_WORKERS']),
+        ('extract', extract_job, app.config['EXTRACT_WORKERS']),
+        ('upload', upload_job, app.config['UPLOAD_WORKERS']),
+    ],
+    max_queue_size=app.config['JOB_QUEUE_SIZE'],
+    refill=feed_pending_jobs
+)
+
+def recover_jobs(all_processing=False, message='Requeued after restart'):
+    """
+    Requeue processing jobs whose worker stopped sending heartbeats and feed
+    pending jobs into the queue. Abandoned jobs that were cancelled meanwhile
+    are marked cancelled instead.
+
+    Args:
+        all_processing (bool): Requeue every processing job not running in this
+            process, for single process setups where no other worker can be alive.
+        message (str): Status message of the requeued jobs.
+    """
+    stale_before = datetime.now() - timedelta(seconds=app.config['JOB_STALE_TIMEOUT'])
+    with app.app_context():
+        query = Job.query.filter(Job.status == 'processing', Job.id.notin_(job_store.job_ids()))
+        if not all_processing:
+            query = query.filter(or_(Job.heartbeat_at.is_(None), Job.heartbeat_at < stale_before))
+        query.filter(Job.cancel_requested.is_(True)).update(
+            {'status': 'cancelled', 'message': 'Cancelled', 'completed_at': datetime.now(), 'claimed_by': None},
+            synchronize_session=False
+        )
+        recovered = query.update(
+            {'status': 'pending', 'progress': 0, 'message': message, 'claimed_by': None},
+            synchronize_session=False
+        )
+        db.session.commit()
+
+    # Jobs that don't fit into the queue are fed in as workers become free
+    feed_pending_jobs()
+    if recovered:
+        logger.info(f"Recovered {recovered} unfinished jobs")
+
+maintenance_stop = threading.Event()
+
+def maintenance_loop():
+    """
+    Periodically picks up jobs abandoned by other processes and jobs queued by
+    them, and stops the jobs cancelled through other processes
+    """
+    while not maintenance_stop.wait(app.config['JOB_STALE_TIMEOUT'] / 2):
+        try:
+            apply_cancel_requests()
+            recover_jobs(message='Requeued after its worker stopped')
+        except Exception as e:
+            logger.error(f"Job maintenance failed: {e}", exc_info=True)
+
+def apply_retention():
+    """
+    Runs the retention policies unless another process is already doing so.
+
+    Returns:
+        dict or None: The summary of the run, None if it was skipped.
+    """
+    archive_dir = None
+    if app.config['JOB_ARCHIVE']:
+        archive_dir = app.config['JOB_ARCHIVE_DIR'] or os.path.join(app.instance_path, 'archive')
+    with app.app_context(), database_lock(RETENTION_LOCK_KEY, 'retention', blocking=False) as acquired:
+        if not acquired:
+            return None
+        return run_retention(app.config, archive_dir=archive_dir)
+
+def retention_loop():
+    while not maintenance_stop.wait(app.config['RETENTION_INTERVAL']):
+        try:
+            apply_retention()
+        except Exception as e:
+            logger.error(f"Retention run failed: {e}", exc_info=True)
+
+@app.cli.command('cleanup')
+def cleanup_command():
+    """Apply the job retention policies and remove unused files."""
+    summary = apply_retention()
+    if summary is None:
+        print("Another process is applying the retention policies right now")
+        return
+    print(
+        f"Purged {summary['purged_jobs']} jobs, compacted {summary['compacted_results']} results, "
+        f"removed {summary['removed_files']} files"
+    )
+
+def shutdown_scheduler():
+    maintenance_stop.set()
+    scheduler.shutdown(drain=False, timeout=app.config['JOB_DRAIN_TIMEOUT'])
+    # Write the last progress updates of the jobs that were running
+    job_store.stop()
+
+def serves_requests():
+    """False for `flask db ...` and other CLI commands, which load the app without serving it"""
+    if __name__ == '__main__':
+        # The reloader parent of `python app.py` only watches files, the child serves requests
+        return os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+    if os.path.basename(sys.argv[0]) == 'flask' or sys.argv[0].endswith(os.path.join('flask', '__main__.py')):
+        return 'run' in sys.argv[1:]
+    return True
+
+if serves_requests():
+    job_store.flush_interval = app.config['JOB_STATE_FLUSH_INTERVAL']
+    job_store.heartbeat_interval = app.config['JOB_HEARTBEAT_INTERVAL']
+    job_store.start()
+    scheduler.start()
+    # `python app.py` is always a single process, so every processing job was abandoned
+    recover_jobs(all_processing=__name__ == '__main__')
+    threading.Thread(target=maintenance_loop, name='job-maintenance', daemon=True).start()
+    if app.config['RETENTION_INTERVAL'] > 0:
+        threading.Thread(target=retention_loop, name='job-retention', daemon=True).start()
+    if os.getenv('BROWSER') == 'docker':
+        # Stock thumbnails are downloaded before the first job needs one
+        get_stock_thumbnail_cache().prefetch()
+    atexit.register(shutdown_scheduler)
 
 @app.route('/')
 def index():
@@ -33,6 +290,7 @@ def submit_job():
     url = request.form.get('url')
     platform = request.form.get('platform')
     target = request.form.get('target')
+    bypass_cache = request.form.get('bypass_cache') == 'on'
     
     if not url:
         flash('Please enter a URL', 'error')
@@ -46,60 +304,354 @@ def submit_job():
         platform=platform,
         target=target,
         status='pending',
+        bypass_cache=bypass_cache,
         created_at=datetime.now()
     )
     
     db.session.add(job)
     db.session.commit()
     
-    # Start the job in a background thread
-    threading.Thread(
-        target=process_scraping_job,
-        args=(job_id,),
-        daemon=True
-    ).start()
+    # Hand the job to the worker pool, reject it if the queue is full
+    try:
+        scheduler.submit(job_id, bypass_cache=bypass_cache)
+    except (QueueFullError, SchedulerStoppedError) as e:
+        db.session.delete(job)
+        db.session.commit()
+        logger.warning(f"Rejected job for {url}: {e}")
+        flash('Too many jobs in the queue, please try again later', 'error')
+        response = app.make_response((render_template('index.html'), 429))
+        response.headers['Retry-After'] = '30'
+        return response
     
     return redirect(url_for('view_job', job_id=job_id))
 
+@app.route('/api/jobs/batch', methods=['POST'])
+def submit_batch():
+    """
+    Bulk import. Expects JSON like
+    {"urls": ["https://...", {"url": "https://...", "platform": "tiktok"}], "target": "tandoor",
+     "platform": "instagram", "bypass_cache": false, "timeout": 600}
+    The platform is detected from the URL if not given. Jobs that don't fit into
+    the queue wait in the database and are queued as workers become free. The
+    timeout (seconds per job) replaces JOB_TIMEOUT for the jobs of the batch.
+    """
+    data = request.get_json(silent=True) or {}
+    entries = data.get('urls')
+    target = data.get('target')
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'error': 'Expected a non-empty list of URLs in "urls"'}), 400
+    if target not in ('tandoor', 'mealie'):
+        return jsonify({'error': 'Expected "target" to be "tandoor" or "mealie"'}), 400
+    if len(entries) > app.config['BATCH_MAX_SIZE']:
+        return jsonify({'error': f"At most {app.config['BATCH_MAX_SIZE']} URLs per batch"}), 413
+    timeout = data.get('timeout')
+    if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0):
+        return jsonify({'error': 'Expected "timeout" to be a positive number of seconds'}), 400
+
+    entries = [(entry.get('url'), entry.get('platform')) if isinstance(entry, dict) else entry for entry in entries]
+    valid, duplicates, invalid = prepare_batch(entries, data.get('platform'))
+
+    # Create all jobs in one transaction, the options are stored with them
+    # so whichever process has a free worker can queue them
+    batch_id = str(uuid.uuid4())
+    now = datetime.now()
+    jobs = [
+        Job(
+            id=str(uuid.uuid4()), url=url, platform=platform, target=target, status='pending', created_at=now,
+            batch_id=batch_id, bypass_cache=bool(data.get('bypass_cache')), timeout=timeout
+        )
+        for url, platform in valid
+    ]
+    db.session.add_all(jobs)
+    db.session.commit()
+
+    feed_pending_jobs()
+    logger.info(f"Created batch {batch_id} with {len(jobs)} jobs ({len(duplicates)} duplicates, {len(invalid)} invalid)")
+
+    return jsonify({
+        # Batches are looked up through their jobs, without jobs there is nothing to look up
+        'batch_id': batch_id if jobs else None,
+        'jobs': [{
+            'id': job.id,
+            'url': job.url,
+            'platform': job.platform,
+            'queue_position': scheduler.position(job.id)
+        } for job in jobs],
+        'duplicates': duplicates,
+        'invalid': invalid
+    }), 202
+
+@app.route('/api/jobs/batch/<batch_id>')
+def get_batch_status(batch_id):
+    jobs = Job.query.filter_by(batch_id=batch_id).order_by(Job.created_at.asc(), Job.id.asc()).all()
+    if not jobs:
+        return jsonify({'error': 'Unknown batch'}), 404
+    # Running jobs may not be written to the database yet
+    statuses = {job.id: (get_job_state(job.id) or {}).get('status', job.status) for job in jobs}
+    counts = {}
+    for status in statuses.values():
+        counts[status] = counts.get(status, 0) + 1
+    finished = sum(counts.get(status, 0) for status in FINISHED_STATUSES)
+    return jsonify({
+        'batch_id': batch_id,
+        'total': len(jobs),
+        'finished': finished,
+        'progress': round(finished / len(jobs) * 100),
+        'counts': counts,
+        'jobs': [{'id': job.id, 'url': job.url, 'status': statuses[job.id], 'message': job.message} for job in jobs]
+    })
+
 @app.route('/job/<job_id>')
 def view_job(job_id):
     job = Job.query.get_or_404(job_id)
-    return render_template('job.html', job=job)
+    return render_template('job.html', job=job, queue_position=scheduler.position(job_id))
+
+@app.route('/api/job/<job_id>/cancel', methods=['POST'])
+def cancel_job_route(job_id):
+    """
+    Cancels a pending or running job. Running jobs stop at their next check
+    point, the job page and event streams show when they are cancelled.
+    """
+    Job.query.get_or_404(job_id)
+    result = cancel_job(job_id)
+    if result is None:
+        return jsonify({'error': 'Job is already finished'}), 409
+    return jsonify({'id': job_id, 'status': result}), 202 if result == 'cancelling' else 200
 
 @app.route('/api/job/<job_id>/delete', methods=['POST'])
 def delete_job(job_id):
     job = Job.query.get_or_404(job_id)
+    # Don't leave a worker running for a job that no longer exists
+    cancel_job(job_id)
     db.session.delete(job)
     db.session.commit()
     return redirect(url_for('history'))
 
+@app.route('/api/job/<job_id>/spans')
+def get_job_spans(job_id):
+    """Returns the timed operations of a job, recorded so far if it's still running"""
+    trace = get_trace(job_id)
+    if trace:
+        return jsonify({'finished': False, 'spans': trace.spans()})
+    job = Job.query.get_or_404(job_id)
+    return jsonify({'finished': True, 'spans': json.loads(job.spans) if job.spans else []})
+
 @app.route('/api/job/<job_id>')
 def get_job_status(job_id):
-    job = Job.query.get_or_404(job_id)
+    # Running jobs are answered from memory, without touching the database
+    state = get_job_state(job_id) or Job.query.get_or_404(job_id)
+    event = job_event(state)
+    return jsonify({
+        'status': event['status'],
+        'progress': event['progress'],
+        'message': event['message'],
+        'queue_position': scheduler.position(job_id),
+        'result_url': event['result_url']
+    })
+
+def job_event_stream(subscription, event):
+    """Streams the status of one job until it is finished, including queue position changes"""
+    with subscription:
+        position = scheduler.position(event['id'])
+        yield format_sse({**event, 'queue_position': position})
+        idle = 0
+        while event['status'] not in FINISHED_STATUSES:
+            update = subscription.get(timeout=EVENT_POSITION_INTERVAL)
+            new_position = scheduler.position(event['id'])
+            if not update and new_position is None and get_job_state(event['id']) is None:
+                # Jobs run by another process only publish their changes to the database
+                with app.app_context():
+                    job = Job.query.get(event['id'])
+                    if not job:
+                        return
+                    remote_event = job_event(job)
+                if remote_event != event:
+                    update = remote_event
+            if update:
+                event = update
+            if update or new_position != position:
+                position = new_position
+                idle = 0
+                yield format_sse({**event, 'queue_position': position})
+            else:
+                idle += EVENT_POSITION_INTERVAL
+                if idle >= EVENT_KEEPALIVE_INTERVAL:
+                    idle = 0
+                    yield ": keep-alive\n\n"
+
+def remote_job_events(since):
+    """
+    Returns the status of the jobs that are not run by this process and were
+    unfinished or finished after `since`. Other processes only publish their
+    changes to the database.
+    """
+    with app.app_context():
+        rows = db.session.query(Job.id, Job.status, Job.progress, Job.message, Job.result_url) \
+            .filter(or_(Job.status.in_(('pending', 'processing')), Job.completed_at >= since)) \
+            .filter(Job.id.notin_(job_store.job_ids())).all()
+    return {row.id: job_event(row._asdict()) for row in rows}
+
+def all_jobs_event_stream(subscription):
+    """Streams status changes of all jobs, those of other processes read from the database"""
+    with subscription:
+        # Send the headers right away, so the client knows the stream is open
+        yield ": connected\n\n"
+        polled_at = datetime.now()
+        known = remote_job_events(polled_at)
+        sent_at = polled_at
+        while True:
+            next_poll = polled_at + timedelta(seconds=EVENT_POLL_INTERVAL)
+            event = subscription.get(timeout=max(0, (next_poll - datetime.now()).total_seconds()))
+            if event:
+                sent_at = datetime.now()
+                yield format_sse(event)
+            if datetime.now() < next_poll:
+                continue
+            # Overlap the polls, so a job finishing while one runs isn't missed
+            since, polled_at = polled_at - timedelta(seconds=EVENT_POLL_INTERVAL), datetime.now()
+            current = remote_job_events(since)
+            for job_id, remote_event in current.items():
+                if known.get(job_id) != remote_event:
+                    sent_at = polled_at
+                    yield format_sse(remote_event)
+            known = current
+            if polled_at - sent_at >= timedelta(seconds=EVENT_KEEPALIVE_INTERVAL):
+                sent_at = polled_at
+                yield ": keep-alive\n\n"
+
+def event_stream_response(stream):
+    return Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/job/<job_id>/events')
+def job_events(job_id):
+    # Subscribe before reading the job, so no change gets lost in between
+    subscription = event_bus.subscribe(job_id)
+    state = get_job_state(job_id)
+    if not state:
+        state = Job.query.get(job_id)
+        if not state:
+            subscription.close()
+            abort(404)
+    return event_stream_response(job_event_stream(subscription, job_event(state)))
+
+@app.route('/api/jobs/events')
+def all_job_events():
+    return event_stream_response(all_jobs_event_stream(event_bus.subscribe()))
+
+@app.route('/api/queue')
+def queue_status():
+    return jsonify(scheduler.stats())
+
+@app.route('/api/stats')
+def stats():
+    pool = get_browser_pool()
+    response_cache = get_response_cache()
     return jsonify({
-        'status': job.status,
-        'progress': job.progress,
-        'message': job.message,
-        'result_url': job.result_url if job.status == 'completed' else None
+        'queue': scheduler.stats(),
+        'browser_pool': pool.stats() if pool else None,
+        'ai_sessions': get_session_pool().stats(),
+        'ai_response_cache': response_cache.stats() if response_cache else None,
+        'captions': get_caption_stats(),
+        'stock_thumbnails': get_stock_thumbnail_stats(),
+        'recipe_apis': get_api_client_stats(),
+        'events': event_bus.stats(),
+        'job_states': job_store.stats(),
+        'retention': get_retention_stats()
     })
 
+def collect_metrics():
+    """Copies the current stats into the gauges and counters exported by /metrics"""
+    for name, stage in scheduler.stats()['stages'].items():
+        QUEUE_DEPTH.set(stage['queued'], stage=name)
+        STAGE_RUNNING.set(stage['running'], stage=name)
+
+    pool = get_browser_pool()
+    BROWSER_POOL.clear()
+    if pool:
+        pool_stats = pool.stats()
+        BROWSER_POOL.set(pool_stats['idle'], state='idle')
+        BROWSER_POOL.set(pool_stats['in_use'], state='in_use')
+    session_stats = get_session_pool().stats()
+    AI_SESSIONS.set(session_stats['idle'], state='idle')
+    AI_SESSIONS.set(session_stats['in_use'], state='in_use')
+
+    caches = {}
+    response_cache = get_response_cache()
+    if response_cache:
+        cache_stats = response_cache.stats()
+        caches['ai_response'] = (cache_stats['memory_hits'] + cache_stats['disk_hits'], cache_stats['misses'])
+    caption_stats = get_caption_stats()
+    caches['caption_http'] = (caption_stats['http_hits'], caption_stats['http_misses'])
+    caches['caption_browser'] = (caption_stats['browser_hits'], caption_stats['browser_misses'])
+    stock_stats = get_stock_thumbnail_stats()
+    if stock_stats:
+        caches['stock_thumbnails'] = (stock_stats['hits'], stock_stats['misses'])
+    for name, (hits, misses) in caches.items():
+        CACHE_LOOKUPS.set(hits, cache=name, result='hit')
+        CACHE_LOOKUPS.set(misses, cache=name, result='miss')
+        CACHE_HIT_RATIO.set(hits / (hits + misses) if hits + misses else None, cache=name)
+
+    job_stats = job_store.stats()
+    JOBS_IN_MEMORY.set(job_stats['jobs'], state='total')
+    JOBS_IN_MEMORY.set(job_stats['unflushed'], state='unflushed')
+    EVENT_SUBSCRIBERS.set(event_bus.stats()['subscribers'])
+
+metrics_registry.add_collector(collect_metrics)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics of this process"""
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+def job_page():
+    """Returns the page of jobs selected by the cursor, limit, status and platform query parameters"""
+    limit = min(int(request.args.get('limit', app.config['HISTORY_PAGE_SIZE'])), app.config['HISTORY_MAX_PAGE_SIZE'])
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return paginate_jobs(
+        limit,
+        cursor=request.args.get('cursor') or None,
+        status=request.args.get('status') or None,
+        platform=request.args.get('platform') or None
+    )
+
 @app.route('/history')
 def history():
-    jobs = Job.query.order_by(Job.created_at.desc()).all()
-    return render_template('history.html', jobs=jobs)
+    try:
+        jobs, next_cursor = job_page()
+    except ValueError:
+        abort(400)
+    return render_template(
+        'history.html',
+        jobs=jobs,
+        next_cursor=next_cursor,
+        status=request.args.get('status', ''),
+        platform=request.args.get('platform', '')
+    )
 
 @app.route('/api/jobs')
 def api_jobs():
-    jobs = Job.query.order_by(Job.created_at.desc()).all()
-    return jsonify([{
+    try:
+        jobs, next_cursor = job_page()
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor or limit'}), 400
+    response = jsonify([{
         'id': job.id,
         'url': job.url,
         'platform': job.platform,
         'target': job.target,
-        'status': job.status,
+        'status': (get_job_state(job.id) or {}).get('status', job.status),
         'created_at': job.created_at.isoformat(),
         'completed_at': job.completed_at.isoformat() if job.completed_at else None
     } for job in jobs])
+    # The list stays the body, the next page is announced in the headers
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for("api_jobs", **{**request.args, "cursor": next_cursor})}>; rel="next"'
+    return response
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=3000, debug=True)
\ No newline at end of file
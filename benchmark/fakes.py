@@ -0,0 +1,316 @@
+import html
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from string import Template
+from urllib.parse import urlsplit
+
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+POST_HOSTS = ("instagram.com", "www.instagram.com", "tiktok.com", "www.tiktok.com")
+
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return Template(f.read())
+
+def _sample_image(size=(1080, 1920), image_format="JPEG"):
+    image = Image.new("RGB", size, (200, 120, 60))
+    output = BytesIO()
+    image.save(output, format=image_format, quality=90)
+    return output.getvalue()
+
+
+class FakeServer:
+    """
+    HTTP server on a free local port, served by a daemon thread. Subclasses
+    implement `handle(method, path, body)` returning (status, content type, body).
+    Every request waits `latency` seconds (plus up to `jitter`) before the answer.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self._lock = threading.Lock()
+        self.counts = {}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                server.sleep()
+                status, content_type, payload = server.handle(self.command, self.path, body)
+                if isinstance(payload, str):
+                    payload = payload.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = do_PATCH = _serve
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    def sleep(self):
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            counts, self.counts = self.counts, {}
+        return counts
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def handle(self, method, path, body):
+        raise NotImplementedError
+
+
+class FixtureServer(FakeServer):
+    """
+    Serves the fixture post pages. A post at instagram.com/p/<code> is served
+    at <url>/instagram.com/p/<code>, together with its preview image.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0):
+        super().__init__(latency, jitter)
+        self.image = _sample_image()
+        self.instagram = _fixture("instagram_post.html")
+        self.tiktok = _fixture("tiktok_post.html")
+        self.caption = _fixture("caption.txt")
+
+    def caption_for(self, path):
+        index = re.sub(r"\D", "", path.rstrip("/").rsplit("/", 1)[-1]) or "0"
+        return self.caption.substitute(title="Garlic chili spaghetti", index=index)
+
+    def handle(self, method, path, body):
+        if path.startswith("/image.jpg"):
+            self.count("image")
+            return 200, "image/jpeg", self.image
+
+        self.count("post")
+        caption = self.caption_for(path)
+        image_url = f"{self.url}/image.jpg"
+        if "tiktok.com" in path:
+            rehydration = {"__DEFAULT_SCOPE__": {"webapp.video-detail": {"itemInfo": {"itemStruct": {"desc": caption}}}}}
+            page = self.tiktok.substitute(
+                image_url=image_url,
+                rehydration_json=json.dumps(rehydration).replace("</", "<\\/")
+            )
+        else:
+            # The caption is read from between the quotes of the meta description
+            page = self.instagram.substitute(image_url=image_url, caption=html.escape(caption.replace('"', "'")))
+        return 200, "text/html; charset=utf-8", page
+
+
+class FixtureAdapter(HTTPAdapter):
+    """
+    Transport adapter sending requests for instagram.com and tiktok.com to
+    the fixture server instead, mount it on the session of the caption fast path.
+    """
+
+    def __init__(self, fixture_url, **kwargs):
+        self.fixture_url = fixture_url
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request.url = f"{self.fixture_url}/{parts.netloc}{parts.path}"
+        return super().send(request, **kwargs)
+
+def install_fixture_adapter(session, fixture_url):
+    adapter = FixtureAdapter(fixture_url, pool_maxsize=32)
+    for host in POST_HOSTS:
+        session.mount(f"https://{host}/", adapter)
+        session.mount(f"http://{host}/", adapter)
+
+
+class FakeElement:
+    def __init__(self, browser):
+        self.browser = browser
+
+    @property
+    def screenshot_as_png(self):
+        return self.browser.screenshot
+
+    def click(self):
+        pass
+
+
+class FakeBrowser:
+    """
+    Stand-in for a Selenium WebDriver that loads the fixture pages over HTTP.
+    Every element lookup succeeds, screenshots of the video are a sample PNG.
+    """
+
+    def __init__(self, fixture_url, screenshot=None):
+        self.fixture_url = fixture_url
+        self.screenshot = screenshot or _sample_image((540, 960), "PNG")
+        self.current_url = "about:blank"
+        self.page_source = ""
+
+    def get(self, url):
+        self.current_url = url
+        parts = urlsplit(url)
+        if parts.netloc in POST_HOSTS:
+            response = requests.get(f"{self.fixture_url}/{parts.netloc}{parts.path}", timeout=10)
+            self.page_source = response.text
+        else:
+            self.page_source = "<html><body></body></html>"
+
+    def find_element(self, by=None, value=None):
+        return FakeElement(self)
+
+    def find_elements(self, by=None, value=None):
+        return [FakeElement(self)]
+
+    def execute_script(self, script, *args):
+        return None
+
+    def delete_all_cookies(self):
+        pass
+
+    def quit(self):
+        pass
+
+
+STEP_PATTERN = re.compile(r"for step (\d+) of the recipe")
+
+def _ingredient(name, amount, unit):
+    return {
+        "food": {"name": name, "plural_name": name},
+        "unit": {"name": unit, "plural_name": unit, "description": "", "base_unit": "", "open_data_slug": ""},
+        "amount": amount,
+        "note": "",
+        "order": 0,
+        "is_header": False,
+        "no_amount": False
+    }
+
+def _step(number):
+    ingredients = [
+        [_ingredient("spaghetti", "200", "g")],
+        [_ingredient("garlic", "2", "clove"), _ingredient("olive oil", "3", "tbsp"), _ingredient("chili flakes", "1", "pinch")],
+        [_ingredient("parmesan", "30", "g"), _ingredient("parsley", "1", "handful")],
+    ]
+    return {
+        "name": f"{number}.",
+        "instruction": f"Instruction of step {number}.",
+        "ingredients": ingredients[(number - 1) % len(ingredients)],
+        "time": 5,
+        "order": number,
+        "show_as_header": False,
+        "show_ingredients_table": True
+    }
+
+def fake_completion(prompt):
+    """
+    Returns (kind, answer) for a prompt of the AI modules, shaped like a
+    reasonable model answer so the providers run their normal code paths.
+    """
+    name = {"name": "Garlic chili spaghetti", "description": "Quick pasta.", "keywords": [{"name": "pasta", "description": ""}]}
+    if "How many steps" in prompt:
+        return "step_count", "3"
+    match = STEP_PATTERN.search(prompt)
+    if match:
+        return "step", _step(int(match.group(1)))
+    if "complete recipe in one JSON document" in prompt:
+        return "recipe", {**name, "steps": [_step(i) for i in (1, 2, 3)], "servings": 2, "working_time": 15, "waiting_time": 10}
+
+    template = prompt.rsplit("JSON template:", 1)[-1]
+    if "'keywords'" in template:
+        return "name", name
+    if "'servings'" in template:
+        return "servings", {"servings": 2}
+    if "'working_time'" in template:
+        return "timing", {"working_time": 15, "waiting_time": 10, "internal": True, "show_ingredient_overview": True}
+    if "'recipeInstructions'" in template:
+        return "instructions", {"recipeInstructions": "Cook the pasta. Fry the garlic. Toss everything together."}
+    if "'recipeIngredient'" in template:
+        return "ingredients", {"recipeIngredient": ["200 g spaghetti", "2 cloves garlic", "3 tbsp olive oil", "30 g parmesan"]}
+    if "'nutrition'" in template:
+        return "nutrition", {"nutrition": {"@type": "NutritionInformation", "calories": "650 kcal", "fatContent": "25 g"}}
+    if "'@type': 'Recipe'" in template:
+        return "info", {"author": "benchkitchen", "description": "Quick pasta.", "recipeYield": "2", "prepTime": "PT10M", "cookTime": "PT15M"}
+    if "'name'" in template:
+        return "name", {"name": "Garlic chili spaghetti"}
+    return "other", {}
+
+
+class FakeOpenAIServer(FakeServer):
+    """
+    OpenAI compatible chat completions endpoint answering with `fake_completion`.
+    Point the openai module at it with OPENAI_BASE_URL=<url>/v1.
+    """
+
+    def handle(self, method, path, body):
+        if not path.endswith("/chat/completions"):
+            return 404, "application/json", json.dumps({"error": {"message": "Not found"}})
+        request = json.loads(body)
+        kind, answer = fake_completion(request["messages"][-1]["content"])
+        self.count("calls")
+        self.count(kind)
+        content = answer if isinstance(answer, str) else f"```json\n{json.dumps(answer)}\n```"
+        return 200, "application/json", json.dumps({
+            "id": "chatcmpl-benchmark",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "benchmark"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": len(request["messages"][-1]["content"]) // 4, "completion_tokens": len(content) // 4, "total_tokens": 0}
+        })
+
+
+class FakeRecipeAPIServer(FakeServer):
+    """Accepts recipes and images like the Tandoor and Mealie APIs, use it as BASE_URL_TANDOOR / BASE_URL_MEALIE"""
+
+    def __init__(self, latency=0.0, jitter=0.0):
+        super().__init__(latency, jitter)
+        self._next_id = 0
+
+    def _new_id(self):
+        with self._lock:
+            self._next_id += 1
+            return self._next_id
+
+    def handle(self, method, path, body):
+        if method == "POST" and path == "/api/recipe/":
+            self.count("tandoor_recipes")
+            return 201, "application/json", json.dumps({"id": self._new_id()})
+        if method == "POST" and path == "/api/recipes/create/html-or-json":
+            self.count("mealie_recipes")
+            return 201, "application/json", json.dumps(f"benchmark-recipe-{self._new_id()}")
+        if method == "PUT" and "/image" in path:
+            self.count("images")
+            return 200, "application/json", "{}"
+        return 404, "application/json", json.dumps({"detail": "Not found"})
@@ -0,0 +1,356 @@
+"""
+Offline end-to-end benchmark of the import pipeline.
+
+Runs `ScraperService.scrape_recipe` (mode `direct`) and the Flask job flow
+(mode `jobs`) against local stand-ins: fixture post pages, a fake OpenAI
+compatible chat server and a fake Tandoor/Mealie API. Every worker count is
+measured in its own process, so peak RSS and the pipeline setup are not
+shared between runs.
+
+Usage:
+    python -m benchmark.run --jobs 20 --workers 1,2,4 --llm-latency 0.2
+    python -m benchmark.run --output results.json
+    python -m benchmark.run --baseline results.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from benchmark.fakes import FakeBrowser, FakeOpenAIServer, FakeRecipeAPIServer, FixtureServer, install_fixture_adapter
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ("fetch", "extract", "upload")
+
+
+def percentiles(values):
+    """
+    Returns:
+        dict: p50, p90, p99 and max of `values` (nearest rank), None if empty.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    def rank(p):
+        return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))]
+    return {"p50": rank(50), "p90": rank(90), "p99": rank(99), "max": values[-1], "count": len(values)}
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def post_urls(count, platform, run_id):
+    if platform == "tiktok":
+        return [f"https://www.tiktok.com/@benchkitchen/video/{run_id}{i:05d}" for i in range(count)]
+    return [f"https://www.instagram.com/p/BENCH{run_id}{i:05d}/" for i in range(count)]
+
+
+class StageTimer:
+    """Records the duration of the provider stages by wrapping them"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {stage: [] for stage in STAGES}
+
+    def wrap(self, provider):
+        for stage in STAGES:
+            setattr(provider, stage, staticmethod(self._timed(stage, getattr(provider, stage))))
+
+    def _timed(self, stage, func):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.durations[stage].append(time.perf_counter() - started)
+        return timed
+
+
+def run_direct(urls, platform, workers):
+    """Calls `ScraperService.scrape_recipe` for every URL with `workers` threads"""
+    from scrapers.scraper_service import ScraperService
+
+    def scrape(url):
+        started = time.perf_counter()
+        try:
+            result = ScraperService.scrape_recipe(url, platform)
+            ok = isinstance(result, dict) and (result.get("status") == "success" or result.get("result", {}).get("status") == "success")
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(scrape, urls))
+    return [ok for ok, _ in results], [duration for _, duration in results]
+
+def run_jobs(urls, platform, target, timeout):
+    """Submits the URLs as a bulk import to the Flask app and waits for the jobs"""
+    import app as app_module
+    from job_store import FINISHED_STATUSES
+    from models import Job
+
+    app = app_module.app
+    client = app.test_client()
+    response = client.post("/api/jobs/batch", json={"urls": urls, "platform": platform, "target": target})
+    if response.status_code != 202:
+        raise RuntimeError(f"Bulk import failed with {response.status_code}: {response.get_data(as_text=True)}")
+    job_ids = [job["id"] for job in response.get_json()["jobs"]]
+
+    deadline = time.monotonic() + timeout
+    with app.app_context():
+        while True:
+            jobs = Job.query.filter(Job.id.in_(job_ids)).all()
+            if all(job.status in FINISHED_STATUSES for job in jobs) or time.monotonic() > deadline:
+                break
+            app_module.db.session.remove()
+            time.sleep(0.2)
+        oks = [job.status == "completed" for job in jobs]
+        durations = [
+            (job.completed_at - job.created_at).total_seconds() if job.completed_at else None
+            for job in jobs
+        ]
+    app_module.shutdown_scheduler()
+    return oks, [duration for duration in durations if duration is not None]
+
+def child(config):
+    """Runs one measurement inside this process and writes the results to `config["output"]`"""
+    os.chdir(config["workdir"])
+    os.makedirs("scrapers", exist_ok=True)
+
+    from scrapers.scraper_service import ScraperService
+    from scrapers.social_scraper import get_http_session
+    install_fixture_adapter(get_http_session(), config["fixture_url"])
+    if config["browser"] == "stub":
+        import scrapers.manage_browser as manage_browser
+        manage_browser.create_browser = lambda: FakeBrowser(config["fixture_url"])
+
+    timer = StageTimer()
+    timer.wrap(ScraperService.get_provider())
+    if config["mode"] == "jobs":
+        # Starts the job workers, not part of the measurement
+        import app  # noqa: F401
+
+    urls = post_urls(config["jobs"], config["platform"], config["run_id"])
+    started = time.perf_counter()
+    if config["mode"] == "jobs":
+        oks, totals = run_jobs(urls, config["platform"], config["provider"], config["timeout"])
+    else:
+        oks, totals = run_direct(urls, config["platform"], config["workers"])
+    wall = time.perf_counter() - started
+
+    result = {
+        "mode": config["mode"],
+        "workers": config["workers"],
+        "jobs": len(urls),
+        "completed": sum(oks),
+        "wall_seconds": round(wall, 3),
+        "jobs_per_minute": round(sum(oks) / wall * 60, 2) if wall else None,
+        "latency": {stage: percentiles(durations) for stage, durations in timer.durations.items()},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    result["latency"]["total"] = percentiles(totals)
+    with open(config["output"], "w") as f:
+        json.dump(result, f)
+
+def child_env(args, workers, workdir, servers):
+    fixture, llm, api = servers
+    env = dict(os.environ)
+    env.update({
+        "AI_MODULE": "openai",
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"{llm.url}/v1",
+        "RECIPE_PROVIDER": args.provider,
+        "BASE_URL_TANDOOR": api.url,
+        "TOKEN_TANDOOR": "benchmark",
+        "BASE_URL_MEALIE": api.url,
+        "TOKEN_MEALIE": "benchmark",
+        "TANDOOR_EXTRACTION_MODE": args.extraction_mode,
+        "CAPTION_FAST_PATH": "true" if args.browser == "http" else "false",
+        "BROWSER": "firefox",
+        # Every job has to do the full work
+        "CONTENT_CACHE": "false",
+        "AI_RESPONSE_CACHE": "false",
+        "THUMBNAIL_CACHE": "false",
+        "AI_REQUESTS_PER_MINUTE": "0",
+        # The fixture caption is well structured, the parser would skip the AI
+        "CAPTION_PARSER": "true" if args.caption_parser else "false",
+        "WORKER_COUNT": str(workers),
+        "FETCH_WORKERS": str(workers),
+        "EXTRACT_WORKERS": str(workers),
+        "UPLOAD_WORKERS": str(workers),
+        "AI_SESSION_POOL_SIZE": str(workers),
+        "BROWSER_POOL_SIZE": str(workers),
+        "JOB_QUEUE_SIZE": str(max(20, args.jobs)),
+        "BATCH_MAX_SIZE": str(max(500, args.jobs)),
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'app.db')}",
+        "RETENTION_INTERVAL": "0",
+        "LOG_LEVEL": "DEBUG" if args.verbose else "WARNING",
+        "PYTHONPATH": os.pathsep.join(filter(None, [ROOT_DIR, os.environ.get("PYTHONPATH")])),
+    })
+    return env
+
+def measure(args, mode, workers, servers):
+    fixture, llm, api = servers
+    for server in servers:
+        server.reset()
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as workdir:
+        config = {
+            "mode": mode,
+            "workers": workers,
+            "jobs": args.jobs,
+            "platform": args.platform,
+            "browser": args.browser,
+            "provider": args.provider,
+            "timeout": args.timeout,
+            "fixture_url": fixture.url,
+            "run_id": f"{int(time.time()) % 100000}{workers}",
+            "workdir": workdir,
+            "output": os.path.join(workdir, "result.json"),
+        }
+        process = subprocess.run(
+            [sys.executable, "-m", "benchmark.run", "--child", json.dumps(config)],
+            cwd=ROOT_DIR,
+            env=child_env(args, workers, workdir, servers),
+            stdout=None if args.verbose else subprocess.DEVNULL,
+            stderr=None if args.verbose else subprocess.PIPE,
+            text=True,
+            timeout=args.timeout + 60
+        )
+        if process.returncode != 0 or not os.path.exists(config["output"]):
+            raise RuntimeError(f"{mode} run with {workers} workers failed:\n{process.stderr or ''}")
+        with open(config["output"]) as f:
+            result = json.load(f)
+
+    llm_calls = llm.reset()
+    result["llm_calls"] = llm_calls.pop("calls", 0)
+    result["llm_calls_per_job"] = round(result["llm_calls"] / result["jobs"], 2) if result["jobs"] else None
+    result["llm_calls_by_kind"] = llm_calls
+    result["api_calls"] = api.reset()
+    return result
+
+def format_latency(stats):
+    if not stats:
+        return "-"
+    return f"{stats['p50']:.2f}/{stats['p90']:.2f}/{stats['p99']:.2f}"
+
+def print_report(results):
+    columns = ["mode", "workers", "ok", "wall s", "jobs/min"] + [f"{stage} p50/90/99 s" for stage in STAGES + ("total",)] + ["RSS MB", "LLM/job"]
+    rows = [[
+        result["mode"],
+        str(result["workers"]),
+        f"{result['completed']}/{result['jobs']}",
+        f"{result['wall_seconds']:.1f}",
+        f"{result['jobs_per_minute']:.1f}",
+        *[format_latency(result["latency"][stage]) for stage in STAGES + ("total",)],
+        str(result["peak_rss_mb"]),
+        str(result["llm_calls_per_job"]),
+    ] for result in results]
+    widths = [max(len(row[i]) for row in [columns] + rows) for i in range(len(columns))]
+    for row in [columns] + rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+def compare(results, baseline, tolerance):
+    """
+    Compares the throughput and p90 latency with a previous run.
+
+    Returns:
+        list: Descriptions of the regressions beyond `tolerance` (a fraction).
+    """
+    previous = {(result["mode"], result["workers"]): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get((result["mode"], result["workers"]))
+        if not old:
+            continue
+        name = f"{result['mode']} with {result['workers']} workers"
+        if old["jobs_per_minute"] and result["jobs_per_minute"] < old["jobs_per_minute"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['jobs_per_minute']} jobs/min, was {old['jobs_per_minute']}")
+        old_p90 = (old["latency"].get("total") or {}).get("p90")
+        new_p90 = (result["latency"].get("total") or {}).get("p90")
+        if old_p90 and new_p90 and new_p90 > old_p90 * (1 + tolerance):
+            regressions.append(f"{name}: total p90 {new_p90:.2f}s, was {old_p90:.2f}s")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the import pipeline")
+    parser.add_argument("--mode", choices=["direct", "jobs", "both"], default="both",
+                        help="scrape_recipe calls, the Flask job flow or both")
+    parser.add_argument("--jobs", type=int, default=20, help="Number of posts per run")
+    parser.add_argument("--workers", default="1,2,4", help="Comma separated worker counts to measure")
+    parser.add_argument("--platform", choices=["instagram", "tiktok"], default="instagram")
+    parser.add_argument("--provider", choices=["tandoor", "mealie"], default="tandoor")
+    parser.add_argument("--extraction-mode", choices=["steps", "single"], default="steps")
+    parser.add_argument("--browser", choices=["http", "stub"], default="http",
+                        help="Captions via the HTTP fast path or a stubbed browser")
+    parser.add_argument("--caption-parser", action="store_true",
+                        help="Let the rule-based caption parser skip the AI extraction")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per chat completion")
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument("--api-latency", type=float, default=0.02, help="Seconds per Tandoor/Mealie request")
+    parser.add_argument("--post-latency", type=float, default=0.05, help="Seconds per post page or image")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for a run")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="Results JSON of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression against the baseline")
+    parser.add_argument("--verbose", action="store_true", help="Show the logs of the runs")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(json.loads(args.child))
+        return
+
+    servers = (
+        FixtureServer(args.post_latency),
+        FakeOpenAIServer(args.llm_latency, args.llm_jitter),
+        FakeRecipeAPIServer(args.api_latency),
+    )
+    modes = ["direct", "jobs"] if args.mode == "both" else [args.mode]
+    results = []
+    try:
+        for mode in modes:
+            for workers in [int(value) for value in args.workers.split(",") if value.strip()]:
+                print(f"Running {mode} with {workers} workers...", flush=True)
+                results.append(measure(args, mode, workers, servers))
+    finally:
+        for server in servers:
+            server.stop()
+
+    print()
+    print_report(results)
+    settings = {key: value for key, value in vars(args).items() if key not in ("child", "output", "baseline", "verbose")}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        changed = [key for key, value in settings.items() if baseline.get("settings", {}).get(key) != value]
+        if changed:
+            print(f"\nNote: the baseline was measured with different settings ({', '.join(changed)})")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
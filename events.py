@@ -0,0 +1,92 @@
+import json
+import queue
+import threading
+
+from logs import setup_logging
+
+logger = setup_logging("job_events")
+
+
+class Subscription:
+    """
+    Queue of events for a single listener. If the listener falls behind, the
+    oldest events are dropped, the newest status of a job is what matters.
+    """
+
+    def __init__(self, bus, job_id=None, max_events=100):
+        self.bus = bus
+        self.job_id = job_id
+        self._events = queue.Queue(maxsize=max_events)
+
+    def put(self, event):
+        while True:
+            try:
+                self._events.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self._events.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """
+        Returns:
+            dict or None: The next event, None if there was none within `timeout` seconds.
+        """
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JobEventBus:
+    """
+    In-process publish/subscribe for job status changes. Listeners subscribe
+    to a single job or, with `job_id=None`, to all jobs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+
+    def subscribe(self, job_id=None):
+        subscription = Subscription(self, job_id)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event):
+        """
+        Args:
+            event (dict): The job status, must contain the job `id`.
+        """
+        with self._lock:
+            subscriptions = [s for s in self._subscriptions if s.job_id in (None, event["id"])]
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": len(self._subscriptions)}
+
+
+event_bus = JobEventBus()
+
+def format_sse(data, event=None):
+    """Formats a server-sent event, `data` is sent as JSON"""
+    message = f"event: {event}\n" if event else ""
+    return f"{message}data: {json.dumps(data)}\n\n"
@@ -0,0 +1,12 @@
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+# Every process runs its own job workers, browser pool and AI sessions
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# Open job and history pages keep a thread busy with their event stream
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+# Give running jobs time to write their progress on shutdown
+graceful_timeout = int(os.environ.get('JOB_DRAIN_TIMEOUT', 30)) + 5
+accesslog = '-'
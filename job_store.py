@@ -0,0 +1,129 @@
+import threading
+import time
+from datetime import datetime
+
+from logs import setup_logging
+
+logger = setup_logging("job_store")
+
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled', 'timed_out')
+
+
+class JobStateStore:
+    """
+    In-memory status of the jobs that are being processed.
+
+    Progress updates only change the in-memory state and are written to the
+    database in batches every `flush_interval` seconds, in one transaction.
+    Finished jobs are written right away and then dropped from memory, so
+    the database stays the source of truth for everything that is not running.
+    Every `heartbeat_interval` seconds the running jobs get a fresh
+    `heartbeat_at`, so other processes can tell them from abandoned jobs.
+    """
+
+    def __init__(self, write, flush_interval=1.0, heartbeat_interval=15.0):
+        """
+        Args:
+            write (callable): Function called with a dict of job id -> changed
+                fields that writes them to the database in one transaction.
+            flush_interval (float): Seconds between two batched writes.
+            heartbeat_interval (float): Seconds between two heartbeats of the running jobs.
+        """
+        self.write = write
+        self.flush_interval = flush_interval
+        self.heartbeat_interval = heartbeat_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._states = {}
+        self._dirty = {}
+        self._stop = threading.Event()
+        self._flusher = None
+
+    def update(self, job_id, **fields):
+        """
+        Changes the state of a job. Fields set to None are left unchanged.
+
+        Returns:
+            dict: A copy of the complete in-memory state of the job.
+        """
+        fields = {key: value for key, value in fields.items() if value is not None}
+        with self._lock:
+            state = self._states.setdefault(job_id, {'id': job_id})
+            state.update(fields)
+            self._dirty.setdefault(job_id, {}).update(fields)
+            snapshot = dict(state)
+
+        if snapshot.get('status') in FINISHED_STATUSES:
+            self.flush()
+        return snapshot
+
+    def get(self, job_id):
+        """
+        Returns:
+            dict or None: A copy of the state of a running job, None if it's not in memory.
+        """
+        with self._lock:
+            state = self._states.get(job_id)
+            return dict(state) if state else None
+
+    def job_ids(self):
+        """Returns the ids of all jobs held in memory"""
+        with self._lock:
+            return list(self._states)
+
+    def flush(self):
+        """Writes all pending changes to the database"""
+        with self._flush_lock:
+            with self._lock:
+                changes, self._dirty = self._dirty, {}
+            if not changes:
+                return
+            try:
+                self.write(changes)
+            except Exception as e:
+                logger.error(f"Failed to write {len(changes)} job updates: {e}", exc_info=True)
+                # Keep the changes (newer ones win) for the next attempt
+                with self._lock:
+                    for job_id, fields in changes.items():
+                        self._dirty[job_id] = {**fields, **self._dirty.get(job_id, {})}
+                return
+
+            with self._lock:
+                for job_id in changes:
+                    state = self._states.get(job_id)
+                    if state and state.get('status') in FINISHED_STATUSES and job_id not in self._dirty:
+                        del self._states[job_id]
+
+    def start(self):
+        """Start the background thread writing the batched updates"""
+        if self._flusher:
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, name="job-state-flusher", daemon=True)
+        self._flusher.start()
+
+    def stop(self):
+        """Stop the background thread and write the remaining updates"""
+        self._stop.set()
+        if self._flusher:
+            self._flusher.join(self.flush_interval + 5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {'jobs': len(self._states), 'unflushed': len(self._dirty)}
+
+    def heartbeat(self):
+        """Marks all running jobs as alive, written with the next flush"""
+        now = datetime.now()
+        with self._lock:
+            for job_id, state in self._states.items():
+                if state.get('status') not in FINISHED_STATUSES:
+                    self._dirty.setdefault(job_id, {})['heartbeat_at'] = now
+
+    def _flush_loop(self):
+        last_heartbeat = time.monotonic()
+        while not self._stop.wait(self.flush_interval):
+            if time.monotonic() - last_heartbeat >= self.heartbeat_interval:
+                self.heartbeat()
+                last_heartbeat = time.monotonic()
+            self.flush()
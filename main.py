@@ -1,27 +1,77 @@
 import argparse
-import re
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 from dotenv import load_dotenv
+from scrapers.cache_control import bypass_cache
+from scrapers.progress import describe_progress
 from scrapers.scraper_service import ScraperService
+from scrapers.url_utils import is_valid_url, prepare_batch
 
 load_dotenv()
 
 
-def is_valid_url(url, platform):
+def read_url_file(path):
     """
-    Check if the given URL is a valid Instagram URL.
-    Args:
-        url (str): The URL to be validated.
+    Reads a file with one post URL per line. Empty lines and lines starting
+    with # are skipped. A platform can follow the URL, separated by whitespace.
     Returns:
-        bool: True if the URL matches the Instagram URL pattern, False otherwise.
+        list: URLs and (url, platform) tuples, ready for `prepare_batch`.
     """
-    
-    match platform:
-        case "instagram" | "i":
-            url_pattern = re.compile(r'^(https?:\/\/)?(www\.)?instagram\.com\/[A-Za-z0-9_\-\/]+\/?(\?.*)?$')
-        case "tiktok" | "t":
-            url_pattern = re.compile(r'^(https?:\/\/)?(www\.)?tiktok\.com\/@?[A-Za-z0-9_\-\/]+\/video\/[0-9]+(\?.*)?$')
-            
-    return re.match(url_pattern, url) is not None
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if not parts or parts[0].startswith('#'):
+                continue
+            entries.append((parts[0], parts[1]) if len(parts) > 1 else parts[0])
+    return entries
+
+def run_batch(entries, platform, workers, no_cache):
+    """
+    Scrapes all URLs of a bulk import concurrently and prints a progress line
+    per finished post and a summary at the end.
+    Returns:
+        int: Number of failed posts.
+    """
+    valid, duplicates, invalid = prepare_batch(entries, platform)
+    for url in invalid:
+        print(f"Skipping invalid URL: {url}")
+    print(f"Importing {len(valid)} posts ({len(duplicates)} duplicates, {len(invalid)} invalid skipped) with {workers} workers")
+
+    def scrape(url, url_platform):
+        with bypass_cache() if no_cache else nullcontext():
+            return ScraperService.scrape_recipe(url, url_platform)
+
+    counts = {'imported': 0, 'already imported': 0, 'failed': 0}
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(scrape, url, url_platform): url for url, url_platform in valid}
+        for done, future in enumerate(as_completed(futures), start=1):
+            url = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'status': 'error', 'error': str(e)}
+            if not isinstance(result, dict) or result.get('status') != 'success':
+                outcome = 'failed'
+            elif result.get('already_imported'):
+                outcome = 'already imported'
+            else:
+                outcome = 'imported'
+            counts[outcome] += 1
+            print(f"[{done}/{len(valid)}] {outcome}: {url}")
+
+    elapsed = time.monotonic() - started
+    print(f"Done in {elapsed:.0f}s: {counts['imported']} imported, {counts['already imported']} already imported, "
+          f"{counts['failed']} failed, {len(duplicates)} duplicates, {len(invalid)} invalid")
+    return counts['failed']
+
+def print_progress(event, details):
+    """Prints the progress events of a single import"""
+    print(describe_progress(event, details))
     
 def main():
     """
@@ -33,19 +83,27 @@ def main():
         ValueError: If the provided Instagram URL is invalid or if the mode is not 'mealie'/'m' or 'tandoor'/'t'.
     Command-line Arguments:
         -url (str): The URL of the Instagram post.
+        --file (str): A file with one post URL per line, imported concurrently instead of -url.
         -mode (str): The mode of the recipe extraction ('mealie'/'m' or 'tandoor'/'t').
+        --no-cache: Ignore cached captions, recipes and AI responses.
+        --workers (int): Number of posts scraped at the same time with --file.
     """
     parser = argparse.ArgumentParser(description='Extract recipe information from an post')
-    parser.add_argument('-url', type=str, required=True, help='The URL of the Instagram post')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('-url', type=str, help='The URL of the Instagram post')
+    source.add_argument('--file', type=str, help='A file with one post URL per line')
     parser.add_argument('-mode', type=str, required=True, help='The mode of the recipe extraction (mealie or tandoor)')
-    parser.add_argument('-platform', type=str, required=True, help='The platform of the URL (instagram or tiktok)')
+    parser.add_argument('-platform', type=str, help='The platform of the URL (instagram or tiktok), detected from the URL with --file')
+    parser.add_argument('--no-cache', action='store_true', help='Ignore cached captions, recipes and AI responses')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WORKER_COUNT', 2)), help='Number of posts scraped at the same time with --file')
     args = parser.parse_args()
     
-    if not is_valid_url(args.url, args.platform):
+    if args.url and not args.platform:
+        parser.error("-platform is required with -url")
+    if args.url and not is_valid_url(args.url, args.platform):
         raise ValueError("Invalid URL. Please provide a valid post URL.")
     
     # Setze Provider-ENV entsprechend CLI-Mode
-    import os
     mode_map = {
         'mealie': 'mealie',
         'm': 'mealie',
@@ -56,7 +114,11 @@ def main():
     if not provider:
         raise ValueError("Invalid mode. Please specify either 'mealie'/'m' or 'tandoor'/'t'")
     os.environ['RECIPE_PROVIDER'] = provider
-    ScraperService.scrape_recipe(args.url, args.platform)
+    if args.file:
+        failed = run_batch(read_url_file(args.file), args.platform, args.workers, args.no_cache)
+        sys.exit(1 if failed else 0)
+    with bypass_cache() if args.no_cache else nullcontext():
+        ScraperService.scrape_recipe(args.url, args.platform, progress=print_progress)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
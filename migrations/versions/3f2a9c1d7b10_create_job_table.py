@@ -0,0 +1,49 @@
+"""create job table
+
+Databases created with db.create_all() before migrations were added are
+stamped with this revision on startup.
+
+Revision ID: 3f2a9c1d7b10
+Revises: 
+Create Date: 2026-10-17 22:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('url', sa.String(length=512), nullable=False),
+    sa.Column('platform', sa.String(length=50), nullable=False),
+    sa.Column('target', sa.String(length=50), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('progress', sa.Integer(), nullable=True),
+    sa.Column('message', sa.String(length=512), nullable=True),
+    sa.Column('result', sa.Text(), nullable=True),
+    sa.Column('result_url', sa.String(length=512), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_job_created_at'), ['created_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_job_status'), ['status'], unique=False)
+        batch_op.create_index(batch_op.f('ix_job_url'), ['url'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_job_url'))
+        batch_op.drop_index(batch_op.f('ix_job_status'))
+        batch_op.drop_index(batch_op.f('ix_job_created_at'))
+
+    op.drop_table('job')
@@ -0,0 +1,31 @@
+"""add job claims
+
+Lets several app processes share the job table: a worker claims a job by
+setting claimed_by and keeps heartbeat_at fresh while it runs.
+
+Revision ID: 8d4e6b2a51c3
+Revises: 3f2a9c1d7b10
+Create Date: 2026-10-17 22:55:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4e6b2a51c3'
+down_revision = '3f2a9c1d7b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('claimed_by', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_column('heartbeat_at')
+        batch_op.drop_column('claimed_by')
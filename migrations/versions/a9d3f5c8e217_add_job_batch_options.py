@@ -0,0 +1,35 @@
+"""add job batch options
+
+Keeps the bulk import of a job and the options it was submitted with in the
+database, so every process can queue the job and report the batch status.
+
+Revision ID: a9d3f5c8e217
+Revises: e1b7c3f94a26
+Create Date: 2026-10-18 11:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9d3f5c8e217'
+down_revision = 'e1b7c3f94a26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('batch_id', sa.String(length=36), nullable=True))
+        batch_op.add_column(sa.Column('bypass_cache', sa.Boolean(), nullable=True))
+        batch_op.add_column(sa.Column('timeout', sa.Float(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_job_batch_id'), ['batch_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_job_batch_id'))
+        batch_op.drop_column('timeout')
+        batch_op.drop_column('bypass_cache')
+        batch_op.drop_column('batch_id')
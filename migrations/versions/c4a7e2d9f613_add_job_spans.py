@@ -0,0 +1,29 @@
+"""add job spans
+
+Stores the timed operations (browser launch, page load, AI prompts, uploads,
+...) of a finished job as JSON.
+
+Revision ID: c4a7e2d9f613
+Revises: 8d4e6b2a51c3
+Create Date: 2026-10-17 23:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a7e2d9f613'
+down_revision = '8d4e6b2a51c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('spans', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_column('spans')
@@ -0,0 +1,29 @@
+"""add job cancel requested
+
+Flags running jobs cancelled through the API, so the process working on
+them stops them even if the request was served by another process.
+
+Revision ID: e1b7c3f94a26
+Revises: c4a7e2d9f613
+Create Date: 2026-10-18 10:15:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1b7c3f94a26'
+down_revision = 'c4a7e2d9f613'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cancel_requested', sa.Boolean(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_column('cancel_requested')
@@ -1,20 +1,135 @@
+import base64
+import sqlite3
+import zlib
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect
+from sqlalchemy.orm import deferred
 from datetime import datetime
 
 db = SQLAlchemy()
 
+# Marks `result` values stored zlib-compressed and base64-encoded
+COMPRESSED_RESULT_PREFIX = 'zlib:'
+
 class Job(db.Model):
     id = db.Column(db.String(36), primary_key=True)
-    url = db.Column(db.String(512), nullable=False)
+    url = db.Column(db.String(512), nullable=False, index=True)
     platform = db.Column(db.String(50), nullable=False)
     target = db.Column(db.String(50), nullable=False)
-    status = db.Column(db.String(20), default='pending')  # pending, processing, completed, failed
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, processing, completed, failed, cancelled, timed_out
     progress = db.Column(db.Integer, default=0)
     message = db.Column(db.String(512))
-    result = db.Column(db.Text)
+    # Full tracebacks and result dicts, only loaded when accessed
+    result = deferred(db.Column(db.Text))
     result_url = db.Column(db.String(512))
-    created_at = db.Column(db.DateTime, default=datetime.now)
+    created_at = db.Column(db.DateTime, default=datetime.now, index=True)
     completed_at = db.Column(db.DateTime)
+    # Process working on the job and the last time it reported being alive
+    claimed_by = db.Column(db.String(64))
+    heartbeat_at = db.Column(db.DateTime)
+    # Set by the cancel API, the process running the job stops it at its next check point
+    cancel_requested = db.Column(db.Boolean, default=False)
+    # Bulk import the job belongs to and the options it was submitted with,
+    # so any process can queue it and report on the batch
+    batch_id = db.Column(db.String(36), index=True)
+    bypass_cache = db.Column(db.Boolean, default=False)
+    timeout = db.Column(db.Float)
+    # JSON list of the timed operations of the job, written when it's finished
+    spans = deferred(db.Column(db.Text))
     
+    @property
+    def result_text(self):
+        """The result as written by the worker, decompressed if necessary"""
+        return decompress_result(self.result)
+
     def __repr__(self):
-        return f'<Job {self.id}>'
\ No newline at end of file
+        return f'<Job {self.id}>'
+
+def compress_result(result, threshold):
+    """
+    Compresses results longer than `threshold` characters. Tracebacks and
+    result dicts shrink to a fraction of their size, short messages are
+    stored as they are so they stay readable in the database.
+
+    Args:
+        result (str): The result to store.
+        threshold (int): Minimum length to compress, 0 disables compression.
+
+    Returns:
+        str: The value to write to the `result` column.
+    """
+    if not result or not threshold or len(result) < threshold or result.startswith(COMPRESSED_RESULT_PREFIX):
+        return result
+    compressed = base64.b64encode(zlib.compress(result.encode('utf-8'), 9)).decode('ascii')
+    return COMPRESSED_RESULT_PREFIX + compressed
+
+def decompress_result(value):
+    """Returns the original text of a `result` value written by `compress_result`"""
+    if not value or not value.startswith(COMPRESSED_RESULT_PREFIX):
+        return value
+    return zlib.decompress(base64.b64decode(value[len(COMPRESSED_RESULT_PREFIX):])).decode('utf-8')
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL lets the web requests read while a worker writes, the busy timeout
+    makes writers wait for each other instead of failing with "database is locked".
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def create_indexes():
+    """
+    Adds the indexes of the models to tables created before they existed.
+    Indexes on columns the table doesn't have yet are left to the migrations.
+    """
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            if all(column.name in columns for column in index.columns):
+                index.create(db.engine, checkfirst=True)
+
+def paginate_jobs(limit, cursor=None, status=None, platform=None):
+    """
+    Returns a page of jobs, newest first. Uses keyset pagination on
+    (created_at, id), so every page is an index range scan no matter how deep.
+
+    Args:
+        limit (int): Number of jobs per page.
+        cursor (str, optional): `next_cursor` of the previous page.
+        status (str, optional): Only return jobs with this status.
+        platform (str, optional): Only return jobs of this platform.
+
+    Returns:
+        tuple: (jobs, next_cursor) where `next_cursor` is None on the last page.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    query = Job.query
+    if status:
+        query = query.filter(Job.status == status)
+    if platform:
+        query = query.filter(Job.platform == platform)
+    if cursor:
+        created_at, _, job_id = cursor.partition('|')
+        created_at = datetime.fromisoformat(created_at)
+        query = query.filter(db.or_(
+            Job.created_at < created_at,
+            db.and_(Job.created_at == created_at, Job.id < job_id)
+        ))
+    jobs = query.order_by(Job.created_at.desc(), Job.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(jobs) > limit:
+        jobs = jobs[:limit]
+        next_cursor = f"{jobs[-1].created_at.isoformat()}|{jobs[-1].id}"
+    return jobs, next_cursor
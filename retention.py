@@ -0,0 +1,197 @@
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.orm import undefer
+
+from job_store import FINISHED_STATUSES
+from logs import setup_logging
+from models import COMPRESSED_RESULT_PREFIX, compress_result, db, decompress_result, Job
+from scrapers.content_cache import get_referenced_thumbnails
+
+logger = setup_logging("retention")
+
+# Relative to the working directory, like the scrapers writing them
+THUMBNAIL_DIR = 'thumbnails'
+ARTIFACTS = [os.path.join('scrapers', 'final_json.json')]
+
+_last_run = None
+_last_run_lock = threading.Lock()
+
+
+def archive_record(job):
+    """Returns the archived form of a job, with the result decompressed"""
+    return {
+        'id': job.id,
+        'url': job.url,
+        'platform': job.platform,
+        'target': job.target,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'result': decompress_result(job.result),
+        'result_url': job.result_url,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'completed_at': job.completed_at.isoformat() if job.completed_at else None,
+        'spans': json.loads(job.spans) if job.spans else None,
+    }
+
+def purge_jobs(max_age_days=0, max_jobs=0, archive_dir=None, batch_size=500):
+    """
+    Deletes finished jobs older than `max_age_days` and the oldest finished
+    jobs beyond the newest `max_jobs`. Pending and processing jobs are never
+    touched. Must be called inside an app context.
+
+    Args:
+        max_age_days (float): Maximum age of a finished job, 0 disables the limit.
+        max_jobs (int): Number of finished jobs to keep, 0 disables the limit.
+        archive_dir (str, optional): Directory the deleted jobs are exported to
+            as gzipped JSON lines, one file per run. Jobs are deleted without
+            an archive if not set.
+        batch_size (int): Number of jobs archived and deleted per transaction.
+
+    Returns:
+        int: Number of deleted jobs.
+    """
+    finished = Job.query.filter(Job.status.in_(FINISHED_STATUSES))
+    excess = max(0, finished.count() - max_jobs) if max_jobs else 0
+    cutoff = datetime.now() - timedelta(days=max_age_days) if max_age_days else None
+    if not excess and cutoff is None:
+        return 0
+
+    archive = None
+    purged = 0
+    try:
+        while True:
+            jobs = finished.options(undefer(Job.result), undefer(Job.spans)).order_by(Job.created_at, Job.id).limit(batch_size).all()
+            # Oldest first, so the expired jobs are a prefix of every batch
+            expired = []
+            for job in jobs:
+                too_many = purged + len(expired) < excess
+                too_old = cutoff is not None and job.created_at is not None and job.created_at < cutoff
+                if not (too_many or too_old):
+                    break
+                expired.append(job)
+            if not expired:
+                break
+
+            if archive_dir:
+                if archive is None:
+                    os.makedirs(archive_dir, exist_ok=True)
+                    path = os.path.join(archive_dir, f"jobs-{datetime.now():%Y%m%d-%H%M%S}.jsonl.gz")
+                    archive = gzip.open(path, 'at', encoding='utf-8')
+                    logger.info(f"Archiving jobs to {path}")
+                for job in expired:
+                    archive.write(json.dumps(archive_record(job), ensure_ascii=False) + '\n')
+                # The archive has to be complete before the jobs are gone
+                archive.flush()
+
+            Job.query.filter(Job.id.in_([job.id for job in expired])).delete(synchronize_session=False)
+            db.session.commit()
+            purged += len(expired)
+            if len(expired) < len(jobs) or len(jobs) < batch_size:
+                break
+    finally:
+        if archive is not None:
+            archive.close()
+    return purged
+
+def compact_results(threshold, batch_size=500):
+    """
+    Compresses stored results longer than `threshold` characters, e.g. the
+    ones written before compression was enabled. Must be called inside an app context.
+
+    Returns:
+        int: Number of compressed results.
+    """
+    if not threshold:
+        return 0
+    compacted = 0
+    while True:
+        rows = db.session.query(Job.id, Job.result).filter(
+            Job.status.in_(FINISHED_STATUSES),
+            func.length(Job.result) >= threshold,
+            Job.result.notlike(f'{COMPRESSED_RESULT_PREFIX}%')
+        ).limit(batch_size).all()
+        if not rows:
+            break
+        for job_id, result in rows:
+            Job.query.filter_by(id=job_id).update(
+                {'result': compress_result(result, threshold)},
+                synchronize_session=False
+            )
+        db.session.commit()
+        compacted += len(rows)
+    return compacted
+
+def cleanup_files(max_age_hours, thumbnail_dir=THUMBNAIL_DIR, artifacts=ARTIFACTS):
+    """
+    Removes thumbnails no cached caption or recipe refers to anymore and the
+    debug artifacts written by the providers. Files younger than
+    `max_age_hours` are kept, they may belong to a job that is still running.
+
+    Returns:
+        int: Number of removed files.
+    """
+    cutoff = time.time() - max_age_hours * 3600
+    referenced = get_referenced_thumbnails()
+    candidates = list(artifacts)
+    if os.path.isdir(thumbnail_dir):
+        candidates += [os.path.join(thumbnail_dir, name) for name in os.listdir(thumbnail_dir)]
+
+    removed = 0
+    for path in candidates:
+        path = os.path.abspath(path)
+        if path in referenced or not os.path.isfile(path):
+            continue
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                continue
+            os.remove(path)
+            removed += 1
+        except OSError as e:
+            logger.warning(f"Failed to remove {path}: {e}")
+    return removed
+
+def run_retention(config, archive_dir=None):
+    """
+    Applies all retention policies once. Must be called inside an app context.
+
+    Args:
+        config (dict): The app config with the JOB_RETENTION_*, RESULT_COMPRESS_THRESHOLD
+            and FILE_RETENTION_HOURS settings.
+        archive_dir (str, optional): Where deleted jobs are archived, see `purge_jobs`.
+
+    Returns:
+        dict: Number of purged jobs, compacted results and removed files.
+    """
+    global _last_run
+    started = time.monotonic()
+    summary = {
+        'purged_jobs': purge_jobs(
+            max_age_days=config['JOB_RETENTION_DAYS'],
+            max_jobs=config['JOB_RETENTION_MAX_JOBS'],
+            archive_dir=archive_dir
+        ),
+        'compacted_results': compact_results(config['RESULT_COMPRESS_THRESHOLD']),
+        'removed_files': cleanup_files(config['FILE_RETENTION_HOURS']),
+    }
+    summary['duration'] = round(time.monotonic() - started, 3)
+    summary['finished_at'] = datetime.now().isoformat()
+    with _last_run_lock:
+        _last_run = summary
+    if summary['purged_jobs'] or summary['compacted_results'] or summary['removed_files']:
+        logger.info(
+            f"Retention: purged {summary['purged_jobs']} jobs, compacted {summary['compacted_results']} "
+            f"results, removed {summary['removed_files']} files in {summary['duration']}s"
+        )
+    return summary
+
+def get_retention_stats():
+    """Returns the summary of the last retention run in this process, None if there was none"""
+    with _last_run_lock:
+        return dict(_last_run) if _last_run else None
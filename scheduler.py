@@ -0,0 +1,290 @@
+import threading
+from collections import deque
+
+from logs import setup_logging
+from scrapers.cancellation import JobCancelled
+
+logger = setup_logging("job_scheduler")
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another job"""
+
+
+class SchedulerStoppedError(Exception):
+    """Raised when a job is submitted after the scheduler was shut down"""
+
+
+class JobScheduler:
+    """
+    Bounded job queue served by a fixed number of worker threads.
+
+    Jobs are identified by their id, the handler is responsible for loading
+    everything else from the database. This keeps the queue cheap and lets
+    jobs that never left the queue be recovered from the `Job` table after a
+    restart. Per-submission options that are not stored in the database are
+    passed to the handler as keyword arguments.
+
+    Jobs that don't fit into the queue can wait in the database instead, the
+    `refill` callback is called whenever a worker finished a job so it can
+    submit the next ones.
+    """
+
+    def __init__(self, handler, worker_count=2, max_queue_size=20, refill=None):
+        """
+        Args:
+            handler (callable): Function called with the job id (and options) by a worker.
+            worker_count (int): Number of jobs processed concurrently.
+            max_queue_size (int): Number of jobs allowed to wait for a worker.
+            refill (callable, optional): Function called with the number of free
+                queue slots after a worker finished a job.
+        """
+        self.handler = handler
+        self.refill = refill
+        self.worker_count = max(1, worker_count)
+        self.max_queue_size = max(1, max_queue_size)
+
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._pending = deque()
+        self._options = {}
+        self._running = set()
+        self._workers = []
+        self._stopping = False
+        self._drain = True
+
+    def start(self):
+        """Start the worker threads (no-op if already started)"""
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.worker_count):
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"job-worker-{i + 1}",
+                    daemon=True
+                )
+                self._workers.append(worker)
+                worker.start()
+        logger.info(f"Started {self.worker_count} job workers (queue size {self.max_queue_size})")
+
+    def submit(self, job_id, force=False, block=False, **options):
+        """
+        Add a job to the queue.
+
+        Args:
+            job_id (str): The id of the job to process.
+            force (bool): Enqueue even if the queue is full (used for recovery).
+            block (bool): Wait for a free slot instead of raising `QueueFullError`.
+            **options: Keyword arguments passed on to the handler.
+
+        Returns:
+            int: Position of the job in the queue (0 if it is already running).
+
+        Raises:
+            QueueFullError: If the queue is full and `force` is not set.
+            SchedulerStoppedError: If the scheduler is shutting down.
+        """
+        with self._lock:
+            if self._stopping:
+                raise SchedulerStoppedError("Scheduler is shutting down")
+            if job_id in self._running:
+                return 0
+            if job_id in self._pending:
+                return self._pending.index(job_id) + 1
+            while block and not force and not self._stopping and len(self._pending) >= self.max_queue_size:
+                self._not_full.wait()
+            if self._stopping:
+                raise SchedulerStoppedError("Scheduler is shutting down")
+            if not force and len(self._pending) >= self.max_queue_size:
+                raise QueueFullError(f"Job queue is full ({self.max_queue_size} jobs waiting)")
+            self._pending.append(job_id)
+            if options:
+                self._options[job_id] = options
+            self._not_empty.notify()
+            return len(self._pending)
+
+    def position(self, job_id):
+        """
+        Returns:
+            int or None: 1-based queue position, 0 if running, None if unknown.
+        """
+        with self._lock:
+            if job_id in self._running:
+                return 0
+            try:
+                return self._pending.index(job_id) + 1
+            except ValueError:
+                return None
+
+    def free_slots(self):
+        """Returns the number of jobs that can still be submitted without `force`"""
+        with self._lock:
+            return max(0, self.max_queue_size - len(self._pending))
+
+    def stats(self):
+        """Returns a snapshot of queued and running job counts"""
+        with self._lock:
+            return {
+                "queued": len(self._pending),
+                "running": len(self._running),
+                "workers": self.worker_count,
+                "max_queue_size": self.max_queue_size,
+            }
+
+    def shutdown(self, drain=False, timeout=None):
+        """
+        Stop accepting jobs and wait for the workers to finish.
+
+        Args:
+            drain (bool): Process the remaining queued jobs before stopping.
+                Otherwise queued jobs stay `pending` in the database and are
+                picked up again on the next start.
+            timeout (float, optional): Seconds to wait for each worker.
+        """
+        with self._lock:
+            if self._stopping:
+                return
+            self._stopping = True
+            self._drain = drain
+            dropped = 0 if drain else len(self._pending)
+            if not drain:
+                self._pending.clear()
+                self._options.clear()
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+            workers = list(self._workers)
+
+        logger.info(f"Shutting down job scheduler ({len(self._running)} running, {dropped} left pending)")
+        for worker in workers:
+            worker.join(timeout)
+
+    def _worker_loop(self):
+        while True:
+            with self._not_empty:
+                while not self._pending and not self._stopping:
+                    self._not_empty.wait()
+                if not self._pending or (self._stopping and not self._drain):
+                    return
+                job_id = self._pending.popleft()
+                self._not_full.notify()
+                options = self._options.pop(job_id, {})
+                self._running.add(job_id)
+
+            try:
+                self.handler(job_id, **options)
+            except JobCancelled as e:
+                # No Exception, it would end the worker thread and shrink the pool for good
+                logger.warning(f"Job {job_id} was stopped outside of its stage: {e}")
+            except Exception as e:
+                logger.error(f"Unhandled error in job {job_id}: {e}", exc_info=True)
+            finally:
+                with self._lock:
+                    self._running.discard(job_id)
+                    free = 0 if self._stopping else self.max_queue_size - len(self._pending)
+
+            if self.refill and free > 0:
+                try:
+                    self.refill(free)
+                except Exception as e:
+                    logger.error(f"Failed to refill job queue: {e}", exc_info=True)
+
+
+class JobPipeline:
+    """
+    Runs jobs through a sequence of stages, each served by its own
+    `JobScheduler` with its own number of workers. A stage handler returns
+    the keyword arguments for the next stage, or None if the job is finished.
+    Jobs are handed over with a blocking submit, so a full stage slows down
+    the stages in front of it instead of piling up work.
+
+    Only the first stage accepts new jobs, its queue is the one that
+    `submit`, `position`, `free_slots` and `refill` refer to.
+    """
+
+    def __init__(self, stages, max_queue_size=20, refill=None):
+        """
+        Args:
+            stages (list): (name, handler, worker_count) tuples in the order the jobs pass them.
+            max_queue_size (int): Number of jobs allowed to wait in front of each stage.
+            refill (callable, optional): Passed on to the first stage, see `JobScheduler`.
+        """
+        self.stages = []
+        for index, (name, handler, worker_count) in enumerate(stages):
+            self.stages.append((name, JobScheduler(
+                self._make_handler(index, handler),
+                worker_count=worker_count,
+                max_queue_size=max_queue_size,
+                refill=refill if index == 0 else None
+            )))
+        self.max_queue_size = self.stages[0][1].max_queue_size
+
+    def _make_handler(self, index, handler):
+        def run(job_id, **options):
+            next_options = handler(job_id, **options)
+            if next_options is None or index + 1 >= len(self.stages):
+                return
+            try:
+                self.stages[index + 1][1].submit(job_id, block=True, **next_options)
+            except SchedulerStoppedError:
+                # The job is picked up again after the next start
+                logger.info(f"Job {job_id} stopped between stages")
+        return run
+
+    @property
+    def refill(self):
+        return self.stages[0][1].refill
+
+    @refill.setter
+    def refill(self, refill):
+        self.stages[0][1].refill = refill
+
+    def start(self):
+        for _, stage in self.stages:
+            stage.start()
+
+    def submit(self, job_id, force=False, **options):
+        """Add a job to the first stage, see `JobScheduler.submit`"""
+        position = self.position(job_id)
+        if position is not None:
+            return position
+        return self.stages[0][1].submit(job_id, force=force, **options)
+
+    def position(self, job_id):
+        """
+        Returns:
+            int or None: 1-based position in the first stage's queue, 0 if the
+                job already started, None if unknown.
+        """
+        first = self.stages[0][1].position(job_id)
+        if first is not None:
+            return first
+        for _, stage in self.stages[1:]:
+            if stage.position(job_id) is not None:
+                return 0
+        return None
+
+    def free_slots(self):
+        return self.stages[0][1].free_slots()
+
+    def stats(self):
+        """Returns the stats of the first stage plus the stats of every stage"""
+        stage_stats = {name: stage.stats() for name, stage in self.stages}
+        first = stage_stats[self.stages[0][0]]
+        return {
+            "queued": first["queued"],
+            "running": sum(stats["running"] + stats["queued"] for stats in stage_stats.values()) - first["queued"],
+            "workers": first["workers"],
+            "max_queue_size": first["max_queue_size"],
+            "stages": stage_stats,
+        }
+
+    def shutdown(self, drain=False, timeout=None):
+        """
+        Shut down all stages, see `JobScheduler.shutdown`. Draining goes front
+        to back so every stage can still hand its jobs over, otherwise the
+        stages are stopped back to front to release workers blocked on a hand-over.
+        """
+        for _, stage in (self.stages if drain else reversed(self.stages)):
+            stage.shutdown(drain=drain, timeout=timeout)
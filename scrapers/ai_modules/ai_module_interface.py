@@ -1,6 +1,17 @@
+import asyncio
 from abc import ABC, abstractmethod
 
 class AIModuleInterface(ABC):
+	"""
+	Blocking single-prompt methods every module has to implement, plus batch
+	and async variants. The defaults of the latter degrade to the serial
+	blocking methods, modules that can do better (concurrent requests, a
+	provider batch endpoint, a native async client) override them.
+	"""
+
+	# Set per session, False skips response cache lookups for the current job
+	use_response_cache = True
+
 	@abstractmethod
 	def initialize_chat(self, context):
 		pass
@@ -20,3 +31,69 @@ class AIModuleInterface(ABC):
 	@abstractmethod
 	def process_recipe_part(self, part, mode="", step_number=None, context=None):
 		pass
+
+	def reset(self):
+		"""
+		Prepares the module for the next job when its session is returned to the pool.
+
+		Returns:
+			bool: True if the module can be reused, False to close it instead.
+		"""
+		return True
+
+	def close(self):
+		"""Releases resources held by the module (browser, HTTP client)"""
+		pass
+
+	def send_json_prompts(self, prompts, on_result=None):
+		"""
+		Sends several independent prompts.
+
+		Args:
+			prompts (list): The prompts to send.
+			on_result (callable, optional): Called with the index and the result
+				of every prompt as soon as it is answered, in the calling thread.
+
+		Returns:
+			list: The parsed JSON of each answer in order, None for failed prompts.
+		"""
+		results = []
+		for index, prompt in enumerate(prompts):
+			results.append(self.send_json_prompt(prompt))
+			if on_result:
+				on_result(index, results[-1])
+		return results
+
+	def process_recipe_parts(self, requests, on_result=None):
+		"""
+		Processes several independent recipe parts.
+
+		Args:
+			requests (list): Keyword arguments for `process_recipe_part`, one dict per part.
+			on_result (callable, optional): Called with the index and the result
+				of every part as soon as it is done, in the calling thread.
+
+		Returns:
+			list: The result of each part in order, None for failed parts.
+		"""
+		results = []
+		for index, request in enumerate(requests):
+			results.append(self.process_recipe_part(**request))
+			if on_result:
+				on_result(index, results[-1])
+		return results
+
+	async def async_send_raw_prompt(self, prompt):
+		return await asyncio.to_thread(self.send_raw_prompt, prompt)
+
+	async def async_send_json_prompt(self, prompt):
+		return await asyncio.to_thread(self.send_json_prompt, prompt)
+
+	async def async_process_recipe_part(self, part, mode="", step_number=None, context=None):
+		return await asyncio.to_thread(self.process_recipe_part, part, mode, step_number, context)
+
+	async def async_send_json_prompts(self, prompts):
+		return await asyncio.to_thread(self.send_json_prompts, prompts)
+
+	async def async_process_recipe_parts(self, requests):
+		return await asyncio.to_thread(self.process_recipe_parts, requests)
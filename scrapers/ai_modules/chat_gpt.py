@@ -1,33 +1,99 @@
 import os
 import json
 import re
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
 import openai
+from logs import setup_logging
+from metrics import counter
+from scrapers.cancellation import check_cancelled, remaining_time
+from tracing import span
 from .ai_module_interface import AIModuleInterface
+from .rate_limiter import RateLimiter
+from .response_cache import async_cached_response, cached_response, recipe_part_validator
+
+logger = setup_logging("chat_gpt")
+
+AI_TOKENS = counter("recipe_ai_tokens_total", "Tokens used by OpenAI requests", ("model", "kind"))
+
+# Shared by all threads so the limit applies to the whole process
+_rate_limiter = None
+
+def get_rate_limiter():
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter(float(os.getenv("AI_REQUESTS_PER_MINUTE", 0)))
+    return _rate_limiter
+
+def record_usage(attributes, model, usage):
+    """Adds the token counts of a completion to its span and the token counter"""
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = getattr(usage, kind, None)
+        if tokens is not None:
+            attributes[kind] = tokens
+            AI_TOKENS.inc(tokens, model=model, kind=kind.split("_")[0])
 
 class ChatGPTModule(AIModuleInterface):
     def __init__(self, api_key=None, model="gpt-5"):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         self.model = model
-        openai.api_key = self.api_key
+        # Every session gets its own client and context
+        self.client = openai.OpenAI(api_key=self.api_key)
         self.context = None
+        self.max_concurrency = max(1, int(os.getenv("AI_MAX_CONCURRENCY", 4)))
 
     def initialize_chat(self, context):
         self.context = context
         return True
 
-    def send_raw_prompt(self, prompt):
+    def reset(self):
+        self.context = None
+        return True
+
+    def close(self):
+        self.client.close()
+
+    def build_messages(self, prompt):
         messages = []
         if self.context:
             messages.append({"role": "system", "content": f"Recipe context: {self.context}"})
         messages.append({"role": "user", "content": prompt})
-        response = openai.chat.completions.create(
-            model=self.model,
-            messages=messages
-        )
-        return response.choices[0].message.content
+        return messages
+
+    def request_options(self):
+        """Returns the request timeout of the current job, so a prompt never runs past its deadline"""
+        timeout = remaining_time()
+        return {} if timeout is None else {"timeout": timeout}
+
+    def send_raw_prompt(self, prompt, validate=None, use_cache=True):
+        """
+        Args:
+            prompt (str): The prompt to send.
+            validate (callable, optional): Check the answer has to pass to be cached.
+            use_cache (bool): False skips the cache lookup, e.g. when retrying a bad answer.
+        """
+        messages = self.build_messages(prompt)
 
-    def send_json_prompt(self, prompt):
-        raw = self.send_raw_prompt(prompt)
+        def send():
+            get_rate_limiter().acquire()
+            check_cancelled()
+            with span("ai.prompt", module="openai", model=self.model) as attributes:
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    **self.request_options()
+                )
+                record_usage(attributes, self.model, response.usage)
+            return response.choices[0].message.content
+
+        return cached_response(self.model, messages, send, self.use_response_cache and use_cache, validate)
+
+    def parse_json_response(self, raw):
+        if not raw:
+            return None
         # print(f"[DEBUG] GPT raw response:\n{raw}")
         # Extrahiere JSON aus Antwort (triple backticks oder code block)
         match = re.search(r"```json\s*(.*?)```", raw, re.DOTALL)
@@ -46,6 +112,115 @@ class ChatGPTModule(AIModuleInterface):
         print("[DEBUG] No valid JSON found in response.")
         return None
 
+    def json_validator(self, validate=None):
+        """Returns the check a raw answer has to pass to be cached: it parses as JSON and passes `validate`"""
+        def is_valid(raw):
+            parsed = self.parse_json_response(raw)
+            return parsed is not None and (validate is None or bool(validate(parsed)))
+        return is_valid
+
+    def send_json_prompt(self, prompt, validate=None):
+        return self.parse_json_response(self.send_raw_prompt(prompt, self.json_validator(validate)))
+
+    def send_json_prompts(self, prompts, on_result=None):
+        """Sends the prompts as concurrent requests, at most `max_concurrency` at a time"""
+        return self._send_json_prompts(prompts, [None] * len(prompts), on_result)
+
+    def _send_json_prompts(self, prompts, validators, on_result=None):
+        if len(prompts) <= 1 or self.max_concurrency <= 1:
+            results = []
+            for index, (prompt, validate) in enumerate(zip(prompts, validators)):
+                results.append(self.send_json_prompt(prompt, validate))
+                if on_result:
+                    on_result(index, results[-1])
+            return results
+
+        def send(prompt, validate):
+            try:
+                return self.send_json_prompt(prompt, validate)
+            except Exception as e:
+                logger.error(f"Prompt failed: {e}", exc_info=True)
+                return None
+
+        results = [None] * len(prompts)
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(prompts))) as executor:
+            # Worker threads don't inherit the context, run each prompt in a copy
+            # so it's recorded in the job trace and stops when the job is cancelled
+            futures = {
+                executor.submit(copy_context().run, send, prompt, validate): index
+                for index, (prompt, validate) in enumerate(zip(prompts, validators))
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                results[index] = future.result()
+                if on_result:
+                    on_result(index, results[index])
+        return results
+
+    def process_recipe_parts(self, requests, on_result=None):
+        return self._send_json_prompts(
+            [self.build_prompt(**request) for request in requests],
+            [self._part_validator(**request) for request in requests],
+            on_result
+        )
+
+    @staticmethod
+    def _part_validator(part=None, mode="", step_number=None, context=None):
+        return recipe_part_validator(mode, step_number)
+
+    async def async_send_raw_prompt(self, prompt, client=None, validate=None):
+        messages = self.build_messages(prompt)
+
+        async def send():
+            if client is None:
+                async with openai.AsyncOpenAI(api_key=self.api_key) as own_client:
+                    return await self._async_complete(own_client, messages)
+            return await self._async_complete(client, messages)
+
+        return await async_cached_response(self.model, messages, send, self.use_response_cache, validate)
+
+    async def _async_complete(self, client, messages):
+        await asyncio.to_thread(get_rate_limiter().acquire)
+        check_cancelled()
+        with span("ai.prompt", module="openai", model=self.model) as attributes:
+            response = await client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                **self.request_options()
+            )
+            record_usage(attributes, self.model, response.usage)
+        return response.choices[0].message.content
+
+    async def async_send_json_prompt(self, prompt, client=None, validate=None):
+        return self.parse_json_response(await self.async_send_raw_prompt(prompt, client, self.json_validator(validate)))
+
+    async def async_send_json_prompts(self, prompts):
+        """Sends the prompts with one async client, at most `max_concurrency` at a time"""
+        return await self._async_send_json_prompts(prompts, [None] * len(prompts))
+
+    async def _async_send_json_prompts(self, prompts, validators):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with openai.AsyncOpenAI(api_key=self.api_key) as client:
+            async def send(prompt, validate):
+                async with semaphore:
+                    try:
+                        return await self.async_send_json_prompt(prompt, client, validate)
+                    except Exception as e:
+                        logger.error(f"Prompt failed: {e}", exc_info=True)
+                        return None
+            return await asyncio.gather(*(send(prompt, validate) for prompt, validate in zip(prompts, validators)))
+
+    async def async_process_recipe_part(self, part, mode="", step_number=None, context=None):
+        return await self.async_send_json_prompt(
+            self.build_prompt(part, mode, step_number, context), validate=recipe_part_validator(mode, step_number)
+        )
+
+    async def async_process_recipe_parts(self, requests):
+        return await self._async_send_json_prompts(
+            [self.build_prompt(**request) for request in requests],
+            [self._part_validator(**request) for request in requests]
+        )
+
     def get_number_of_steps(self, caption=None):
         self.initialize_chat(caption)
         prompt = (
@@ -54,7 +229,10 @@ class ChatGPTModule(AIModuleInterface):
         )
         max_attempts = 3
         for attempt in range(max_attempts):
-            raw = self.send_raw_prompt(prompt)
+            # Retries must not get the cached answer of the failed attempt back
+            raw = self.send_raw_prompt(
+                prompt, validate=lambda answer: re.search(r"\d+", answer), use_cache=attempt == 0
+            ) or ""
             # print(f"[DEBUG] get_number_of_steps attempt {attempt+1}: {raw}")
             # Nur eine reine Zahl akzeptieren
             match = re.fullmatch(r"\s*(\d+)\s*", raw)
@@ -68,6 +246,11 @@ class ChatGPTModule(AIModuleInterface):
         return None
 
     def process_recipe_part(self, part, mode="", step_number=None, context=None):
+        return self.send_json_prompt(
+            self.build_prompt(part, mode, step_number, context), validate=recipe_part_validator(mode, step_number)
+        )
+
+    def build_prompt(self, part, mode="", step_number=None, context=None):
         # Kontext einfügen
         context_str = ""
         if context:
@@ -89,6 +272,20 @@ class ChatGPTModule(AIModuleInterface):
                 f"Language: {os.getenv('LANGUAGE_CODE', 'en')}\n"
                 f"JSON template: {part}"
             )
+        elif mode == "recipe":
+            prompt = (
+                f"{context_str}"
+                f"Please respond ONLY with a valid JSON code block (```json ... ```).\n"
+                f"Fill out the complete recipe in one JSON document: 'name', 'description', 'keywords', 'steps', 'servings', 'working_time', 'waiting_time'.\n"
+                f"- 'name' should be a short, clear recipe name.\n"
+                f"- 'steps' must contain one object per step of the recipe, in order, each with the fields 'name', 'instruction', 'ingredients', 'time', 'order', 'show_as_header', 'show_ingredients_table'.\n"
+                f"- The 'name' of a step should be the step number, e.g. 'name': '1.'\n"
+                f"- 'ingredients' of a step is a list of ingredient objects. Add each ingredient only to the first step that uses it.\n"
+                f"- 'amount' must be a whole number or decimal, NOT a fraction.\n"
+                f"- 'servings', 'working_time' and 'waiting_time' (in minutes) must be whole numbers.\n"
+                f"Language: {os.getenv('LANGUAGE_CODE', 'en')}\n"
+                f"JSON template: {part}"
+            )
         elif mode == "info":
             prompt = (
                 f"{context_str}"
@@ -138,4 +335,4 @@ class ChatGPTModule(AIModuleInterface):
                 f"Language: {os.getenv('LANGUAGE_CODE', 'en')}\n"
                 f"JSON template: {part}"
             )
-        return self.send_json_prompt(prompt)
\ No newline at end of file
+        return prompt
@@ -1,30 +1,62 @@
 import os
 import re
 import json
+import time
 from bs4 import BeautifulSoup
 from logs import setup_logging
+from scrapers.cancellation import check_cancelled, remaining_time
+from scrapers.manage_browser import close_browser
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
+from tracing import span
 from .ai_module_interface import AIModuleInterface
+from .response_cache import cached_response, recipe_part_validator
+
+# Assistant messages of the conversation and the stop button shown while an answer is generated
+RESPONSE_SELECTOR = "div.VrBPSncUavA1d7C9kAc5"
+STOP_BUTTON_SELECTOR = "button rect[width='10'][height='10']"
+
+# Returns the newest assistant message once there are more than `arguments[1]`,
+# and whether the answer is still being generated
+LAST_RESPONSE_SCRIPT = """
+const nodes = document.querySelectorAll(arguments[0]);
+if (nodes.length <= arguments[1]) return null;
+return [nodes[nodes.length - 1].outerHTML, document.querySelector(arguments[2]) !== null];
+"""
 
 class DuckAIModule(AIModuleInterface):
+	# Seconds the newest message has to stay unchanged before it counts as complete
+	settle_time = 0.5
+
 	def __init__(self, browser):
 		self.browser = browser
+		self.context = None
 		self.logger = setup_logging("duck_ai")
 
+	def reset(self):
+		# The conversation can't be cleared, the next job starts a new chat in a fresh browser
+		return False
+
+	def close(self):
+		close_browser(self.browser)
+		self.browser = None
+
 	def initialize_chat(self, caption):
 		self.logger.info("Initializing chat with recipe context...")
+		self.context = caption
+		check_cancelled()
 		try:
 			textarea = WebDriverWait(self.browser, 10).until(
 				EC.presence_of_element_located((By.XPATH, "//textarea[@name='user-prompt']"))
 			)
 			context_prompt = f"I'm going to ask you questions about this recipe. Please use this recipe information as context for all your responses: {caption}"
-			textarea.send_keys(context_prompt)
-			textarea.send_keys(Keys.RETURN)
-			WebDriverWait(self.browser, 60).until(EC.presence_of_element_located((By.XPATH, "//button[@type='submit' and @disabled]")))
-			WebDriverWait(self.browser, 60).until_not(EC.presence_of_element_located((By.XPATH, "//button//rect[@width='10' and @height='10']")))
+			with span("ai.prompt", module="duck_ai", kind="context"):
+				previous_count = self.count_responses()
+				textarea.send_keys(context_prompt)
+				textarea.send_keys(Keys.RETURN)
+				self.wait_for_response(previous_count)
 			self.logger.info("Chat initialized successfully with recipe context")
 			return True
 		except Exception as e:
@@ -32,7 +64,14 @@ class DuckAIModule(AIModuleInterface):
 			return False
 
 	def send_raw_prompt(self, prompt):
+		with span("ai.prompt", module="duck_ai") as attributes:
+			response = self._send_raw_prompt(prompt)
+			attributes["answered"] = response is not None
+		return response
+
+	def _send_raw_prompt(self, prompt):
 		self.logger.info(f"Sending raw prompt: {prompt[:50]}...")
+		check_cancelled()
 		try:
 			textarea = WebDriverWait(self.browser, 15).until(
 				EC.presence_of_element_located((By.XPATH, "//textarea[@name='user-prompt']"))
@@ -40,19 +79,52 @@ class DuckAIModule(AIModuleInterface):
 			WebDriverWait(self.browser, 15).until(
 				EC.element_to_be_clickable((By.XPATH, "//textarea[@name='user-prompt']"))
 			)
+			previous_count = self.count_responses()
 			textarea.clear()
 			textarea.send_keys(prompt)
 			textarea.send_keys(Keys.RETURN)
-			WebDriverWait(self.browser, 60).until(
-				EC.element_to_be_clickable((By.XPATH, "//textarea[@name='user-prompt']"))
-			)
+			response = self.wait_for_response(previous_count)
 			self.logger.info("Response generation completed")
-			response = self.browser.page_source
 			return response
 		except Exception as e:
 			self.logger.error(f"Failed to send prompt: {e}", exc_info=True)
 			return None
 
+	def count_responses(self):
+		return self.browser.execute_script("return document.querySelectorAll(arguments[0]).length;", RESPONSE_SELECTOR)
+
+	def wait_for_response(self, previous_count, timeout=60):
+		"""
+		Waits for the answer to the prompt that was just sent by watching only
+		the newest assistant message instead of re-reading the whole page.
+		Stops waiting when the job is cancelled or reaches its deadline.
+
+		Args:
+			previous_count (int): Number of assistant messages before the prompt was sent.
+			timeout (float): Maximum number of seconds to wait.
+
+		Returns:
+			str: The HTML of the newest assistant message.
+		"""
+		state = {"html": None, "changed_at": 0.0}
+
+		def response_complete(browser):
+			check_cancelled()
+			result = browser.execute_script(LAST_RESPONSE_SCRIPT, RESPONSE_SELECTOR, previous_count, STOP_BUTTON_SELECTOR)
+			if not result:
+				return False
+			html, generating = result
+			now = time.monotonic()
+			if html != state["html"]:
+				state["html"] = html
+				state["changed_at"] = now
+				return False
+			if generating or now - state["changed_at"] < self.settle_time:
+				return False
+			return html
+
+		return WebDriverWait(self.browser, remaining_time(timeout), poll_frequency=0.25).until(response_complete)
+
 	def extract_json_from_response(self, response):
 		if not response:
 			return None
@@ -69,14 +141,30 @@ class DuckAIModule(AIModuleInterface):
 			self.logger.error(f"Failed to extract JSON: {e}", exc_info=True)
 			return None
 
-	def send_json_prompt(self, prompt):
-		response = self.send_raw_prompt(prompt)
-		return self.extract_json_from_response(response)
+	def build_messages(self, prompt):
+		# Cache key material, the chat itself only ever sees the prompts
+		return [
+			{"role": "system", "content": f"Recipe context: {self.context}"},
+			{"role": "user", "content": prompt},
+		]
+
+	def send_json_prompt(self, prompt, validate=None):
+		def send():
+			response = self.send_raw_prompt(prompt)
+			return self.extract_json_from_response(response)
+		return cached_response("duck.ai", self.build_messages(prompt), send, self.use_response_cache, validate)
 
 	def get_number_of_steps(self, caption=None):
 		self.logger.info("Getting number of recipe steps...")
 		try:
 			prompt = "How many steps are in this recipe? Please respond with only a number."
+			return cached_response("duck.ai", self.build_messages(prompt), lambda: self._ask_number_of_steps(prompt), self.use_response_cache)
+		except Exception as e:
+			self.logger.error(f"Error in get_number_of_steps: {e}", exc_info=True)
+			return None
+
+	def _ask_number_of_steps(self, prompt):
+		try:
 			response = self.send_raw_prompt(prompt)
 			if response:
 				soup = BeautifulSoup(response, 'html.parser')
@@ -107,6 +195,8 @@ class DuckAIModule(AIModuleInterface):
 		try:
 			if mode == "step" or step_number is not None:
 				prompt = f"Write your Response in the language {os.getenv('LANGUAGE_CODE', 'en')}. Please fill out this JSON document {part}. Only complete the specified sections. Only complete step {step_number} of the recipe. If the step has more than 3 ingredients, only complete the first 3 and finish the JSON object. The name of the step should be the step number e.g. 'name': '{step_number}.'. Only include the current instruction description in the instruction field. The amount value of the ingredient can only be a whole number or a decimal NOT A FRACTION (convert it to a decimal). If an ingredient has already been mentioned in a previous step, do not include it again as an ingredient in this step. Respond with a JSON code block enclosed in triple backticks (```json)."
+			elif mode == "recipe":
+				prompt = f"Write your Response in the language {os.getenv('LANGUAGE_CODE', 'en')}. Please fill out this JSON document {part} for the complete recipe. Add one object per step of the recipe to the 'steps' list, in order. The name of each step should be the step number e.g. 'name': '1.'. Add each ingredient only to the first step that uses it. The amount value of the ingredient can only be a whole number or a decimal NOT A FRACTION (convert it to a decimal). servings, working_time and waiting_time (in minutes) must be whole numbers. Respond with a JSON code block enclosed in triple backticks (```json)."
 			elif mode == "info":
 				prompt = f"Write your Response in the language {os.getenv('LANGUAGE_CODE', 'en')}. Please fill out this JSON document {part} Only fill out author, description, recipeYield, prepTime and cooktime. The cooktime and pretime should have the format e.g. PT1H for one hour or PT15M for 15 Minutes."
 			elif mode == "ingredients":
@@ -119,7 +209,7 @@ class DuckAIModule(AIModuleInterface):
 				prompt = f"Write your Response in the language {os.getenv('LANGUAGE_CODE', 'en')}. Please fill out this JSON document {part} Write the instruction as one long string. No string separation, just one long text! Don't add ingredients here. JSON FORMAT IN CODE WINDOW!"
 			else:
 				prompt = f"Write your Response in the language {os.getenv('LANGUAGE_CODE', 'en')}. Please fill out this JSON document {part}. Only complete the specified sections of the document. Ensure the response is formatted as a JSON code block enclosed in triple backticks (```json)."
-			result = self.send_json_prompt(prompt)
+			result = self.send_json_prompt(prompt, recipe_part_validator(mode, step_number))
 			if result:
 				self.logger.info(f"{mode if mode else 'General'} data processed successfully")
 				return result
@@ -0,0 +1,30 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Spaces out calls so that no more than `requests_per_minute` start per minute.
+    Shared by all threads that send prompts through the same module.
+    """
+
+    def __init__(self, requests_per_minute=0):
+        """
+        Args:
+            requests_per_minute (float): Allowed request rate, 0 disables the limit.
+        """
+        self.interval = 60.0 / requests_per_minute if requests_per_minute and requests_per_minute > 0 else 0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        """Block until the caller may send its next request"""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
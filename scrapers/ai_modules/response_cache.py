@@ -0,0 +1,179 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from logs import setup_logging
+from scrapers.scraper_modules.tandoor_schema import validate_recipe, validate_step
+from scrapers.sqlite_cache import SQLiteCache
+
+logger = setup_logging("response_cache")
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "instance", "ai_response_cache.db"
+)
+
+
+class ResponseCache:
+    """
+    Two tier cache for LLM responses: an in-memory LRU in front of an
+    optional persistent SQLite store. Keys are hashes of the model name and
+    the full message list, so identical prompts in retries, re-imports or
+    imports to both Tandoor and Mealie are only paid for once.
+    """
+
+    def __init__(self, max_memory_entries=256, disk_cache=None):
+        """
+        Args:
+            max_memory_entries (int): Size of the in-memory LRU.
+            disk_cache (SQLiteCache, optional): Persistent second tier.
+        """
+        self.max_memory_entries = max_memory_entries
+        self.disk_cache = disk_cache
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    @staticmethod
+    def make_key(model, messages):
+        payload = json.dumps([model, messages], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return self._memory[key]
+
+        value = None
+        if self.disk_cache is not None:
+            try:
+                value = self.disk_cache.get(key)
+            except Exception as e:
+                logger.error(f"Failed to read response cache: {e}")
+
+        with self._lock:
+            if value is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+        self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        self._remember(key, value)
+        if self.disk_cache is not None:
+            try:
+                self.disk_cache.set(key, value)
+            except Exception as e:
+                logger.error(f"Failed to write response cache: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else None
+        return stats
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """
+    Returns the shared response cache, or None if it is disabled (AI_RESPONSE_CACHE=false).
+    AI_RESPONSE_CACHE_DISK=false keeps it in memory only.
+    """
+    global _cache
+    if os.getenv("AI_RESPONSE_CACHE", "true").lower() != "true":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            disk_cache = None
+            if os.getenv("AI_RESPONSE_CACHE_DISK", "true").lower() == "true":
+                disk_cache = SQLiteCache(
+                    os.getenv("AI_RESPONSE_CACHE_PATH", DEFAULT_CACHE_PATH),
+                    table="ai_responses",
+                    ttl=float(os.getenv("AI_RESPONSE_CACHE_TTL", 7 * 24 * 3600)),
+                    max_entries=int(os.getenv("AI_RESPONSE_CACHE_MAX_ENTRIES", 5000))
+                )
+            _cache = ResponseCache(
+                max_memory_entries=int(os.getenv("AI_RESPONSE_CACHE_MEMORY_ENTRIES", 256)),
+                disk_cache=disk_cache
+            )
+    return _cache
+
+def cached_response(model, messages, send, use_cache=True, validate=None):
+    """
+    Returns the cached response for the messages or calls `send` and caches its result.
+
+    Args:
+        model (str): Name of the model (part of the cache key).
+        messages (list): The full message list sent to the model.
+        send (callable): Function performing the actual request.
+        use_cache (bool): False skips the lookup but still stores the fresh response.
+        validate (callable, optional): Called with the fresh response, only responses
+            it accepts are cached. Without it every response but None is cached.
+
+    Returns:
+        The (cached) response.
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return send()
+    key = cache.make_key(model, messages)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            logger.info("Using cached AI response")
+            return cached
+    response = send()
+    _store(cache, key, response, validate)
+    return response
+
+async def async_cached_response(model, messages, send, use_cache=True, validate=None):
+    """Async variant of `cached_response`, `send` returns an awaitable"""
+    cache = get_response_cache()
+    if cache is None:
+        return await send()
+    key = cache.make_key(model, messages)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            logger.info("Using cached AI response")
+            return cached
+    response = await send()
+    _store(cache, key, response, validate)
+    return response
+
+def _store(cache, key, response, validate):
+    if response is None:
+        return
+    if validate is not None and not validate(response):
+        # A bad answer would be replayed by every retry and re-import until it expires
+        logger.info("Not caching AI response that failed validation")
+        return
+    cache.set(key, response)
+
+def recipe_part_validator(mode="", step_number=None):
+    """
+    Returns the check the parsed answer to a recipe part prompt has to pass
+    to be cached, or None if any JSON answer will do.
+    """
+    if mode == "recipe":
+        # Validation normalizes the recipe in place, check a copy
+        return lambda result: not any(validate_recipe(copy.deepcopy(result))[1].values())
+    if mode == "step" or step_number is not None:
+        return lambda result: validate_step(copy.deepcopy(result))
+    return None
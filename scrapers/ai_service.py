@@ -1,45 +1,186 @@
-
 import os
+import threading
+import time
+from contextlib import contextmanager
 from logs import setup_logging
 from scrapers.ai_modules.duck_ai import DuckAIModule
 from scrapers.ai_modules.chat_gpt import ChatGPTModule
+from scrapers.cache_control import cache_bypassed
+from scrapers.cancellation import check_cancelled, remaining_time
+from scrapers.manage_browser import open_browser
 
 logger = setup_logging("ai_service")
 
 def get_ai_module():
     module_name = os.getenv("AI_MODULE", "duck_ai")
     if module_name == "duck_ai":
-        from selenium import webdriver
-        browser = webdriver.Chrome()
+        browser = open_browser()
+        if not browser:
+            raise RuntimeError("Failed to open Duck.ai browser")
         return DuckAIModule(browser)
     elif module_name == "openai":
         return ChatGPTModule()
     else:
         raise ValueError(f"Unknown AI module: {module_name}")
 
-ai_module = None
 
-def initialize_ai_module():
-    global ai_module
-    if ai_module is None:
-        ai_module = get_ai_module()
+class AISessionTimeout(Exception):
+    """Raised when no AI session could be checked out in time"""
+
+
+class AISessionPool:
+    """
+    Pool of AI module instances. Every job checks out its own instance, so the
+    recipe context (and for Duck.ai the browser tab) is never shared between
+    jobs running in parallel.
+    """
+
+    def __init__(self, factory, size=2, acquire_timeout=300):
+        """
+        Args:
+            factory (callable): Function returning a new AI module.
+            size (int): Maximum number of sessions alive at the same time.
+            acquire_timeout (float): Seconds to wait for a free session.
+        """
+        self.factory = factory
+        self.size = max(1, size)
+        self.acquire_timeout = acquire_timeout
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = []
+        self._in_use = 0
+
+    def acquire(self, timeout=None):
+        """
+        Args:
+            timeout (float, optional): Seconds to wait for a session, at most `acquire_timeout`.
+        """
+        timeout = self.acquire_timeout if timeout is None else min(timeout, self.acquire_timeout)
+        deadline = time.monotonic() + timeout
+        with self._available:
+            while not self._idle and self._in_use >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise AISessionTimeout(f"No AI session available after {timeout:g}s")
+                self._available.wait(remaining)
+            module = self._idle.pop() if self._idle else None
+            self._in_use += 1
+
+        if module is None:
+            try:
+                logger.info("Creating new AI session")
+                module = self.factory()
+            except BaseException:
+                # Includes jobs cancelled while the factory opens a browser
+                with self._available:
+                    self._in_use -= 1
+                    self._available.notify()
+                raise
+        return module
+
+    def release(self, module, discard=False):
+        keep = False
+        if not discard:
+            try:
+                keep = module.reset()
+            except Exception as e:
+                logger.error(f"Failed to reset AI session: {e}")
+        if not keep:
+            try:
+                module.close()
+            except Exception as e:
+                logger.error(f"Failed to close AI session: {e}")
+
+        with self._available:
+            self._in_use -= 1
+            if keep:
+                self._idle.append(module)
+            self._available.notify()
+
+    def stats(self):
+        with self._lock:
+            return {"idle": len(self._idle), "in_use": self._in_use, "size": self.size}
+
+
+_session_pool = None
+_session_pool_lock = threading.Lock()
+_current = threading.local()
+
+def get_session_pool():
+    global _session_pool
+    with _session_pool_lock:
+        if _session_pool is None:
+            _session_pool = AISessionPool(
+                get_ai_module,
+                size=int(os.getenv("AI_SESSION_POOL_SIZE", os.getenv("EXTRACT_WORKERS", os.getenv("WORKER_COUNT", 2)))),
+                acquire_timeout=float(os.getenv("AI_SESSION_TIMEOUT", 300))
+            )
+    return _session_pool
+
+@contextmanager
+def ai_session():
+    """
+    Checks out an AI session for the current thread. All module level prompt
+    functions called inside the block use this session.
+
+    Yields:
+        AIModuleInterface: The AI module of this session.
+    """
+    existing = getattr(_current, "module", None)
+    if existing is not None:
+        # Nested blocks share the session of the outer block
+        yield existing
+        return
+
+    check_cancelled()
+    pool = get_session_pool()
+    module = pool.acquire(timeout=remaining_time())
+    module.use_response_cache = not cache_bypassed()
+    _current.module = module
+    failed = False
+    try:
+        yield module
+    except BaseException:
+        # Also drops sessions left in the middle of a prompt by a cancelled job
+        failed = True
+        raise
+    finally:
+        _current.module = None
+        pool.release(module, discard=failed)
+
+def get_current_module():
+    module = getattr(_current, "module", None)
+    if module is None:
+        raise RuntimeError("No AI session checked out, wrap the call in `with ai_session():`")
+    return module
 
 def initialize_chat(caption):
-    initialize_ai_module()
-    return ai_module.initialize_chat(caption)
+    return get_current_module().initialize_chat(caption)
 
 def send_raw_prompt(prompt):
-    initialize_ai_module()
-    return ai_module.send_raw_prompt(prompt)
+    return get_current_module().send_raw_prompt(prompt)
 
 def send_json_prompt(prompt):
-    initialize_ai_module()
-    return ai_module.send_json_prompt(prompt)
+    return get_current_module().send_json_prompt(prompt)
 
 def get_number_of_steps(caption=None):
-    initialize_ai_module()
-    return ai_module.get_number_of_steps(caption)
+    return get_current_module().get_number_of_steps(caption)
 
 def process_recipe_part(part, mode="", step_number=None, context=None):
-    initialize_ai_module()
-    return ai_module.process_recipe_part(part, mode, step_number, context)
\ No newline at end of file
+    return get_current_module().process_recipe_part(part, mode, step_number, context)
+
+def process_recipe_parts(requests, on_result=None):
+    """
+    Processes several independent recipe parts and returns the results in order.
+    Modules that can answer prompts concurrently do so, the others process
+    them one by one.
+
+    Args:
+        requests (list): Keyword arguments for `process_recipe_part`, one dict per part.
+        on_result (callable, optional): Called with the index and the result of
+            every part as soon as it is done, in the calling thread.
+
+    Returns:
+        list: The result of each part, None for parts that failed.
+    """
+    return get_current_module().process_recipe_parts(requests, on_result)
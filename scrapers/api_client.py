@@ -0,0 +1,178 @@
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from logs import setup_logging
+
+logger = setup_logging("api_client")
+
+# Methods that can be sent twice without creating a second resource
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+RETRY_STATUS_CODES = {500, 502, 503, 504}
+
+
+def _request_not_sent(exc):
+    """True if the connection failed before any part of the request reached the server"""
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.exceptions.ConnectionError):
+        reason = exc.args[0] if exc.args else None
+        return isinstance(getattr(reason, "reason", reason), NewConnectionError)
+    return False
+
+
+class RecipeAPIClient:
+    """
+    HTTP client for a single Tandoor or Mealie instance.
+
+    Connections are kept alive and reused across jobs, every request has a
+    connect and read timeout and at most `max_concurrency` requests are sent
+    to the target at the same time. Failed requests are retried with jittered
+    exponential backoff. Requests that are not idempotent (creating a recipe)
+    are only retried if they never reached the server, so a slow or failing
+    server can't end up with duplicate recipes.
+    """
+
+    def __init__(self, base_url, token, connect_timeout=5, read_timeout=60,
+                 max_retries=3, backoff_base=0.5, backoff_max=10, max_concurrency=4):
+        """
+        Args:
+            base_url (str): Base URL of the API, e.g. https://tandoor.example.com
+            token (str): Bearer token sent with every request.
+            connect_timeout (float): Seconds to wait for a connection.
+            read_timeout (float): Seconds to wait for the response.
+            max_retries (int): Number of retries after the first attempt.
+            backoff_base (float): Delay before the first retry, doubled for every further retry.
+            backoff_max (float): Upper bound for the delay between retries.
+            max_concurrency (int): Maximum number of requests in flight to this target.
+        """
+        self.base_url = (base_url or "").rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency = max(1, max_concurrency)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "failures": 0}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+
+    def request(self, method, path, idempotent=None, **kwargs):
+        """
+        Sends a request to the target and retries it if that is safe.
+
+        Args:
+            method (str): HTTP method.
+            path (str): Path relative to the base URL.
+            idempotent (bool, optional): Whether the request may be repeated
+                after it reached the server. Defaults to the HTTP semantics of `method`.
+            **kwargs: Passed on to `requests.Session.request`. Bodies have to
+                be bytes or JSON so they can be sent again.
+
+        Returns:
+            requests.Response: The last response received.
+
+        Raises:
+            requests.exceptions.RequestException: If the last attempt failed without a response.
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        kwargs.setdefault("timeout", self.timeout)
+        url = f"{self.base_url}{path}"
+
+        attempt = 0
+        while True:
+            with self._slots:
+                self._count("requests")
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except requests.exceptions.RequestException as e:
+                    retry = (idempotent or _request_not_sent(e)) and not isinstance(e, requests.exceptions.InvalidURL)
+                    if not retry or attempt >= self.max_retries:
+                        self._count("failures")
+                        raise
+                    logger.warning(f"{method} {url} failed ({e}), retrying")
+                else:
+                    if not (idempotent and response.status_code in RETRY_STATUS_CODES) or attempt >= self.max_retries:
+                        return response
+                    logger.warning(f"{method} {url} returned {response.status_code}, retrying")
+                    response.close()
+
+            attempt += 1
+            self._count("retries")
+            time.sleep(self._backoff(attempt))
+
+    def _backoff(self, attempt):
+        # Full jitter: a random delay up to the exponential bound
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def stats(self):
+        with self._stats_lock:
+            return {**self._stats, "max_concurrency": self.max_concurrency}
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_api_client(api_type):
+    """
+    Returns the shared client for the Tandoor or Mealie instance configured
+    via BASE_URL_<API_TYPE> and TOKEN_<API_TYPE>.
+
+    Args:
+        api_type (str): "TANDOOR" or "MEALIE"
+
+    Returns:
+        RecipeAPIClient: The client of this target.
+    """
+    api_type = api_type.upper()
+    base_url = os.getenv(f"BASE_URL_{api_type}")
+    token = os.getenv(f"TOKEN_{api_type}")
+    key = (api_type, base_url, token)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = RecipeAPIClient(
+                base_url,
+                token,
+                connect_timeout=float(os.getenv("API_CONNECT_TIMEOUT", 5)),
+                read_timeout=float(os.getenv("API_READ_TIMEOUT", 60)),
+                max_retries=int(os.getenv("API_MAX_RETRIES", 3)),
+                backoff_base=float(os.getenv("API_BACKOFF_BASE", 0.5)),
+                backoff_max=float(os.getenv("API_BACKOFF_MAX", 10)),
+                max_concurrency=int(os.getenv("API_MAX_CONCURRENCY", 4))
+            )
+            _clients[key] = client
+    return client
+
+def get_api_client_stats():
+    """Returns the request counters of every client created so far, keyed by API type"""
+    with _clients_lock:
+        return {key[0].lower(): client.stats() for key, client in _clients.items()}
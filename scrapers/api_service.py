@@ -33,34 +33,31 @@ def validate_tandoor_payload(payload, source_url=None):
     if not payload["name"]:
         payload["name"] = "Unbenanntes Rezept"
     return payload
-import json
-import os
-from io import BytesIO
 
 import requests as request
-from PIL import Image
 
 from logs import setup_logging
+from scrapers.api_client import get_api_client
+from scrapers.cancellation import check_cancelled
+from scrapers.progress import report_progress
+from tracing import span
 
 logger = setup_logging("recipe_api")
 
-def send_recipe(api_type, json_data, thumbnail_filename):
+def send_recipe(api_type, json_data, thumbnail):
     """
     Unified function to send a recipe to either Tandoor or Mealie API
     
     Args:
         api_type (str): Type of API to use ("tandoor" or "mealie")
         json_data (dict): Recipe data in JSON format
-        thumbnail_filename (str): Path to thumbnail image file
+        thumbnail (Thumbnail, optional): Encoded thumbnail image
         
     Returns:
         dict: Response information with status and recipe ID
     """
     api_type = api_type.upper()
     
-    # Set up API-specific parameters
-    base_url = os.getenv(f"BASE_URL_{api_type}")
-    token = os.getenv(f"TOKEN_{api_type}")
     api_logger = setup_logging(f"{api_type.lower()}_api")
     
     # Set up API-specific endpoints and behavior
@@ -105,26 +102,29 @@ def send_recipe(api_type, json_data, thumbnail_filename):
         api_logger.error(f"Unknown API type: {api_type}")
         return {"status": "error", "error": f"Unknown API type: {api_type}"}
 
-    # Common headers for both APIs
-    headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+    # Shared client with keep-alive connections, timeouts and retries for this target
+    client = get_api_client(api_type)
+    # Last check point of a job: once the recipe is created, the upload is finished
+    check_cancelled()
 
     try:
-        response = request.post(f'{base_url}{create_endpoint}', 
-                              json=json_data, 
-                              headers=headers)
+        with span("recipe.post", target=api_type.lower()) as attributes:
+            response = client.post(create_endpoint, json=json_data)
+            attributes["status_code"] = response.status_code
         api_logger.info(f"[DEBUG] Response status code: {response.status_code}")
         # Extract recipe ID
         recipe_id = extract_id(response)
         api_logger.info(f"{api_type} Recipe ID: {recipe_id}")
+        if recipe_id and response.ok:
+            report_progress("recipe_created", recipe_id=recipe_id)
         # Upload thumbnail if available
-        api_logger.info(f"Thumbnail File: {thumbnail_filename}")
-        api_logger.info(f"Path exists: {os.path.exists(thumbnail_filename)}")
+        api_logger.info(f"Thumbnail: {thumbnail}")
         
-        if thumbnail_filename and recipe_id and os.path.exists(thumbnail_filename):
+        if thumbnail and recipe_id:
             if api_type == "TANDOOR":
-                upload_tandoor_thumbnail(base_url, token, recipe_id, thumbnail_filename, api_logger)
+                upload_tandoor_thumbnail(client, recipe_id, thumbnail, api_logger)
             else:
-                upload_mealie_thumbnail(base_url, token, recipe_id, thumbnail_filename, api_logger)
+                upload_mealie_thumbnail(client, recipe_id, thumbnail, api_logger)
         response.raise_for_status()
         return {
             "status": "success",
@@ -152,84 +152,59 @@ def send_recipe(api_type, json_data, thumbnail_filename):
         api_logger.info('Done.')
 
 
-def upload_tandoor_thumbnail(base_url, token, recipe_id, thumbnail_filename, logger):
+def upload_tandoor_thumbnail(client, recipe_id, thumbnail, logger):
     """
     Upload a thumbnail image to an existing Tandoor recipe
     """
-    logger.info(f"[DEBUG] upload_tandoor_thumbnail called with base_url={base_url}, token={token}, recipe_id={recipe_id}, thumbnail_filename={thumbnail_filename}")
-    headers = {'Authorization': f'Bearer {token}'}
+    logger.info(f"[DEBUG] upload_tandoor_thumbnail called with base_url={client.base_url}, recipe_id={recipe_id}, thumbnail={thumbnail}")
     try:
-        logger.info(f"[DEBUG] Opening image file: {thumbnail_filename}")
-        # Open and optimize the image
-        with Image.open(thumbnail_filename) as img:
-            logger.info(f"[DEBUG] Image opened. Mode: {img.mode}, Size: {img.size}")
-            # Convert to RGB if needed (in case of PNG with alpha channel)
-            if img.mode in ('RGBA', 'LA'):
-                logger.info("[DEBUG] Converting image to RGB due to alpha channel.")
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                background.paste(img, mask=img.split()[3])  # 3 is the alpha channel
-                img = background
-            # Save to a BytesIO object
-            img_byte_arr = BytesIO()
-            img.save(img_byte_arr, format='JPEG', quality=85)
-            img_byte_arr.seek(0)
-            logger.info(f"[DEBUG] Image converted and saved to BytesIO.")
-            # Create the multipart form data
-            files = {
-                'image': (os.path.basename(thumbnail_filename), img_byte_arr, 'image/jpeg')
-            }
-            logger.info(f"[DEBUG] Sending PUT request to {base_url}/api/recipe/{recipe_id}/image/")
-            # Send the request to the specific image endpoint
-            response = request.put(
-                f'{base_url}/api/recipe/{recipe_id}/image/',
-                files=files,
-                headers=headers
-            )
-            logger.info(f"[DEBUG] PUT response status: {response.status_code}")
-            logger.info(f"[DEBUG] PUT response text: {response.text}")
-            response.raise_for_status()
-            logger.info(f"Successfully uploaded thumbnail for Tandoor recipe {recipe_id}")
+        # The thumbnail is already scaled and encoded, send the bytes as they are
+        files = {
+            'image': (thumbnail.filename, thumbnail.data, thumbnail.content_type)
+        }
+        logger.info(f"[DEBUG] Sending PUT request to {client.base_url}/api/recipe/{recipe_id}/image/")
+        # Send the request to the specific image endpoint
+        with span("image.put", target="tandoor", bytes=len(thumbnail.data)) as attributes:
+            response = client.put(f'/api/recipe/{recipe_id}/image/', files=files)
+            attributes["status_code"] = response.status_code
+        logger.info(f"[DEBUG] PUT response status: {response.status_code}")
+        logger.info(f"[DEBUG] PUT response text: {response.text}")
+        response.raise_for_status()
+        logger.info(f"Successfully uploaded thumbnail for Tandoor recipe {recipe_id}")
+        report_progress("thumbnail_uploaded")
     except Exception as e:
         logger.error(f"[DEBUG] Failed to upload thumbnail: {e}")
-        logger.error(f"Thumbnail path: {thumbnail_filename}")
+        logger.error(f"Thumbnail: {thumbnail}")
         logger.error(f"Recipe ID: {recipe_id}")
 
 
-def upload_mealie_thumbnail(base_url, token, recipe_slug, thumbnail_filename, logger):
+def upload_mealie_thumbnail(client, recipe_slug, thumbnail, logger):
     """
     Upload a thumbnail image to an existing Mealie recipe
     """
-    headers = {'Authorization': f'Bearer {token}'}
-    
     try:
-        # Get file extension
-        _, extension = os.path.splitext(thumbnail_filename)
-        extension = extension.lstrip('.').lower()
-        
         # Clean up the recipe slug - remove quotes if present
         recipe_slug = recipe_slug.strip('"\'')
         
         # Prepare the files for upload
-        with open(thumbnail_filename, 'rb') as img_file:
-            files = {
-                'image': (f'image.{extension}', img_file, f'image/{extension}'),
-                'extension': (None, extension)
-            }
-            
-            # Send the request
-            response = request.put(
-                f'{base_url}/api/recipes/{recipe_slug}/image',
-                files=files,
-                headers=headers
-            )
+        files = {
+            'image': (f'image.{thumbnail.extension}', thumbnail.data, thumbnail.content_type),
+            'extension': (None, thumbnail.extension)
+        }
             
-            logger.info(f"Image upload response status: {response.status_code}")
-            if response.text:
-                logger.info(f"Image upload response: {response.text}")
-            response.raise_for_status()
-            logger.info(f"Successfully uploaded thumbnail for Mealie recipe {recipe_slug}")
+        # Send the request
+        with span("image.put", target="mealie", bytes=len(thumbnail.data)) as attributes:
+            response = client.put(f'/api/recipes/{recipe_slug}/image', files=files)
+            attributes["status_code"] = response.status_code
+        
+        logger.info(f"Image upload response status: {response.status_code}")
+        if response.text:
+            logger.info(f"Image upload response: {response.text}")
+        response.raise_for_status()
+        logger.info(f"Successfully uploaded thumbnail for Mealie recipe {recipe_slug}")
+        report_progress("thumbnail_uploaded")
             
     except Exception as e:
         logger.error(f"Failed to upload thumbnail: {e}")
-        logger.error(f"Thumbnail path: {thumbnail_filename}")
+        logger.error(f"Thumbnail: {thumbnail}")
         logger.error(f"Recipe slug: {recipe_slug}")
\ No newline at end of file
@@ -0,0 +1,192 @@
+import threading
+import time
+
+from logs import setup_logging
+
+logger = setup_logging("browser_pool")
+
+
+class BrowserPoolTimeout(Exception):
+    """Raised when no browser could be checked out in time"""
+
+
+class _PooledBrowser:
+    def __init__(self, browser):
+        self.browser = browser
+        self.uses = 0
+        self.last_used = time.monotonic()
+
+
+class BrowserPool:
+    """
+    Keeps a number of warm Selenium browsers around so that every caption
+    fetch or AI chat doesn't pay for a browser cold start.
+
+    Browsers are reset (cookies, storage, blank page) when they are returned,
+    recycled after `max_uses` checkouts and closed after `idle_timeout`
+    seconds without use.
+    """
+
+    def __init__(self, factory, size=2, max_uses=20, idle_timeout=300, acquire_timeout=120):
+        """
+        Args:
+            factory (callable): Function returning a new WebDriver instance.
+            size (int): Maximum number of browsers alive at the same time.
+            max_uses (int): Checkouts after which a browser is replaced.
+            idle_timeout (float): Seconds after which an idle browser is closed.
+            acquire_timeout (float): Seconds to wait for a free browser.
+        """
+        self.factory = factory
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = []
+        self._in_use = {}
+        self._reaper = None
+        self._closed = False
+
+    def acquire(self, timeout=None):
+        """
+        Check out a healthy browser, launching a new one if the pool has room.
+
+        Args:
+            timeout (float, optional): Seconds to wait for a browser, at most `acquire_timeout`.
+
+        Returns:
+            WebDriver: A browser on a blank page.
+
+        Raises:
+            BrowserPoolTimeout: If all browsers stay busy for the timeout.
+        """
+        self._start_reaper()
+        timeout = self.acquire_timeout if timeout is None else min(timeout, self.acquire_timeout)
+        deadline = time.monotonic() + timeout
+
+        with self._available:
+            while not self._idle and len(self._in_use) >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise BrowserPoolTimeout(f"No browser available after {timeout:g}s")
+                self._available.wait(remaining)
+
+            entry = self._idle.pop() if self._idle else None
+            # Reserve the slot while the browser is launched outside of the lock
+            placeholder = object()
+            self._in_use[id(placeholder)] = placeholder
+
+        try:
+            if entry is None:
+                logger.info("Launching new pooled browser")
+                entry = _PooledBrowser(self.factory())
+            elif not self._is_healthy(entry.browser):
+                logger.info("Pooled browser failed health check, replacing it")
+                self._quit(entry.browser)
+                entry = _PooledBrowser(self.factory())
+        except Exception:
+            with self._available:
+                self._in_use.pop(id(placeholder), None)
+                self._available.notify()
+            raise
+
+        with self._available:
+            self._in_use.pop(id(placeholder), None)
+            entry.uses += 1
+            self._in_use[id(entry.browser)] = entry
+        return entry.browser
+
+    def release(self, browser, discard=False):
+        """
+        Return a browser to the pool.
+
+        Args:
+            browser (WebDriver): A browser obtained from `acquire`.
+            discard (bool): Close the browser instead of reusing it.
+        """
+        with self._available:
+            entry = self._in_use.pop(id(browser), None)
+
+        if entry is None:
+            logger.warning("Releasing a browser that is not managed by the pool, closing it")
+            self._quit(browser)
+            return
+
+        keep = not discard and not self._closed and entry.uses < self.max_uses and self._reset(browser)
+        if not keep:
+            logger.info(f"Closing pooled browser after {entry.uses} uses")
+            self._quit(browser)
+
+        with self._available:
+            if keep:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+            self._available.notify()
+
+    def evict_idle(self):
+        """Close browsers that have been idle for longer than `idle_timeout`"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [e for e in self._idle if now - e.last_used > self.idle_timeout]
+            self._idle = [e for e in self._idle if e not in expired]
+        for entry in expired:
+            logger.info("Closing idle pooled browser")
+            self._quit(entry.browser)
+
+    def stats(self):
+        """Returns a snapshot of idle and checked out browser counts"""
+        with self._lock:
+            return {"idle": len(self._idle), "in_use": len(self._in_use), "size": self.size}
+
+    def close_all(self):
+        """Close all idle browsers and stop handing out new ones"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for entry in idle:
+            self._quit(entry.browser)
+
+    def _start_reaper(self):
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_loop, name="browser-pool-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        interval = max(5, min(60, self.idle_timeout / 2))
+        while not self._closed:
+            time.sleep(interval)
+            try:
+                self.evict_idle()
+            except Exception as e:
+                logger.error(f"Error evicting idle browsers: {e}")
+
+    @staticmethod
+    def _is_healthy(browser):
+        try:
+            browser.current_url
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _reset(browser):
+        """Clear cookies and storage of the last visited site and park the browser on a blank page"""
+        try:
+            browser.delete_all_cookies()
+            browser.execute_script("try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}")
+            browser.get("about:blank")
+            return True
+        except Exception as e:
+            logger.info(f"Failed to reset pooled browser: {e}")
+            return False
+
+    @staticmethod
+    def _quit(browser):
+        try:
+            browser.quit()
+        except Exception as e:
+            logger.error(f"Error closing browser: {e}")
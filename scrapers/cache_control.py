@@ -0,0 +1,21 @@
+import threading
+from contextlib import contextmanager
+
+_state = threading.local()
+
+@contextmanager
+def bypass_cache():
+    """
+    Makes all cache lookups of the current thread miss, e.g. to re-import a
+    recipe from scratch. Fresh results are still written to the caches.
+    """
+    previous = getattr(_state, "bypass", False)
+    _state.bypass = True
+    try:
+        yield
+    finally:
+        _state.bypass = previous
+
+def cache_bypassed():
+    """Returns True if cache lookups are disabled for the current thread"""
+    return getattr(_state, "bypass", False)
@@ -0,0 +1,100 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current_token = ContextVar("cancel_token", default=None)
+
+
+class JobCancelled(BaseException):
+    """
+    Raised at the next check point of a cancelled job. Like
+    asyncio.CancelledError it's no Exception, so the `except Exception`
+    blocks that turn failed prompts into None don't swallow it.
+    """
+
+
+class JobTimedOut(JobCancelled):
+    """Raised at the next check point of a job that ran past its deadline"""
+
+
+class CancelToken:
+    """
+    Cancellation state of one job, shared by all of its stages. Jobs stop
+    cooperatively: the token is checked between prompts and before
+    browsers, AI sessions and uploads are used, running calls are never killed.
+    """
+
+    def __init__(self, timeout=None):
+        """
+        Args:
+            timeout (float, optional): Seconds the job may run, None for no deadline.
+        """
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def remaining(self):
+        """Returns the seconds left until the deadline, None without a deadline"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def error(self):
+        """
+        Returns:
+            JobCancelled or None: The exception to stop the job with, None if it may go on.
+        """
+        if self.cancelled:
+            return JobCancelled("Job was cancelled")
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return JobTimedOut(f"Job exceeded its timeout of {self.timeout:g}s")
+        return None
+
+    def check(self):
+        error = self.error()
+        if error:
+            raise error
+
+
+@contextmanager
+def cancel_scope(token):
+    """
+    Makes `token` the cancel token of the enclosed code. Threads started
+    inside only see it if they run in a copy of the context (`contextvars.copy_context`).
+    """
+    previous = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(previous)
+
+def check_cancelled():
+    """
+    Check point: stops the current job if it was cancelled or ran out of time.
+
+    Raises:
+        JobCancelled: If the job was cancelled.
+        JobTimedOut: If the job exceeded its deadline.
+    """
+    token = _current_token.get()
+    if token is not None:
+        token.check()
+
+def remaining_time(default=None):
+    """
+    Returns the timeout for a blocking call of the current job: `default`,
+    shortened to the time left until the deadline of the job.
+    """
+    token = _current_token.get()
+    remaining = token.remaining() if token is not None else None
+    if remaining is None:
+        return default
+    return remaining if default is None else min(default, remaining)
@@ -0,0 +1,120 @@
+import os
+import threading
+
+from logs import setup_logging
+from metrics import counter
+from scrapers.cache_control import cache_bypassed
+from scrapers.sqlite_cache import SQLiteCache
+from scrapers.thumbnails import load_thumbnail
+from scrapers.url_utils import canonicalize_url
+
+logger = setup_logging("content_cache")
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "instance", "content_cache.db")
+
+CACHE_LOOKUPS = counter("recipe_content_cache_lookups_total", "Lookups of captions and recipes in the content cache", ("kind", "result"))
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_content_cache():
+    """
+    Returns the shared content cache, or None if it is disabled (CONTENT_CACHE=false).
+    """
+    global _cache
+    if os.getenv("CONTENT_CACHE", "true").lower() != "true":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SQLiteCache(
+                os.getenv("CONTENT_CACHE_PATH", DEFAULT_CACHE_PATH),
+                table="content_cache",
+                ttl=float(os.getenv("CONTENT_CACHE_TTL", 30 * 24 * 3600)),
+                max_entries=int(os.getenv("CONTENT_CACHE_MAX_ENTRIES", 1000))
+            )
+    return _cache
+
+def _get(key):
+    cache = get_content_cache()
+    if cache is None or cache_bypassed():
+        return None
+    try:
+        value = cache.get(key)
+    except Exception as e:
+        logger.error(f"Failed to read content cache: {e}")
+        return None
+    CACHE_LOOKUPS.inc(kind=key.split(":", 1)[0], result="hit" if value is not None else "miss")
+    return value
+
+def _set(key, value):
+    cache = get_content_cache()
+    if cache is None:
+        return
+    try:
+        cache.set(key, value)
+    except Exception as e:
+        logger.error(f"Failed to write content cache: {e}")
+
+def get_cached_caption(url):
+    """
+    Args:
+        url (str): The URL of the social media post.
+    
+    Returns:
+        tuple: (caption, thumbnail) if cached, otherwise None. The thumbnail is
+            None unless it was kept in the thumbnail cache (THUMBNAIL_CACHE).
+    """
+    entry = _get(f"caption:{canonicalize_url(url)}")
+    if not entry:
+        return None
+    logger.info(f"Using cached caption for {url}")
+    return entry["caption"], load_thumbnail(entry.get("thumbnail"))
+
+def _thumbnail_path(thumbnail):
+    # Only thumbnails in the disk cache can be referenced, the bytes stay out of the database
+    return thumbnail.path if thumbnail else None
+
+def cache_caption(url, caption, thumbnail):
+    _set(f"caption:{canonicalize_url(url)}", {"caption": caption, "thumbnail": _thumbnail_path(thumbnail)})
+
+def get_cached_recipe(url, provider):
+    """
+    Args:
+        url (str): The URL of the social media post.
+        provider (str): The recipe provider ("tandoor" or "mealie").
+    
+    Returns:
+        dict or None: The cached entry with the final provider `payload`, the
+            cached `thumbnail` (or None) and, once the upload succeeded, the `recipe_id`.
+    """
+    entry = _get(f"recipe:{provider}:{canonicalize_url(url)}")
+    if entry:
+        entry["thumbnail"] = load_thumbnail(entry.get("thumbnail"))
+    return entry
+
+def cache_recipe_payload(url, provider, payload, thumbnail):
+    """Stores the final provider JSON so a retry can skip straight to the upload"""
+    _set(f"recipe:{provider}:{canonicalize_url(url)}", {
+        "payload": payload,
+        "thumbnail": _thumbnail_path(thumbnail),
+        "recipe_id": None
+    })
+
+def cache_recipe_result(url, provider, payload, thumbnail, recipe_id):
+    """Marks the recipe as imported under `recipe_id`"""
+    _set(f"recipe:{provider}:{canonicalize_url(url)}", {
+        "payload": payload,
+        "thumbnail": _thumbnail_path(thumbnail),
+        "recipe_id": recipe_id
+    })
+
+def get_referenced_thumbnails():
+    """
+    Returns:
+        set: Absolute paths of the thumbnails still used by cached captions and recipes.
+    """
+    cache = get_content_cache()
+    if cache is None:
+        return set()
+    cache.evict()
+    return {os.path.abspath(entry["thumbnail"]) for entry in cache.values() if entry.get("thumbnail")}
@@ -1,29 +1,35 @@
 import os
+import threading
 import time
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 from logs import setup_logging
-import requests
+from metrics import gauge
+from scrapers.browser_pool import BrowserPool
+from scrapers.cancellation import JobCancelled, check_cancelled, remaining_time
+from scrapers.thumbnails import create_thumbnail
+from tracing import span
 
 logger = setup_logging("manage_browser")
 
-def open_browser(url=None, platform=None):
+BROWSERS_IN_FLIGHT = gauge("recipe_browsers_in_flight", "Browsers checked out by scraping jobs and AI sessions")
+
+_browser_pool = None
+_browser_pool_lock = threading.Lock()
+
+def create_browser():
     """
-    Opens a browser window and navigates to the specified URL.
-    If no URL is provided, navigates to Duck AI website.
-    
-    Args:
-        url (str, optional): URL to navigate to. Defaults to Duck.ai.
-        platform (str, optional): Platform type ("instagram", "tiktok") for specific handling.
+    Launches a new headless browser as configured by the BROWSER env variable.
     
     Returns:
         WebDriver: The browser window object.
     """
-    
-    logger.info(f"Opening browser{'for '+platform if platform else ''}")
+    with span("browser.launch", browser=os.getenv("BROWSER") or "default"):
+        return _launch_browser()
 
+def _launch_browser():
     match os.getenv("BROWSER"):
         case "firefox":
             options = webdriver.FirefoxOptions()
@@ -57,11 +63,76 @@ def open_browser(url=None, platform=None):
             options = webdriver.FirefoxOptions()
             browser = webdriver.Firefox(options=options)
             logger.info("Using default Firefox browser")
+    return browser
+
+def default_pool_size():
+    """
+    Every fetch worker and every Duck.ai session may hold a browser at the same
+    time. A smaller pool lets extraction take all browsers while the fetch stage waits.
+    """
+    workers = os.getenv("WORKER_COUNT", 2)
+    size = int(os.getenv("FETCH_WORKERS", workers))
+    if os.getenv("AI_MODULE", "duck_ai") == "duck_ai":
+        size += int(os.getenv("AI_SESSION_POOL_SIZE", os.getenv("EXTRACT_WORKERS", workers)))
+    return size
+
+def get_browser_pool():
+    """
+    Returns the shared browser pool, or None if pooling is disabled (BROWSER_POOL_SIZE=0).
+    The size defaults to `default_pool_size`.
+    """
+    global _browser_pool
+    size = int(os.getenv("BROWSER_POOL_SIZE", default_pool_size()))
+    if size <= 0:
+        return None
+    with _browser_pool_lock:
+        if _browser_pool is None:
+            _browser_pool = BrowserPool(
+                create_browser,
+                size=size,
+                max_uses=int(os.getenv("BROWSER_MAX_USES", 20)),
+                idle_timeout=float(os.getenv("BROWSER_IDLE_TIMEOUT", 300)),
+                acquire_timeout=float(os.getenv("BROWSER_ACQUIRE_TIMEOUT", 120))
+            )
+    return _browser_pool
+
+def open_browser(url=None, platform=None):
+    """
+    Opens a browser window and navigates to the specified URL.
+    If no URL is provided, navigates to Duck AI website.
+    The browser is checked out of the browser pool, hand it back with `close_browser`.
+    
+    Args:
+        url (str, optional): URL to navigate to. Defaults to Duck.ai.
+        platform (str, optional): Platform type ("instagram", "tiktok") for specific handling.
+    
+    Returns:
+        WebDriver: The browser window object.
+    """
+    
+    logger.info(f"Opening browser{' for '+platform if platform else ''}")
+
+    check_cancelled()
+    pool = get_browser_pool()
+    browser = pool.acquire(timeout=remaining_time()) if pool else create_browser()
+    BROWSERS_IN_FLIGHT.inc()
+
+    # The job may have been cancelled while waiting for a browser
+    try:
+        check_cancelled()
+    except JobCancelled:
+        close_browser(browser)
+        raise
 
     # Navigate to specified URL or Duck.ai
     target_url = url if url else "https://duck.ai/"
     logger.info(f"Navigating to {target_url}")
-    browser.get(target_url)
+    try:
+        with span("page.load", via="browser", platform=platform or "duck.ai"):
+            browser.get(target_url)
+    except Exception:
+        close_browser(browser, discard=True)
+        raise
     
     # Handle platform-specific setup
     if platform == "instagram" or platform == "i":
@@ -91,7 +162,7 @@ def open_browser(url=None, platform=None):
             continue_button.click()
         except Exception as e:
             logger.error(f"Failed to navigate Duck.ai welcome screens: {e}", exc_info=True)
-            browser.quit()
+            close_browser(browser, discard=True)
             return None
     
     # General wait for content to load
@@ -100,87 +171,58 @@ def open_browser(url=None, platform=None):
     logger.info("Browser initialized successfully")
     return browser
         
-def close_browser(browser):
+def close_browser(browser, discard=False):
     """
-    Closes the browser window.
+    Returns the browser window to the browser pool, or closes it if pooling is disabled.
     Args:
         browser (WebDriver): The browser window object to close.
+        discard (bool, optional): Close the browser even if it could be reused.
     """
     
     if browser:
+        BROWSERS_IN_FLIGHT.dec()
+        pool = get_browser_pool()
+        if pool:
+            logger.info("Returning browser to pool...")
+            pool.release(browser, discard=discard)
+            return
         logger.info("Closing browser...")
         try:
             browser.quit()
         except Exception as e:
             logger.error(f"Error closing browser: {e}")
 
-def capture_thumbnail(browser, recipe_name=None):
+def capture_thumbnail(browser):
     """
     Attempts to capture a video thumbnail from the current page.
     
     Args:
         browser (WebDriver): The browser window object.
-        recipe_name (str, optional): Name of the recipe for image search.
     
     Returns:
-        str or None: Path to the thumbnail file if successful, otherwise None.
+        Thumbnail or None: The encoded thumbnail if successful, otherwise None.
     """
     if os.getenv("BROWSER") != "docker":
         try:
             logger.info("Attempting to capture video thumbnail")
-            # Create thumbnails directory if it doesn't exist
-            os.makedirs('thumbnails', exist_ok=True)
-            
-            # Generate a unique filename
-            thumbnail_filename = f"thumbnails/thumbnail_{int(time.time())}.png"
-            
-            # Wait for video element to be present
-            logger.info("Waiting for video element")
-            WebDriverWait(browser, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "video"))
-            )
-            
-            # Find the video element
-            video = browser.find_element(By.TAG_NAME, "video")
-            
-            # Take screenshot of the video element
-            video.screenshot(thumbnail_filename)
-            logger.info(f"Thumbnail saved to {thumbnail_filename}")
-            return thumbnail_filename
+            with span("thumbnail.capture", source="video"):
+                # Wait for video element to be present
+                logger.info("Waiting for video element")
+                WebDriverWait(browser, 10).until(
+                    EC.presence_of_element_located((By.TAG_NAME, "video"))
+                )
+                
+                # Find the video element
+                video = browser.find_element(By.TAG_NAME, "video")
+                
+                # Take screenshot of the video element, kept in memory
+                thumbnail = create_thumbnail(video.screenshot_as_png)
+            logger.info(f"Thumbnail captured: {thumbnail}")
+            return thumbnail
         except Exception as e:
             logger.info(f"Failed to capture thumbnail: {e}")
             return None
     else:
-        # Docker-Umgebung: Fallback-Bild von loremflickr oder Unsplash
-        os.makedirs('thumbnails', exist_ok=True)
-        thumbnail_filename = f"thumbnails/thumbnail_{int(time.time())}.jpg"
-        search_term = recipe_name if recipe_name else "food"
-        try:
-            logger.info(f"[DOCKER] Attempting to fetch image from loremflickr for: {search_term}")
-            url = f"https://loremflickr.com/640/480/{search_term.replace(' ', '%20')}"
-            response = requests.get(url, timeout=10)
-            if response.status_code == 200:
-                with open(thumbnail_filename, 'wb') as f:
-                    f.write(response.content)
-                logger.info(f"[DOCKER] Thumbnail saved to {thumbnail_filename} from loremflickr")
-                return thumbnail_filename
-            else:
-                logger.info(f"[DOCKER] Failed to fetch image from loremflickr, status: {response.status_code}")
-        except Exception as e:
-            logger.info(f"[DOCKER] Error fetching image from loremflickr: {e}")
-        # Fallback: Unsplash (ohne API-Key nur ein generisches Bild)
-        try:
-            logger.info(f"[DOCKER] Attempting to fetch fallback image from Unsplash")
-            unsplash_url = "https://images.unsplash.com/photo-1504674900247-0877df9cc836?auto=format&fit=crop&w=640&q=80"
-            response = requests.get(unsplash_url, timeout=10)
-            if response.status_code == 200:
-                with open(thumbnail_filename, 'wb') as f:
-                    f.write(response.content)
-                logger.info(f"[DOCKER] Thumbnail saved to {thumbnail_filename} from Unsplash fallback")
-                return thumbnail_filename
-            else:
-                logger.info(f"[DOCKER] Failed to fetch fallback image from Unsplash, status: {response.status_code}")
-        except Exception as e:
-            logger.info(f"[DOCKER] Error fetching fallback image from Unsplash: {e}")
-        logger.info(f"[DOCKER] No thumbnail could be generated.")
+        # Docker-Umgebung: kein Video, ein Stockbild wird gewählt sobald der Rezeptname bekannt ist
+        logger.info("[DOCKER] No video thumbnail, a stock image is added after the extraction")
         return None
\ No newline at end of file
@@ -0,0 +1,79 @@
+import threading
+from contextlib import contextmanager
+
+from logs import setup_logging
+
+logger = setup_logging("progress")
+
+_state = threading.local()
+
+@contextmanager
+def report_to(callback):
+    """
+    Sends the progress events of the current thread to `callback`, called
+    with the event name and a dict of details.
+    """
+    previous = getattr(_state, "callback", None)
+    _state.callback = callback
+    try:
+        yield
+    finally:
+        _state.callback = previous
+
+def report_progress(event, **details):
+    """
+    Reports a progress event of a provider to the callback of the current
+    thread, if any. A failing callback never fails the job.
+
+    Events:
+        caption: The caption and thumbnail were fetched.
+        extract: A part of the recipe was extracted (`done`, `total`, `part`).
+        upload: The payload is being sent to Tandoor / Mealie (`target`).
+        recipe_created: The recipe was created (`recipe_id`).
+        thumbnail_uploaded: The thumbnail was attached to the recipe.
+    """
+    callback = getattr(_state, "callback", None)
+    if callback is None:
+        return
+    try:
+        callback(event, details)
+    except Exception as e:
+        logger.warning(f"Progress callback failed for {event}: {e}", exc_info=True)
+
+def describe_progress(event, details):
+    """Returns a short message for a progress event, as shown on the job page"""
+    if event == "caption":
+        return "Caption found, waiting for AI extraction..."
+    if event == "extract":
+        return f"Extracted {details.get('part', 'recipe part')} ({details['done']}/{details['total']})"
+    if event == "upload":
+        return f"Sending recipe to {details.get('target', 'the recipe manager')}..."
+    if event == "recipe_created":
+        return "Recipe created, uploading thumbnail..."
+    if event == "thumbnail_uploaded":
+        return "Thumbnail uploaded"
+    return event
+
+
+class PartCounter:
+    """
+    Counts the extracted parts of a recipe and reports an `extract` event
+    for each. The total grows when more prompts turn out to be needed,
+    e.g. once the number of steps is known or a part has to be retried.
+    """
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self._lock = threading.Lock()
+
+    def add(self, count):
+        with self._lock:
+            self.total += count
+
+    def finished(self, part):
+        with self._lock:
+            self.done += 1
+            self.total = max(self.total, self.done)
+            done, total = self.done, self.total
+        report_progress("extract", done=done, total=total, part=part)
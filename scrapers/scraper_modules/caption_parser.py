@@ -0,0 +1,506 @@
+import os
+import re
+
+from logs import setup_logging
+from metrics import counter
+from scrapers.scraper_modules.tandoor_schema import validate_step
+from tracing import span
+
+logger = setup_logging("caption_parser")
+
+CAPTION_PARSES = counter("recipe_caption_parses_total", "Captions read by the rule-based parser", ("result",))
+
+# Section headings per language. Captions are matched against all of them,
+# the parsed parts are only used if the caption is in the LANGUAGE_CODE language.
+HEADINGS = {
+    "en": {
+        "ingredients": ("ingredients", "ingredient list", "you need", "you will need", "you'll need", "what you need", "shopping list"),
+        "steps": ("instructions", "directions", "method", "steps", "preparation", "how to make it", "how to make"),
+        "other": ("notes", "note", "tips", "tip", "nutrition", "storage", "serving suggestion"),
+    },
+    "de": {
+        "ingredients": ("zutaten", "zutatenliste", "du brauchst", "ihr braucht", "das brauchst du", "einkaufsliste"),
+        "steps": ("zubereitung", "anleitung", "so geht's", "so gehts", "und so geht's", "schritte"),
+        "other": ("tipp", "tipps", "hinweis", "hinweise", "nährwerte", "notizen"),
+    },
+}
+
+# Units as written in captions, matched case-insensitively and without a trailing dot
+UNITS = (
+    "g", "gr", "gram", "grams", "gramm", "kg", "mg", "ml", "l", "cl", "dl", "liter", "liters", "litre", "litres",
+    "tsp", "teaspoon", "teaspoons", "tbsp", "tbs", "tablespoon", "tablespoons", "cup", "cups", "oz", "ounce",
+    "ounces", "lb", "lbs", "pound", "pounds", "pinch", "pinches", "dash", "clove", "cloves", "can", "cans", "tin",
+    "tins", "slice", "slices", "piece", "pieces", "pc", "pcs", "handful", "handfuls", "bunch", "bunches", "sprig",
+    "sprigs", "stick", "sticks", "package", "packages", "pack", "packs", "jar", "jars", "stalk", "stalks",
+    "el", "tl", "prise", "prisen", "stück", "stk", "zehe", "zehen", "dose", "dosen", "bund", "packung",
+    "packungen", "pck", "pkg", "päckchen", "becher", "msp", "tasse", "tassen", "scheibe", "scheiben", "handvoll",
+    "schuss", "glas", "gläser", "zweig", "zweige", "würfel",
+)
+FRACTIONS = {"½": 0.5, "⅓": 1 / 3, "⅔": 2 / 3, "¼": 0.25, "¾": 0.75, "⅕": 0.2, "⅛": 0.125}
+
+_FRACTION_CHARS = "".join(FRACTIONS)
+_NUMBER = rf"(?:\d+(?:[.,]\d+)?\s*[{_FRACTION_CHARS}]|\d+\s+\d+/\d+|\d+/\d+|\d+(?:[.,]\d+)?|[{_FRACTION_CHARS}])"
+_AMOUNT = rf"(?P<amount>{_NUMBER})(?:\s*(?:-|–|to|bis)\s*{_NUMBER})?"
+_UNIT = r"(?P<unit>" + "|".join(sorted((re.escape(unit) for unit in UNITS), key=len, reverse=True)) + r")\.?"
+LEADING_AMOUNT = re.compile(rf"^{_AMOUNT}\s*(?:{_UNIT}(?=[\s,)]|$))?\s*(?:of\s+)?(?P<food>.*)$", re.IGNORECASE)
+TRAILING_AMOUNT = re.compile(rf"^(?P<food>[^\d{_FRACTION_CHARS}]+?)\s*[:\-–]?\s+{_AMOUNT}\s*(?:{_UNIT})?$", re.IGNORECASE)
+# "a pinch of salt", "eine Prise Salz"
+ARTICLE_AMOUNT = re.compile(rf"^(?:a|an|one|ein|eine|einen)\s+{_UNIT}(?=\s)\s*(?:of\s+)?(?P<food>.+)$", re.IGNORECASE)
+
+STEP_NUMBER = re.compile(r"^(?:step|schritt)?\s*(\d{1,2})\s*[.):\-]\s*(?=\S)", re.IGNORECASE)
+# Emoji numbers like 1\ufe0f\u20e3 become "1."
+KEYCAP_NUMBER = re.compile("(\\d)\ufe0f?\u20e3")
+BULLETS = "-\u2013\u2014*\u2022\u25aa\u25ab\u25cf\u25e6\u2023\u00b7\u2714\u2713\u2705\u27a1\u2192\u25b6\ufe0f\U0001f449\U0001f538\U0001f539"
+
+SERVINGS = (
+    re.compile(r"\b(?:serves|servings|makes|yields?|portions|portionen|personen)\s*:?\s*(\d+)\b(?:\s*(?:servings|portions|people|persons|portionen|personen))?", re.IGNORECASE),
+    re.compile(r"\b(\d+)\s*(?:servings|portions|people|persons|portionen|personen|port\.)", re.IGNORECASE),
+)
+_DURATION = (
+    r"\d+(?:[.,]\d+)?\s*(?:hours?|hrs?|h|stunden?|std)\.?(?:\s*(?:and|und)?\s*\d+\s*(?:minutes?|minuten|mins?|m)\b\.?)?"
+    r"|\d+\s*(?:minutes?|minuten|mins?|m)\b\.?"
+)
+# Mealie takes prep and cook time, Tandoor splits the time into working (prep)
+# and waiting time (cooking and resting)
+TIME_LABELS = {
+    "prep": ("prep time", "preparation time", "prep", "active time",
+             "zubereitungszeit", "vorbereitungszeit", "arbeitszeit"),
+    "cook": ("cook time", "cooking time", "bake time", "baking time", "kochzeit", "backzeit", "garzeit"),
+    "rest": ("rest time", "resting time", "chill time", "chilling time",
+             "ruhezeit", "wartezeit", "kühlzeit", "gehzeit", "marinierzeit"),
+    "total": ("total time", "total", "ready in", "gesamtzeit", "fertig in"),
+}
+TIMES = {
+    kind: re.compile(
+        rf"\b(?:{'|'.join(re.escape(label) for label in sorted(labels, key=len, reverse=True))})\s*:?\s*(?P<duration>{_DURATION})",
+        re.IGNORECASE
+    )
+    for kind, labels in TIME_LABELS.items()
+}
+# First lines like "Save this for later 👇" are no recipe name
+CALL_TO_ACTION = re.compile(r"\b(?:save|speicher|follow|folg|comment|kommentier|link in bio|recipe below|rezept unten)", re.IGNORECASE)
+
+# Weight of each part in the overall confidence
+CONFIDENCE_WEIGHTS = {"ingredients": 0.35, "steps": 0.35, "name": 0.2, "servings": 0.05, "timing": 0.05}
+
+
+def _to_amount(text):
+    text = text.strip().replace(",", ".")
+    total = 0.0
+    for part in re.findall(rf"\d+/\d+|\d+(?:\.\d+)?|[{_FRACTION_CHARS}]", text):
+        if part in FRACTIONS:
+            total += FRACTIONS[part]
+        elif "/" in part:
+            numerator, denominator = part.split("/")
+            total += int(numerator) / int(denominator) if int(denominator) else 0
+        else:
+            total += float(part)
+    return round(total, 3)
+
+def _to_minutes(text):
+    hours = re.search(r"(\d+(?:[.,]\d+)?)\s*(?:hours?|hrs?|h|stunden?|std)", text, re.IGNORECASE)
+    minutes = re.search(r"(\d+)\s*(?:minutes?|minuten|mins?|m)\b", text, re.IGNORECASE)
+    total = 0.0
+    if hours:
+        total += float(hours.group(1).replace(",", ".")) * 60
+    if minutes:
+        total += int(minutes.group(1))
+    return int(round(total))
+
+def _heading_key(text):
+    text = text.lower().replace("’", "'")
+    text = re.sub(r"[^\w\s'()]", " ", text)
+    return " ".join(text.split())
+
+def _match_heading(line):
+    """
+    Returns:
+        tuple: (section, language, inline text after the colon), or (None, None, None).
+    """
+    head, _, tail = line.partition(":")
+    for key, inline in ((_heading_key(head), tail.strip()), (_heading_key(line), "")):
+        if not key:
+            continue
+        for language, sections in HEADINGS.items():
+            for section, words in sections.items():
+                for word in words:
+                    if key == word or key.startswith((word + " (", word + " for ", word + " für ")):
+                        return section, language, inline
+    return None, None, None
+
+def _is_metadata(line):
+    """Returns True for lines like "Prep time: 10 min | Serves 4" that only hold times and servings"""
+    rest = line
+    for pattern in (*TIMES.values(), *SERVINGS):
+        rest = pattern.sub(" ", rest)
+    return rest != line and not re.search(r"\w", rest)
+
+def _strip_bullet(line):
+    return line.lstrip(BULLETS + " \t").strip()
+
+def _normalize(caption):
+    caption = caption.replace("\r", "\n").replace("\u00a0", " ").replace("\u200b", "").replace("\u2044", "/")
+    caption = KEYCAP_NUMBER.sub(r"\1.", caption)
+    # Captions flattened to a single line still have "Ingredients:" and "Steps:" in them
+    if caption.count("\n") < 2:
+        words = [word for sections in HEADINGS.values() for key in ("ingredients", "steps") for word in sections[key]]
+        pattern = r"\s+(?=(?:" + "|".join(re.escape(word) for word in words) + r")\s*:)"
+        caption = re.sub(pattern, "\n", caption, flags=re.IGNORECASE)
+    return [line.strip() for line in caption.split("\n")]
+
+def _split_items(line):
+    """Splits an ingredient line like "200 g flour • 2 eggs" that holds several ingredients"""
+    items = [item.strip() for item in re.split(r"\s+[•▪·]\s+|\s*;\s*", line) if item.strip()]
+    if len(items) == 1 and "," in line:
+        candidates = [item.strip() for item in line.split(",")]
+        # Only a list if every item starts with an amount, else it's a note like "2 onions, chopped"
+        if all(LEADING_AMOUNT.match(item) and re.match(rf"[\d{_FRACTION_CHARS}]", item) for item in candidates):
+            items = candidates
+    return items
+
+def parse_ingredient(line):
+    """
+    Splits an ingredient line into amount, unit, food and note.
+
+    Args:
+        line (str): A line of the ingredients section, e.g. "200 g spaghetti" or "Mehl: 1,5 kg".
+
+    Returns:
+        dict: amount (float or None), unit (str or None), food, note and the original line.
+    """
+    text = _strip_bullet(line)
+    amount = unit = None
+    food = text
+    match = ARTICLE_AMOUNT.match(text)
+    if match:
+        amount, unit, food = 1.0, match.group("unit"), match.group("food")
+    else:
+        match = LEADING_AMOUNT.match(text)
+        if match and match.group("food"):
+            amount, unit, food = _to_amount(match.group("amount")), match.group("unit"), match.group("food")
+        else:
+            match = TRAILING_AMOUNT.match(text)
+            if match:
+                amount, unit, food = _to_amount(match.group("amount")), match.group("unit"), match.group("food")
+
+    note = ""
+    parenthesis = re.search(r"\(([^)]*)\)", food)
+    if parenthesis:
+        note = parenthesis.group(1).strip()
+        food = (food[:parenthesis.start()] + food[parenthesis.end():]).strip()
+    if "," in food:
+        food, rest = food.split(",", 1)
+        note = ", ".join(filter(None, [rest.strip(), note]))
+    return {
+        "amount": amount,
+        "unit": unit.rstrip(".") if unit else None,
+        "food": food.strip(" :-–"),
+        "note": note,
+        "original": text,
+    }
+
+def _parse_steps(lines):
+    """
+    Splits the steps section into steps. Numbered lines start a new step and
+    take the unnumbered lines below them, without numbers every line is a step.
+
+    Returns:
+        tuple: (steps, split_sentences), the latter True if a single paragraph was split.
+    """
+    numbered = any(STEP_NUMBER.match(_strip_bullet(line)) for line in lines)
+    steps = []
+    for line in lines:
+        text = _strip_bullet(line)
+        # "1. Cook the pasta 2. Drain it" in a single line
+        parts = [text]
+        if numbered and len(re.findall(r"(?:^|\s)\d{1,2}[.)]\s", text)) > 1:
+            parts = [part.strip() for part in re.split(r"\s+(?=\d{1,2}[.)]\s)", text)]
+        for part in parts:
+            match = STEP_NUMBER.match(part)
+            if match:
+                steps.append(part[match.end():].strip())
+            elif numbered and steps:
+                steps[-1] = f"{steps[-1]} {part}"
+            else:
+                steps.append(part)
+    steps = [step for step in steps if re.search(r"\w", step)]
+
+    if len(steps) == 1:
+        sentences = [sentence.strip() for sentence in re.split(r"(?<=[.!?])\s+(?=[A-ZÄÖÜ])", steps[0]) if sentence.strip()]
+        if len(sentences) > 1:
+            return sentences, True
+    return steps, False
+
+def _parse_name(lines):
+    """
+    Returns:
+        tuple: (name, confidence, description).
+    """
+    texts = [re.sub(r"[#@][\w.]+", "", line).strip() for line in lines]
+    texts = [re.sub(r"^[^\w(]+|[^\w).!?]+$", "", text) for text in texts]
+    texts = [text for text in texts if re.search(r"\w", text)]
+    if not texts:
+        return None, 0.0, ""
+
+    first, rest = texts[0], texts[1:]
+    name, confidence = first, 1.0
+    if len(first) > 60:
+        # "Garlic pasta - ready in 20 minutes" or "Garlic pasta. So easy!"
+        parts = re.split(r"\s+[-–|]\s+|(?<=[.!?])\s+", first, maxsplit=1)
+        name, confidence = parts[0], 0.8
+        rest = parts[1:] + rest
+    else:
+        parts = re.split(r"\s+[-–|]\s+", first, maxsplit=1)
+        if len(parts) == 2:
+            name = parts[0]
+            rest = [parts[1]] + rest
+    name = name.strip(" .!:")
+    if not 2 <= len(name) <= 60:
+        return None, 0.0, " ".join(texts)[:500]
+    if CALL_TO_ACTION.search(name):
+        confidence = 0.5
+    return name, confidence, " ".join(rest)[:500]
+
+def parse_caption(caption, language=None):
+    """
+    Reads a recipe from a caption with clearly marked sections, e.g.
+    "Ingredients:" / "Zutaten:" followed by one ingredient per line and
+    "Steps:" / "Zubereitung:" followed by the (numbered) steps, without AI.
+
+    Args:
+        caption (str): The caption of the post.
+        language (str, optional): Language of the recipe, defaults to LANGUAGE_CODE.
+
+    Returns:
+        dict: name, description, ingredients (see `parse_ingredient`), steps
+            (list of str), servings, times (minutes of prep, cook, rest and
+            total time, if found), language of the headings and the
+            confidence: the overall score from 0 to 1 and one per part in
+            "parts" (name, ingredients, steps, servings, timing).
+    """
+    language = (language or os.getenv("LANGUAGE_CODE", "en")).lower()[:2]
+    lines = _normalize(caption)
+
+    sections = {"intro": [], "ingredients": [], "steps": [], "other": []}
+    languages = set()
+    current = "intro"
+    for line in lines:
+        if not line:
+            continue
+        section, heading_language, inline = _match_heading(line)
+        if section:
+            current = section
+            if section != "other":
+                languages.add(heading_language)
+            if inline:
+                sections[current].append(inline)
+            continue
+        # Hashtag blocks at the end belong to no section
+        if re.fullmatch(r"(?:[#@][\w.]+\s*)+", line):
+            continue
+        sections[current].append(line)
+
+    ingredients = []
+    for line in sections["ingredients"]:
+        text = _strip_bullet(line)
+        # Group headers like "For the sauce:" / "Für die Soße:"
+        if text.endswith(":") and not re.search(r"\d", text):
+            continue
+        ingredients.extend(parse_ingredient(item) for item in _split_items(text))
+    ingredients = [ingredient for ingredient in ingredients if ingredient["food"]]
+    steps, split_sentences = _parse_steps(sections["steps"])
+    # Times and servings have their own fields, don't repeat them in the description
+    name, name_confidence, description = _parse_name([line for line in sections["intro"] if not _is_metadata(line)])
+
+    servings = None
+    for pattern in SERVINGS:
+        match = pattern.search(caption)
+        if match:
+            servings = int(match.group(1))
+            break
+    times = {}
+    for kind, pattern in TIMES.items():
+        minutes = sum(_to_minutes(match.group("duration")) for match in pattern.finditer(caption))
+        if minutes:
+            times[kind] = minutes
+
+    # An ingredient looks right if it has an amount or is just a few words like "Salt"
+    plausible = [i for i in ingredients if i["amount"] is not None or len(i["food"].split()) <= 4]
+    ingredients_confidence = 0.0
+    if ingredients:
+        ingredients_confidence = len(plausible) / len(ingredients) * min(1.0, len(ingredients) / 3)
+    steps_confidence = 0.0
+    if steps:
+        steps_confidence = sum(len(step.split()) >= 2 for step in steps) / len(steps) * min(1.0, len(steps) / 2)
+        if split_sentences:
+            steps_confidence *= 0.8
+    parts = {
+        "name": name_confidence,
+        "ingredients": round(ingredients_confidence, 2),
+        "steps": round(steps_confidence, 2),
+        "servings": 1.0 if servings else 0.0,
+        "timing": 1.0 if times else 0.0,
+    }
+    # Recipes in another language still need the AI to translate them
+    heading_language = next(iter(languages)) if len(languages) == 1 else None
+    if heading_language != language:
+        parts = {key: 0.0 for key in parts}
+
+    return {
+        "name": name,
+        "description": description,
+        "ingredients": ingredients,
+        "steps": steps,
+        "servings": servings,
+        "times": times,
+        "language": heading_language,
+        "confidence": {
+            "overall": round(sum(CONFIDENCE_WEIGHTS[key] * value for key, value in parts.items()), 2),
+            "parts": parts,
+        },
+    }
+
+def read_caption(caption):
+    """
+    Parses the caption of an import unless CAPTION_PARSER=false.
+
+    Returns:
+        dict or None: The parsed caption (see `parse_caption`) with `skip_ai`
+            set if its confidence reaches CAPTION_PARSER_CONFIDENCE, None if
+            the parser is disabled.
+    """
+    if os.getenv("CAPTION_PARSER", "true").lower() != "true":
+        return None
+    with span("caption.rules") as attributes:
+        parsed = parse_caption(caption)
+        attributes["confidence"] = parsed["confidence"]["overall"]
+    parsed["skip_ai"] = parsed["confidence"]["overall"] >= float(os.getenv("CAPTION_PARSER_CONFIDENCE", 0.85))
+    if parsed["skip_ai"]:
+        result = "skipped"
+    elif any(usable_part(parsed, part) for part in ("name", "ingredients", "steps")):
+        result = "partial"
+    else:
+        result = "ai"
+    CAPTION_PARSES.inc(result=result)
+    logger.info(f"Caption parsed with confidence {parsed['confidence']['overall']} ({result}): {parsed['confidence']['parts']}")
+    return parsed
+
+def usable_part(parsed, part):
+    """Returns True if a part of the parsed caption reaches CAPTION_PARSER_PART_CONFIDENCE"""
+    if parsed is None:
+        return False
+    if parsed.get("skip_ai"):
+        return True
+    return parsed["confidence"]["parts"][part] >= float(os.getenv("CAPTION_PARSER_PART_CONFIDENCE", 0.8))
+
+def _mentions(step, food):
+    step = step.lower()
+    return any(word in step for word in re.findall(r"\w{4,}", food.lower()))
+
+def _tandoor_ingredient(ingredient, order):
+    return {
+        "food": {"name": ingredient["food"]},
+        "unit": {"name": ingredient["unit"]} if ingredient["unit"] else None,
+        "amount": ingredient["amount"] if ingredient["amount"] is not None else 0,
+        "note": ingredient["note"],
+        "original_text": ingredient["original"],
+        "order": order,
+        "is_header": False,
+        "no_amount": ingredient["amount"] is None,
+    }
+
+def tandoor_recipe(parsed):
+    """
+    Turns the usable parts of a parsed caption into Tandoor recipe fields.
+    Every ingredient goes into the first step that mentions it, the others
+    into the first step.
+
+    Args:
+        parsed (dict): The result of `read_caption`.
+
+    Returns:
+        tuple: (valid_parts, failed) like `tandoor_schema.validate_recipe`,
+            the failed parts have to be requested from the AI.
+    """
+    valid_parts = {}
+    failed = {"name": True, "steps": True, "servings": True, "timing": True}
+    if usable_part(parsed, "name") and parsed["name"]:
+        valid_parts.update({"name": parsed["name"], "description": parsed["description"], "keywords": []})
+        failed["name"] = False
+
+    if usable_part(parsed, "ingredients") and usable_part(parsed, "steps") and parsed["steps"]:
+        step_ingredients = [[] for _ in parsed["steps"]]
+        for ingredient in parsed["ingredients"]:
+            index = next((i for i, step in enumerate(parsed["steps"]) if _mentions(step, ingredient["food"])), 0)
+            step_ingredients[index].append(ingredient)
+        steps = [
+            {
+                "instruction": instruction,
+                "ingredients": [_tandoor_ingredient(ingredient, order) for order, ingredient in enumerate(ingredients)],
+                "time": 0,
+                "order": order,
+                "show_as_header": False,
+                "show_ingredients_table": True,
+            }
+            for order, (instruction, ingredients) in enumerate(zip(parsed["steps"], step_ingredients))
+        ]
+        if all(validate_step(step) for step in steps):
+            valid_parts["steps"] = steps
+            failed["steps"] = False
+
+    if parsed.get("skip_ai") or usable_part(parsed, "servings"):
+        if parsed["servings"]:
+            valid_parts["servings"] = parsed["servings"]
+        failed["servings"] = False
+    if parsed.get("skip_ai") or usable_part(parsed, "timing"):
+        times = parsed["times"]
+        waiting = times.get("cook", 0) + times.get("rest", 0)
+        valid_parts["working_time"] = times.get("prep") or max(times.get("total", 0) - waiting, 0)
+        valid_parts["waiting_time"] = waiting
+        failed["timing"] = False
+    return valid_parts, failed
+
+def _iso_duration(minutes):
+    return f"PT{minutes // 60}H{minutes % 60}M" if minutes >= 60 else f"PT{minutes}M"
+
+def mealie_recipe(parsed):
+    """
+    Turns the usable parts of a parsed caption into schema.org Recipe fields for Mealie.
+
+    Args:
+        parsed (dict): The result of `read_caption`.
+
+    Returns:
+        tuple: (valid_parts, failed) where `failed` holds the keys 'name',
+            'ingredients' and 'instructions' with True for the parts the AI
+            has to provide.
+    """
+    valid_parts = {}
+    failed = {"name": True, "ingredients": True, "instructions": True}
+    if usable_part(parsed, "name") and parsed["name"]:
+        valid_parts["name"] = parsed["name"]
+        failed["name"] = False
+    if usable_part(parsed, "ingredients") and parsed["ingredients"]:
+        valid_parts["recipeIngredient"] = [ingredient["original"] for ingredient in parsed["ingredients"]]
+        failed["ingredients"] = False
+    if usable_part(parsed, "steps") and parsed["steps"]:
+        valid_parts["recipeInstructions"] = [{"@type": "HowToStep", "text": step} for step in parsed["steps"]]
+        failed["instructions"] = False
+
+    if parsed.get("skip_ai"):
+        times = parsed["times"]
+        valid_parts.update({
+            "@context": "https://schema.org",
+            "@type": "Recipe",
+            "description": parsed["description"],
+            "recipeYield": str(parsed["servings"]) if parsed["servings"] else "",
+        })
+        if times.get("prep"):
+            valid_parts["prepTime"] = _iso_duration(times["prep"])
+        if times.get("cook"):
+            valid_parts["cookTime"] = _iso_duration(times["cook"])
+        # Resting has no field of its own, it's only part of the total
+        total = times.get("total") or sum(times.values())
+        if total:
+            valid_parts["totalTime"] = _iso_duration(total)
+    return valid_parts, failed
@@ -2,40 +2,123 @@ import json
 from datetime import datetime
 
 from logs import setup_logging
-from scrapers.ai_service import initialize_chat, process_recipe_part
+from scrapers.ai_service import ai_session, initialize_chat, process_recipe_part
 from scrapers.api_service import send_recipe
+from scrapers.content_cache import cache_recipe_payload, cache_recipe_result, get_cached_recipe
+from scrapers.progress import PartCounter, report_progress
 from scrapers.social_scraper import get_caption_from_post
+from scrapers.stock_thumbnails import thumbnail_or_stock
+from scrapers.scraper_modules.caption_parser import mealie_recipe, read_caption
 from scrapers.scraper_modules.recipe_provider_interface import RecipeProviderInterface
+from scrapers.url_utils import resolve_short_url
 
 logger = setup_logging("scrape_for_mealie")
 
 class MealieProvider(RecipeProviderInterface):
     @staticmethod
-    def scrape(url, platform):
+    def fetch(url, platform):
         """
-        Function to process a social media post URL and extract recipe information.
-        Uses a single browser instance for all Duck.ai interactions.
+        Gets the caption and thumbnail of a social media post.
+        Posts found in the content cache skip the scraping and AI steps.
         
         Args:
             url (str): The URL of the social media post containing the recipe.
             platform (str): The platform ('instagram' or 'tiktok').
         
         Returns:
-            dict: Result information including URL and status.
+            dict: The state for the next stages.
             
         Raises:
-            Exception: If processing fails.
+            Exception: If no caption was found.
         """
-        
+        # Short links are resolved once here, so every cache key uses the post URL
+        url = resolve_short_url(url)
+        state = {"url": url, "platform": platform}
+        cached = get_cached_recipe(url, "mealie")
+        if cached and cached.get("recipe_id"):
+            logger.info(f"Recipe already imported as {cached['recipe_id']}")
+            state["result"] = {
+                "url": url,
+                "status": "success",
+                "already_imported": True,
+                "result": {"status": "success", "recipe_id": cached["recipe_id"], "api_type": "MEALIE"}
+            }
+            return state
+
+        if cached and cached.get("payload"):
+            logger.info("Using cached recipe payload, skipping scraping and AI extraction")
+            state["payload"] = cached["payload"]
+            state["thumbnail"] = cached.get("thumbnail")
+            report_progress("caption", cached=True)
+            return state
+
         result = get_caption_from_post(url, platform)
         
         if result is None:
             logger.error("No caption or image found")
             raise Exception("No caption or image found")
         
-        caption, thumbnail_filename = result
-        logger.info(f"Caption extracted successfully ({len(caption)} chars)")
+        state["caption"], state["thumbnail"] = result
+        logger.info(f"Caption extracted successfully ({len(state['caption'])} chars)")
+        report_progress("caption", chars=len(state["caption"]))
+        return state
+
+    @staticmethod
+    def extract(state):
+        """
+        Turns the caption into the Mealie payload. Captions the rule-based
+        parser reads with enough confidence skip the AI, the others use an AI session.
+        """
+        if "payload" in state:
+            return state
+
+        parsed = read_caption(state["caption"])
+        if parsed and parsed["skip_ai"]:
+            logger.info("Recipe read from the caption, skipping AI extraction")
+            full_json, _ = mealie_recipe(parsed)
+            PartCounter(1).finished("recipe from caption")
+            state["payload"] = MealieProvider._finish_payload(full_json)
+        else:
+            with ai_session():
+                state["payload"] = MealieProvider.extract_recipe(state["caption"], parsed)
+        state["thumbnail"] = thumbnail_or_stock(state["thumbnail"], state["payload"].get("name"))
+        cache_recipe_payload(state["url"], "mealie", state["payload"], state["thumbnail"])
+        return state
+
+    @staticmethod
+    def upload(state):
+        """
+        Sends the payload and thumbnail to Mealie.
+        """
+        logger.info("Sending to Mealie API")
+        report_progress("upload", target="Mealie")
+        mealie_result = send_recipe("MEALIE", state["payload"], state["thumbnail"])
+        if mealie_result.get("status") == "success":
+            cache_recipe_result(state["url"], "mealie", state["payload"], state["thumbnail"], mealie_result.get("recipe_id"))
+
+        state["result"] = {
+            "url": state["url"],
+            "status": "success",
+            "result": mealie_result
+        }
+        return state
+
+    @staticmethod
+    def extract_recipe(caption, parsed=None):
+        """
+        Uses the AI module of the current AI session to turn a caption into a Mealie recipe payload.
+        The name, ingredients and instructions the caption parser could read are not requested.
         
+        Args:
+            caption (str): The caption of the social media post.
+            parsed (dict, optional): The parsed caption, see `caption_parser.read_caption`.
+        
+        Returns:
+            dict: The JSON body for Mealie's html-or-json endpoint.
+            
+        Raises:
+            Exception: If the AI module fails to process the recipe.
+        """
         try:
             # Initialisiere AI-Kontext
             if not initialize_chat(caption):
@@ -85,21 +168,26 @@ class MealieProvider(RecipeProviderInterface):
                 }
             ]
 
-            # Build the recipe JSON structure
-            full_json = {}
+            # Build the recipe JSON structure from the parts read from the caption
+            full_json, failed = mealie_recipe(parsed) if parsed else ({}, {"name": True, "ingredients": True, "instructions": True})
+            # Information, nutrition and the parts missing from the caption
+            parts = PartCounter(2 + sum(failed.values()))
 
             # Get recipe instructions
-            logger.info("Getting recipe instructions")
-            instructions_res = process_recipe_part(json_parts[6], "instructions")
-            if instructions_res:
-                full_json.update(instructions_res)
-                logger.info("Recipe instructions processed successfully")
-            else:
-                logger.warning("Failed to get recipe instructions")
+            if failed["instructions"]:
+                logger.info("Getting recipe instructions")
+                instructions_res = process_recipe_part(json_parts[6], "instructions")
+                parts.finished("instructions")
+                if instructions_res:
+                    full_json.update(instructions_res)
+                    logger.info("Recipe instructions processed successfully")
+                else:
+                    logger.warning("Failed to get recipe instructions")
 
             # Get recipe general information
             logger.info("Getting recipe information")
             info_res = process_recipe_part(json_parts[0], "info")
+            parts.finished("information")
             if info_res:
                 full_json.update(info_res)
                 logger.info("Recipe information processed successfully")
@@ -107,29 +195,34 @@ class MealieProvider(RecipeProviderInterface):
                 logger.warning("Failed to get recipe information")
 
             # Get recipe ingredients
-            logger.info("Getting recipe ingredients")
-            ingredients_res = process_recipe_part(json_parts[1], "ingredients")
-            if ingredients_res:
-                full_json.update(ingredients_res)
-                logger.info("Recipe ingredients processed successfully")
-            else:
-                logger.warning("Failed to get recipe ingredients")
+            if failed["ingredients"]:
+                logger.info("Getting recipe ingredients")
+                ingredients_res = process_recipe_part(json_parts[1], "ingredients")
+                parts.finished("ingredients")
+                if ingredients_res:
+                    full_json.update(ingredients_res)
+                    logger.info("Recipe ingredients processed successfully")
+                else:
+                    logger.warning("Failed to get recipe ingredients")
 
             # Add interaction statistics
             full_json.update(json_parts[2])
 
             # Get recipe name
-            logger.info("Getting recipe name")
-            name_res = process_recipe_part(json_parts[3], "name")
-            if name_res:
-                full_json.update(name_res)
-                logger.info(f"Recipe name: {name_res.get('name', 'Unknown')}")
-            else:
-                logger.warning("Failed to get recipe name")
+            if failed["name"]:
+                logger.info("Getting recipe name")
+                name_res = process_recipe_part(json_parts[3], "name")
+                parts.finished("name")
+                if name_res:
+                    full_json.update(name_res)
+                    logger.info(f"Recipe name: {name_res.get('name', 'Unknown')}")
+                else:
+                    logger.warning("Failed to get recipe name")
 
             # Get nutrition information
             logger.info("Getting nutrition information")
             nutrition_res = process_recipe_part(json_parts[4], "nutrition")
+            parts.finished("nutrition")
             if nutrition_res:
                 full_json.update(nutrition_res)
                 logger.info("Nutrition information processed successfully")
@@ -139,32 +232,29 @@ class MealieProvider(RecipeProviderInterface):
             # Add diet suitability
             full_json.update(json_parts[5])
 
-            # Add current date
-            full_json["datePublished"] = datetime.now().strftime("%Y-%m-%d")
+            return MealieProvider._finish_payload(full_json)
 
-            # Format as JSON-LD script
-            json_ld_script = f'<script type="application/ld+json">{json.dumps(full_json)}</script>'
+        except Exception as e:
+            logger.error(f"Error processing recipe: {e}", exc_info=True)
+            raise
 
-            # Create final JSON structure for Mealie API
-            final_json = {
-                "includeTags": False,
-                "data": json_ld_script
-            }
-                            
-            logger.info("Saving final JSON")
-            with open('./scrapers/final_json.json', 'w') as outfile:
-                json.dump(final_json, outfile, indent=2)
+    @staticmethod
+    def _finish_payload(full_json):
+        """Wraps the recipe as JSON-LD for Mealie's html-or-json endpoint and saves it as final JSON"""
+        # Add current date
+        full_json["datePublished"] = datetime.now().strftime("%Y-%m-%d")
 
-            # Send to Mealie
-            logger.info("Sending to Mealie API")
-            mealie_result = send_recipe("MEALIE", final_json, thumbnail_filename)
+        # Format as JSON-LD script
+        json_ld_script = f'<script type="application/ld+json">{json.dumps(full_json)}</script>'
 
-            return {
-                "url": url,
-                "status": "success",
-                "result": mealie_result
-            }
+        # Create final JSON structure for Mealie API
+        final_json = {
+            "includeTags": False,
+            "data": json_ld_script
+        }
+                        
+        logger.info("Saving final JSON")
+        with open('./scrapers/final_json.json', 'w') as outfile:
+            json.dump(final_json, outfile, indent=2)
 
-        except Exception as e:
-            logger.error(f"Error processing recipe: {e}", exc_info=True)
-            raise
+        return final_json
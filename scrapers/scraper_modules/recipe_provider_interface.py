@@ -1,10 +1,62 @@
 from abc import ABC, abstractmethod
+from contextlib import nullcontext
+
+from scrapers.progress import report_to
 
 class RecipeProviderInterface(ABC):
+    """
+    A provider imports a post in three stages that can run on different
+    workers: `fetch` (caption and thumbnail), `extract` (AI) and `upload`.
+    The stages pass a state dict along. Once the state holds a `result`
+    the job is finished and the remaining stages are skipped.
+
+    While they work, the stages report their progress with
+    `scrapers.progress.report_progress` (caption fetched, parts extracted,
+    upload started, ...), see `scrapers.progress.report_to`.
+    """
+
+    @classmethod
+    def scrape(cls, url, platform, progress=None):
+        """
+        Extracts recipe data from a given URL and platform, running all stages in a row.
+
+        Args:
+            url (str): The URL of the post.
+            platform (str): The platform ('instagram' or 'tiktok').
+            progress (callable, optional): Called with the event name and details
+                of every progress event, see `scrapers.progress.report_progress`.
+        """
+        with report_to(progress) if progress else nullcontext():
+            state = cls.fetch(url, platform)
+            if "result" not in state:
+                cls.extract(state)
+            if "result" not in state:
+                cls.upload(state)
+        return state["result"]
+
+    @staticmethod
+    @abstractmethod
+    def fetch(url, platform):
+        """
+        Gets the caption and thumbnail of the post, or a cached payload or result.
+
+        Returns:
+            dict: The state with `url`, `platform` and `caption`, `payload` or `result`.
+        """
+        pass
+
+    @staticmethod
+    @abstractmethod
+    def extract(state):
+        """
+        Turns the caption into the provider's payload (`state["payload"]`) unless it is cached.
+        """
+        pass
+
     @staticmethod
     @abstractmethod
-    def scrape(url, platform):
+    def upload(state):
         """
-        Extracts recipe data from a given URL and platform.
+        Sends the payload to the provider and stores the outcome in `state["result"]`.
         """
         pass
@@ -1,174 +1,394 @@
 import json
+import os
 
 from logs import setup_logging
-from scrapers.ai_service import get_number_of_steps, initialize_chat, process_recipe_part
-from scrapers.api_service import send_recipe
+from scrapers.ai_service import ai_session, get_number_of_steps, initialize_chat, process_recipe_part, process_recipe_parts
+from scrapers.api_service import send_recipe, validate_tandoor_payload
+from scrapers.content_cache import cache_recipe_payload, cache_recipe_result, get_cached_recipe
+from scrapers.progress import PartCounter, report_progress
 from scrapers.social_scraper import get_caption_from_post
+from scrapers.stock_thumbnails import thumbnail_or_stock
+from scrapers.scraper_modules.caption_parser import read_caption, tandoor_recipe
 from scrapers.scraper_modules.recipe_provider_interface import RecipeProviderInterface
+from scrapers.scraper_modules.tandoor_schema import validate_recipe
+from scrapers.url_utils import resolve_short_url
+from tracing import span
 
 logger = setup_logging("scrape_for_tandoor")
 
+# Define JSON templates for different parts of the recipe
+JSON_PARTS = [
+    {
+        "name": "string",
+        "description": "string",
+        "keywords": [
+            {
+            "name": "string",
+            "description": "string"
+            }
+        ],
+    },
+    {
+        "name": "string",
+        "instruction": "string",
+        "ingredients": [
+            {
+            "food": {
+                "name": "string",
+                "plural_name": "string"
+            },
+            "unit": {
+                "name": "string",
+                "plural_name": "string",
+                "description": "string",
+                "base_unit": "string",
+                "open_data_slug": "string"
+            },
+            "amount": "string",
+            "note": "string",
+            "order": 0,
+            "is_header": True,
+            "no_amount": True
+            }
+        ],
+        "time": 0,
+        "order": 0,
+        "show_as_header": True,
+        "show_ingredients_table": True
+    },
+    {
+        "servings": 0,
+    },
+    {
+        "working_time": 0,
+        "waiting_time": 0,
+        "source_url": "string",
+        "internal": True,
+        "show_ingredient_overview": True,
+    } 
+]
+
+# Template for requesting the complete recipe with a single prompt
+RECIPE_TEMPLATE = {
+    **JSON_PARTS[0],
+    "steps": [JSON_PARTS[1]],
+    "servings": 0,
+    "working_time": 0,
+    "waiting_time": 0,
+}
+
 class TandoorProvider(RecipeProviderInterface):
     @staticmethod
-    def scrape(url, platform):
+    def fetch(url, platform):
         """
-        Process an Instagram or TikTok post URL and extract recipe information.
-        Uses a single browser instance for all Duck.ai interactions.
+        Gets the caption and thumbnail of an Instagram or TikTok post.
+        Posts found in the content cache skip the scraping and AI steps.
         
         Args:
             url (str): The URL of the social media post containing the recipe.
             platform (str): The platform ('instagram' or 'tiktok').
         
         Returns:
-            dict: Result information including URL and status.
+            dict: The state for the next stages.
             
         Raises:
-            Exception: If processing fails.
+            Exception: If no caption was found.
         """
+        # Short links are resolved once here, so every cache key uses the post URL
+        url = resolve_short_url(url)
+        state = {"url": url, "platform": platform}
+        cached = get_cached_recipe(url, "tandoor")
+        if cached and cached.get("recipe_id"):
+            logger.info(f"Recipe already imported as {cached['recipe_id']}")
+            state["result"] = {
+                "status": "success",
+                "recipe_id": cached["recipe_id"],
+                "api_type": "TANDOOR",
+                "already_imported": True
+            }
+            return state
+
+        if cached and cached.get("payload"):
+            logger.info("Using cached recipe payload, skipping scraping and AI extraction")
+            state["payload"] = cached["payload"]
+            state["thumbnail"] = cached.get("thumbnail")
+            report_progress("caption", cached=True)
+            return state
+
         result = get_caption_from_post(url, platform)
         
         if result is None:
             logger.error("No caption or image found")
             raise Exception("No caption or image found")
         
-        caption, thumbnail_filename = result
-        logger.info(f"Caption extracted successfully ({len(caption)} chars)")
+        state["caption"], state["thumbnail"] = result
+        logger.info(f"Caption extracted successfully ({len(state['caption'])} chars)")
+        report_progress("caption", chars=len(state["caption"]))
+        return state
+
+    @staticmethod
+    def extract(state):
+        """
+        Turns the caption into the Tandoor payload. Captions the rule-based
+        parser reads with enough confidence skip the AI, the others use an AI session.
+        """
+        if "payload" in state:
+            return state
+
+        parsed = read_caption(state["caption"])
+        if parsed and parsed["skip_ai"]:
+            logger.info("Recipe read from the caption, skipping AI extraction")
+            state["payload"] = TandoorProvider.recipe_from_caption(parsed, state["url"])
+        else:
+            with ai_session():
+                state["payload"] = TandoorProvider.extract_recipe(state["caption"], state["url"], parsed)
+        state["thumbnail"] = thumbnail_or_stock(state["thumbnail"], state["payload"].get("name"))
+        cache_recipe_payload(state["url"], "tandoor", state["payload"], state["thumbnail"])
+        return state
+
+    @staticmethod
+    def upload(state):
+        """
+        Sends the payload and thumbnail to Tandoor.
+        """
+        logger.info("Sending to Tandoor API")
+        report_progress("upload", target="Tandoor")
+        tandoor_result = send_recipe("TANDOOR", state["payload"], state["thumbnail"])
+        if tandoor_result.get("status") == "success":
+            cache_recipe_result(state["url"], "tandoor", state["payload"], state["thumbnail"], tandoor_result.get("recipe_id"))
+
+        state["result"] = tandoor_result
+        return state
+
+    @staticmethod
+    def recipe_from_caption(parsed, url):
+        """
+        Builds the Tandoor payload from a caption the parser read completely, without AI.
+
+        Args:
+            parsed (dict): The parsed caption, see `caption_parser.read_caption`.
+            url (str): The URL of the post, used as source URL.
+
+        Returns:
+            dict: The validated Tandoor recipe JSON.
+        """
+        full_json, _ = tandoor_recipe(parsed)
+        PartCounter(1).finished("recipe from caption")
+        return TandoorProvider._finish_payload(full_json, url)
+
+    @staticmethod
+    def extract_recipe(caption, url, parsed=None):
+        """
+        Uses the AI module of the current AI session to turn a caption into a Tandoor recipe payload.
+        TANDOOR_EXTRACTION_MODE=single asks for the whole recipe in one prompt and
+        only falls back to separate prompts for the parts that fail validation,
+        the default mode (steps) asks for every part and step separately.
+        If the caption parser could read the steps, only the parts it missed are requested.
         
+        Args:
+            caption (str): The caption of the social media post.
+            url (str): The URL of the post, used as source URL.
+            parsed (dict, optional): The parsed caption, see `caption_parser.read_caption`.
+        
+        Returns:
+            dict: The validated Tandoor recipe JSON.
+            
+        Raises:
+            Exception: If the AI module fails to process the recipe.
+        """
         try:
             # Initialisiere AI-Kontext
             if not initialize_chat(caption):
                 logger.error("Failed to initialize chat with recipe context")
                 raise Exception("Failed to initialize chat with recipe context")
 
-            # Get the number of steps in the recipe
-            number_of_steps = get_number_of_steps(caption)
-            if not number_of_steps:
-                logger.error("Failed to determine number of steps in recipe")
-                raise Exception("Failed to determine number of steps in recipe")
+            caption_json, failed = tandoor_recipe(parsed) if parsed else ({}, None)
+            if failed and not failed["steps"]:
+                logger.info(f"Using the steps read from the caption, requesting {[part for part, value in failed.items() if value]}")
+                full_json = TandoorProvider._complete_recipe(caption, caption_json, failed, PartCounter(TandoorProvider._count_failed(failed)))
+            elif os.getenv("TANDOOR_EXTRACTION_MODE", "steps").lower() == "single":
+                full_json = TandoorProvider._extract_single_shot(caption)
+            else:
+                full_json = TandoorProvider._extract_per_step(caption)
+            return TandoorProvider._finish_payload(full_json, url)
 
-            logger.info(f"Recipe has {number_of_steps} steps")
-
-            # Define JSON templates for different parts of the recipe
-            json_parts = [
-                {
-                    "name": "string",
-                    "description": "string",
-                    "keywords": [
-                        {
-                        "name": "string",
-                        "description": "string"
-                        }
-                    ],
-                },
-                {
-                    "name": "string",
-                    "instruction": "string",
-                    "ingredients": [
-                        {
-                        "food": {
-                            "name": "string",
-                            "plural_name": "string"
-                        },
-                        "unit": {
-                            "name": "string",
-                            "plural_name": "string",
-                            "description": "string",
-                            "base_unit": "string",
-                            "open_data_slug": "string"
-                        },
-                        "amount": "string",
-                        "note": "string",
-                        "order": 0,
-                        "is_header": True,
-                        "no_amount": True
-                        }
-                    ],
-                    "time": 0,
-                    "order": 0,
-                    "show_as_header": True,
-                    "show_ingredients_table": True
-                },
-                {
-                    "servings": 0,
-                },
-                {
-                    "working_time": 0,
-                    "waiting_time": 0,
-                    "source_url": "string",
-                    "internal": True,
-                    "show_ingredient_overview": True,
-                } 
-            ]
+        except Exception as e:
+            logger.error(f"Error processing recipe: {e}", exc_info=True)
+            raise
 
-            # Build the recipe JSON structure
-            full_json = {}
+    @staticmethod
+    def _finish_payload(full_json, url):
+        """Adds the source URL, validates the recipe and saves it as final JSON"""
+        # Add source URL
+        full_json["source_url"] = url
 
-            # Get recipe name and description
-            logger.info("Getting recipe name and description")
-            name_res = process_recipe_part(json_parts[0], context=caption)
-            if name_res:
-                full_json.update(name_res)
-                logger.info(f"Recipe name: {name_res.get('name', 'Unknown')}")
-                context_for_steps = name_res
-            else:
-                logger.warning("Failed to get recipe name and description")
-                context_for_steps = None
-
-            # Get recipe steps and ingredients
-            logger.info("Getting recipe steps and ingredients")
-            steps = {"steps": []}
-            for i in range(1, number_of_steps + 1):
-                logger.info(f"Processing step {i}/{number_of_steps}")
-                instruction_res = process_recipe_part(json_parts[1], "step", i, context=context_for_steps)
-                if instruction_res:
-                    steps["steps"].append(instruction_res)
-                    logger.info(f"Step {i} processed successfully")
-                else:
-                    logger.warning(f"Failed to process step {i}")
-            full_json.update(steps)
-            context_for_servings = {**full_json}  # Kontext für Servings/Nutrition
-
-            # Get serving information
-            logger.info("Getting serving information")
-            servings_res = process_recipe_part(json_parts[2], context=context_for_servings)
-            if servings_res:
-                full_json.update(servings_res)
-                logger.info(f"Servings: {servings_res.get('servings', 'Unknown')}")
-            else:
-                logger.warning("Failed to get serving information")
-
-            # Get nutrition and timing information
-            logger.info("Getting nutrition and timing information")
-            nutrition_res = process_recipe_part(json_parts[3], context=context_for_servings)
-            if nutrition_res:
-                full_json.update(nutrition_res)
-                logger.info("Nutrition and timing information processed successfully")
-            else:
-                logger.warning("Failed to get nutrition and timing information")
+        # Fix ingredient header flags
+        for step in full_json.get("steps", []):
+            for ingredient in step.get("ingredients", []):
+                ingredient["is_header"] = False
+
+        # Moderne Validierung: Nutze Hilfsfunktion aus api_service
+        with span("payload.validate", target="tandoor"):
+            full_json = validate_tandoor_payload(full_json, source_url=url)
 
-            # Add source URL
-            full_json["source_url"] = url
+        # Save the final JSON
+        logger.info("Saving final JSON")
+        with open('./scrapers/final_json.json', 'w') as outfile:
+            json.dump(full_json, outfile, indent=2)
 
-            # Fix ingredient header flags
-            for step in full_json.get("steps", []):
-                for ingredient in step.get("ingredients", []):
-                    ingredient["is_header"] = False
+        return full_json
 
-            # Moderne Validierung: Nutze Hilfsfunktion aus api_service
-            from scrapers.api_service import validate_tandoor_payload
-            full_json = validate_tandoor_payload(full_json, source_url=url)
+    @staticmethod
+    def _extract_per_step(caption):
+        """Requests name, every single step, servings and timing with separate prompts"""
+        # Step count and name, the steps, servings and timing are added once the count is known
+        parts = PartCounter(2)
 
-            # Save the final JSON
-            logger.info("Saving final JSON")
-            with open('./scrapers/final_json.json', 'w') as outfile:
-                json.dump(full_json, outfile, indent=2)
+        # Get the number of steps in the recipe
+        number_of_steps = get_number_of_steps(caption)
+        if not number_of_steps:
+            logger.error("Failed to determine number of steps in recipe")
+            raise Exception("Failed to determine number of steps in recipe")
 
-            # Send to Tandoor
-            logger.info("Sending to Tandoor API")
-            tandoor_result = send_recipe("TANDOOR", full_json, thumbnail_filename)
+        logger.info(f"Recipe has {number_of_steps} steps")
+        parts.add(number_of_steps + 2)
+        parts.finished("number of steps")
 
-            return tandoor_result
+        # Build the recipe JSON structure
+        full_json = TandoorProvider._extract_name(caption, parts)
+        context_for_steps = {**full_json} or None
 
-        except Exception as e:
-            logger.error(f"Error processing recipe: {e}", exc_info=True)
-            raise
\ No newline at end of file
+        # Get recipe steps and ingredients
+        logger.info("Getting recipe steps and ingredients")
+        steps = TandoorProvider._extract_steps(range(1, number_of_steps + 1), context_for_steps, parts)
+        full_json["steps"] = [step for _, step in sorted(steps.items()) if step]
+
+        context_for_servings = {**full_json}  # Kontext für Servings/Nutrition
+        full_json.update(TandoorProvider._extract_servings(context_for_servings, parts))
+        full_json.update(TandoorProvider._extract_timing(context_for_servings, parts))
+        return full_json
+
+    @staticmethod
+    def _extract_single_shot(caption):
+        """Requests the complete recipe at once and re-requests only the parts that fail validation"""
+        logger.info("Getting complete recipe with a single prompt")
+        parts = PartCounter(1)
+        recipe_res = process_recipe_part(RECIPE_TEMPLATE, "recipe", context=caption)
+        with span("payload.validate", target="tandoor", schema="recipe"):
+            full_json, failed = validate_recipe(recipe_res)
+        parts.add(TandoorProvider._count_failed(failed))
+        parts.finished("recipe")
+        return TandoorProvider._complete_recipe(caption, full_json, failed, parts)
+
+    @staticmethod
+    def _count_failed(failed):
+        """Every part that failed validation costs another prompt"""
+        return (
+            bool(failed["name"]) + bool(failed["servings"]) + bool(failed["timing"])
+            + (1 if failed["steps"] is True else len(failed["steps"] or ()))
+        )
+
+    @staticmethod
+    def _complete_recipe(caption, full_json, failed, parts):
+        """
+        Requests the failed parts (see `tandoor_schema.validate_recipe`) of a
+        recipe separately and merges them into `full_json`.
+        """
+        if failed["name"]:
+            logger.warning("Recipe name failed validation, requesting it separately")
+            full_json.update(TandoorProvider._extract_name(caption, parts))
+        context_for_steps = {key: full_json[key] for key in ("name", "description", "keywords") if key in full_json} or None
+
+        if failed["steps"] is True:
+            logger.warning("Recipe steps failed validation, falling back to per-step extraction")
+            number_of_steps = get_number_of_steps(caption)
+            if not number_of_steps:
+                logger.error("Failed to determine number of steps in recipe")
+                raise Exception("Failed to determine number of steps in recipe")
+            parts.add(number_of_steps)
+            parts.finished("number of steps")
+            steps = TandoorProvider._extract_steps(range(1, number_of_steps + 1), context_for_steps, parts)
+            full_json["steps"] = [step for _, step in sorted(steps.items()) if step]
+        elif failed["steps"]:
+            logger.warning(f"Steps {failed['steps']} failed validation, requesting them separately")
+            retried = TandoorProvider._extract_steps(failed["steps"], context_for_steps, parts)
+            full_json["steps"] = [
+                retried.get(i) if i in retried else step
+                for i, step in enumerate(full_json["steps"], start=1)
+            ]
+            full_json["steps"] = [step for step in full_json["steps"] if step]
+        else:
+            logger.info(f"Recipe has {len(full_json['steps'])} steps")
+
+        context_for_servings = {**full_json}
+        if failed["servings"]:
+            logger.warning("Servings failed validation, requesting them separately")
+            full_json.update(TandoorProvider._extract_servings(context_for_servings, parts))
+        if failed["timing"]:
+            logger.warning("Timing failed validation, requesting it separately")
+            full_json.update(TandoorProvider._extract_timing(context_for_servings, parts))
+        return full_json
+
+    @staticmethod
+    def _extract_name(caption, parts):
+        # Get recipe name and description
+        logger.info("Getting recipe name and description")
+        name_res = process_recipe_part(JSON_PARTS[0], context=caption)
+        parts.finished("name")
+        if name_res:
+            logger.info(f"Recipe name: {name_res.get('name', 'Unknown')}")
+            return name_res
+        logger.warning("Failed to get recipe name and description")
+        return {}
+
+    @staticmethod
+    def _extract_steps(step_numbers, context, parts):
+        """
+        Requests the given steps, concurrently if the AI module supports it.
+        Every answered step is counted in `parts` right away.
+        
+        Returns:
+            dict: Step number -> step JSON, or None if the step could not be processed.
+        """
+        step_numbers = list(step_numbers)
+        logger.info(f"Processing steps {step_numbers}")
+        results = process_recipe_parts(
+            [
+                {"part": JSON_PARTS[1], "mode": "step", "step_number": i, "context": context}
+                for i in step_numbers
+            ],
+            on_result=lambda index, result: parts.finished(f"step {step_numbers[index]}")
+        )
+        steps = {}
+        for i, instruction_res in zip(step_numbers, results):
+            if instruction_res:
+                steps[i] = instruction_res
+                logger.info(f"Step {i} processed successfully")
+            else:
+                steps[i] = None
+                logger.warning(f"Failed to process step {i}")
+        return steps
+
+    @staticmethod
+    def _extract_servings(context, parts):
+        # Get serving information
+        logger.info("Getting serving information")
+        servings_res = process_recipe_part(JSON_PARTS[2], context=context)
+        parts.finished("servings")
+        if servings_res:
+            logger.info(f"Servings: {servings_res.get('servings', 'Unknown')}")
+            return servings_res
+        logger.warning("Failed to get serving information")
+        return {}
+
+    @staticmethod
+    def _extract_timing(context, parts):
+        # Get nutrition and timing information
+        logger.info("Getting nutrition and timing information")
+        nutrition_res = process_recipe_part(JSON_PARTS[3], context=context)
+        parts.finished("timing")
+        if nutrition_res:
+            logger.info("Nutrition and timing information processed successfully")
+            return nutrition_res
+        logger.warning("Failed to get nutrition and timing information")
+        return {}
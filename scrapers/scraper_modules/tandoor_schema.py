@@ -0,0 +1,105 @@
+PLACEHOLDER_VALUES = ("", "string")
+
+def _is_text(value):
+    return isinstance(value, str) and value.strip() not in PLACEHOLDER_VALUES
+
+def _to_number(value):
+    try:
+        return float(str(value).replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+
+def _to_int(value):
+    number = _to_number(value)
+    if number is None or number < 0:
+        return None
+    return int(round(number))
+
+def validate_ingredient(ingredient):
+    """
+    Checks a single ingredient of a Tandoor step and normalizes its amount.
+
+    Args:
+        ingredient (dict): The ingredient object as returned by the AI module.
+
+    Returns:
+        bool: True if the ingredient can be sent to Tandoor.
+    """
+    if not isinstance(ingredient, dict):
+        return False
+    food = ingredient.get("food")
+    if not isinstance(food, dict) or not _is_text(food.get("name")):
+        return False
+    if ingredient.get("amount") in (None, ""):
+        ingredient["amount"] = 0
+        ingredient["no_amount"] = True
+        return True
+    amount = _to_number(ingredient.get("amount"))
+    if amount is None:
+        return False
+    ingredient["amount"] = amount
+    return True
+
+def validate_step(step):
+    """
+    Checks a single Tandoor step.
+
+    Args:
+        step (dict): The step object as returned by the AI module.
+
+    Returns:
+        bool: True if the step has an instruction and only valid ingredients.
+    """
+    if not isinstance(step, dict) or not _is_text(step.get("instruction")):
+        return False
+    ingredients = step.get("ingredients", [])
+    if not isinstance(ingredients, list):
+        return False
+    return all(validate_ingredient(ingredient) for ingredient in ingredients)
+
+def validate_recipe(recipe):
+    """
+    Splits a complete Tandoor recipe into the parts that passed validation
+    and the parts that have to be requested again.
+
+    Args:
+        recipe (dict): The recipe JSON as returned by a single-shot prompt.
+
+    Returns:
+        tuple: (valid_parts, failed) where `valid_parts` is a dict with the
+            fields that can be used as is and `failed` is a dict with the keys
+            'name', 'steps', 'servings' and 'timing'. 'steps' holds the list of
+            1-based step numbers that failed, True if the step list itself is
+            unusable, or False if all steps are valid. The other keys are booleans.
+    """
+    valid_parts = {}
+    failed = {"name": True, "steps": True, "servings": True, "timing": True}
+    if not isinstance(recipe, dict):
+        return valid_parts, failed
+
+    if _is_text(recipe.get("name")):
+        valid_parts["name"] = recipe["name"].strip()
+        failed["name"] = False
+        if isinstance(recipe.get("description"), str):
+            valid_parts["description"] = recipe["description"]
+        if isinstance(recipe.get("keywords"), list):
+            valid_parts["keywords"] = [k for k in recipe["keywords"] if isinstance(k, dict) and _is_text(k.get("name"))]
+
+    steps = recipe.get("steps")
+    if isinstance(steps, list) and steps:
+        valid_parts["steps"] = steps
+        failed["steps"] = [i for i, step in enumerate(steps, start=1) if not validate_step(step)] or False
+
+    servings = _to_int(recipe.get("servings"))
+    if servings:
+        valid_parts["servings"] = servings
+        failed["servings"] = False
+
+    working_time = _to_int(recipe.get("working_time"))
+    waiting_time = _to_int(recipe.get("waiting_time"))
+    if working_time is not None and waiting_time is not None:
+        valid_parts["working_time"] = working_time
+        valid_parts["waiting_time"] = waiting_time
+        failed["timing"] = False
+
+    return valid_parts, failed
@@ -18,6 +18,6 @@ class ScraperService:
         return provider
 
     @staticmethod
-    def scrape_recipe(url, platform):
+    def scrape_recipe(url, platform, progress=None):
         provider = ScraperService.get_provider()
-        return provider.scrape(url, platform)
+        return provider.scrape(url, platform, progress)
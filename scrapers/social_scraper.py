@@ -1,80 +1,238 @@
+import json
+import os
+import threading
+
+import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
 from logs import setup_logging
+from scrapers.content_cache import cache_caption, get_cached_caption
 from scrapers.manage_browser import open_browser, close_browser, capture_thumbnail
+from scrapers.thumbnails import create_thumbnail
+from tracing import span
 
 # Setup logging
 logger = setup_logging("social_scraper")
 
+DEFAULT_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
+)
+
+_session = None
+_session_lock = threading.Lock()
+
+# Hit/miss counters for the HTTP fast path and the browser fallback
+_caption_stats = {"http_hits": 0, "http_misses": 0, "browser_hits": 0, "browser_misses": 0}
+_caption_stats_lock = threading.Lock()
+
+def _count(key):
+    with _caption_stats_lock:
+        _caption_stats[key] += 1
+
+def get_caption_stats():
+    """
+    Returns the caption extraction counters and the hit rate of each path.
+
+    Returns:
+        dict: Counters plus `http_hit_rate` and `browser_hit_rate` (None if unused).
+    """
+    with _caption_stats_lock:
+        stats = dict(_caption_stats)
+    http_total = stats["http_hits"] + stats["http_misses"]
+    browser_total = stats["browser_hits"] + stats["browser_misses"]
+    stats["http_hit_rate"] = stats["http_hits"] / http_total if http_total else None
+    stats["browser_hit_rate"] = stats["browser_hits"] / browser_total if browser_total else None
+    return stats
+
+def get_http_session():
+    """
+    Returns the shared HTTP session used for the browserless fast path.
+    Connections are kept alive and reused across jobs.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _session.headers.update({
+                "User-Agent": os.getenv("CAPTION_HTTP_USER_AGENT", DEFAULT_USER_AGENT),
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+                "Accept-Language": "en-US,en;q=0.9",
+            })
+    return _session
+
+def extract_caption(source, platform):
+    """
+    Extracts the caption from the HTML of a social media post.
+
+    Args:
+        source (str): The HTML of the post page.
+        platform (str): The platform ("instagram", "tiktok", "i", etc.)
+
+    Returns:
+        str or None: The caption if found, otherwise None.
+    """
+    with span("caption.parse", platform=platform) as attributes:
+        caption = _parse_caption(source, platform)
+        attributes["found"] = caption is not None
+    return caption
+
+def _parse_caption(source, platform):
+    data = BeautifulSoup(source, 'html.parser')
+    caption = None
+
+    # Handle platform-specific caption extraction
+    if platform == "instagram" or platform == "i":
+        logger.info("Extracting Instagram caption")
+        try:
+            meta_desc = data.find('meta', attrs={'name': 'description'})
+            if meta_desc and meta_desc.get('content'):
+                content = meta_desc.get('content')
+                logger.info(f"Found meta description: {content[:50]}...")
+                parts = content.split('"')
+                if len(parts) >= 2:
+                    caption = parts[1]
+                    logger.info(f"Extracted Instagram caption from meta quotes: {caption}.")
+        except Exception as e:
+            logger.info(f"Error extracting caption from meta description: {e}", exc_info=True)
+
+    else:
+        # Handle TikTok captions
+        logger.info("Extracting TikTok caption")
+        try:
+            # Find caption in <img> alt attributes within <picture> elements
+            pictures = data.find_all('picture')
+            for picture in pictures:
+                img = picture.find('img')
+                if img and img.get('alt'):
+                    caption = img.get('alt')
+                    logger.info(f"Found TikTok caption from image alt: {caption[:50]}...")
+                    break
+            # Server-rendered pages carry the caption in the embedded rehydration JSON
+            if not caption:
+                script = data.find('script', attrs={'id': '__UNIVERSAL_DATA_FOR_REHYDRATION__'})
+                if script and script.string:
+                    scope = json.loads(script.string).get('__DEFAULT_SCOPE__', {})
+                    item = scope.get('webapp.video-detail', {}).get('itemInfo', {}).get('itemStruct', {})
+                    if item.get('desc'):
+                        caption = item['desc']
+                        logger.info(f"Found TikTok caption in embedded JSON: {caption[:50]}...")
+        except Exception as e:
+            logger.info(f"Error extracting TikTok caption: {e}", exc_info=True)
+
+    return caption
+
+def download_thumbnail(source):
+    """
+    Downloads the preview image referenced by the `og:image` meta tag.
+
+    Args:
+        source (str): The HTML of the post page.
+
+    Returns:
+        Thumbnail or None: The encoded thumbnail if successful, otherwise None.
+    """
+    data = BeautifulSoup(source, 'html.parser')
+    og_image = data.find('meta', attrs={'property': 'og:image'})
+    if not og_image or not og_image.get('content'):
+        return None
+    try:
+        with span("thumbnail.capture", source="og:image"):
+            response = get_http_session().get(og_image.get('content'), timeout=10)
+            response.raise_for_status()
+            thumbnail = create_thumbnail(response.content)
+        logger.info(f"Thumbnail downloaded from og:image: {thumbnail}")
+        return thumbnail
+    except Exception as e:
+        logger.info(f"Failed to download og:image thumbnail: {e}")
+        return None
+
+def get_caption_via_http(url, platform):
+    """
+    Browserless fast path: fetches the post with a plain HTTP request and
+    parses the server-rendered HTML with the same rules as the browser path.
+
+    Args:
+        url (str): The URL of the social media post.
+        platform (str): The platform ("instagram", "tiktok", "i", etc.)
+
+    Returns:
+        tuple: (caption, thumbnail) if successful, otherwise None.
+    """
+    try:
+        with span("page.load", via="http", platform=platform) as attributes:
+            response = get_http_session().get(url, timeout=(5, 15))
+            attributes["status_code"] = response.status_code
+            response.raise_for_status()
+    except Exception as e:
+        logger.info(f"HTTP fetch of {url} failed: {e}")
+        return None
+
+    caption = extract_caption(response.text, platform)
+    if not caption:
+        return None
+    return caption, download_thumbnail(response.text)
+
 def get_caption_from_post(url, platform):
     """
     Extracts the caption from a social media post given its URL.
     And saves a thumbnail of the video if present.
-    
+    Uses the content cache if the post was scraped before, then tries a plain
+    HTTP request and only opens a browser if that fails.
+
     Args:
         url (str): The URL of the social media post.
         platform (str): The platform ("instagram", "tiktok", "i", etc.)
-        
+
     Returns:
-        tuple: (caption, thumbnail_filename) if successful, otherwise None.
+        tuple: (caption, thumbnail) if successful, otherwise None.
     """
-    
+
     logger.info(f"Extracting caption from {platform} post: {url}")
-    
+
+    cached = get_cached_caption(url)
+    if cached:
+        return cached
+
+    if os.getenv("CAPTION_FAST_PATH", "true").lower() == "true":
+        result = get_caption_via_http(url, platform)
+        if result:
+            _count("http_hits")
+            logger.info(f"Caption found via HTTP fast path ({len(result[0])} chars)")
+            cache_caption(url, *result)
+            return result
+        _count("http_misses")
+        logger.info("HTTP fast path failed, falling back to browser")
+
     # Open browser with the specified URL and platform
     browser = open_browser(url, platform)
     if not browser:
         logger.error("Failed to open browser")
+        _count("browser_misses")
         return None
-    
+
     try:
         # Attempt to capture thumbnail
-        thumbnail_filename = capture_thumbnail(browser)
-        
+        thumbnail = capture_thumbnail(browser)
+
         # Parse the page content
         logger.info("Parsing page content")
-        source = browser.page_source
-        data = BeautifulSoup(source, 'html.parser')
-        
-        # Handle platform-specific caption extraction
-        if platform == "instagram" or platform == "i":
-            logger.info("Extracting Instagram caption")
-            caption = None
-            
-            try:
-                meta_desc = data.find('meta', attrs={'name': 'description'})
-                if meta_desc and meta_desc.get('content'):
-                    content = meta_desc.get('content')
-                    logger.info(f"Found meta description: {content[:50]}...")
-                    parts = content.split('"')
-                    if len(parts) >= 2:
-                        caption = parts[1]
-                        logger.info(f"Extracted Instagram caption from meta quotes: {caption}.")
-            except Exception as e:
-                logger.info(f"Error extracting caption from meta description: {e}", exc_info=True)
-            
-        else:
-            # Handle TikTok captions
-            logger.info("Extracting TikTok caption")
-            caption = None
-            try:
-                # Find caption in <img> alt attributes within <picture> elements
-                pictures = data.find_all('picture')
-                for picture in pictures:
-                    img = picture.find('img')
-                    if img and img.get('alt'):
-                        caption = img.get('alt')
-                        logger.info(f"Found TikTok caption from image alt: {caption[:50]}...")
-                        break
-            except Exception as e:
-                logger.info(f"Error extracting TikTok caption: {e}", exc_info=True)
-        
+        caption = extract_caption(browser.page_source, platform)
+
         if caption:
-            logger.info(f"Caption found ({len(caption)} chars) and thumbnail saved to {thumbnail_filename}")
-            return caption, thumbnail_filename
+            _count("browser_hits")
+            logger.info(f"Caption found ({len(caption)} chars), thumbnail: {thumbnail}")
+            cache_caption(url, caption, thumbnail)
+            return caption, thumbnail
         else:
+            _count("browser_misses")
             logger.info("Caption not found")
             return None
-            
+
     finally:
         # Always close the browser
-        close_browser(browser)
\ No newline at end of file
+        close_browser(browser)
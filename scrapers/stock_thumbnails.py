@@ -0,0 +1,321 @@
+import hashlib
+import os
+import queue
+import random
+import re
+import shutil
+import threading
+from collections import OrderedDict
+
+import requests
+
+from logs import setup_logging
+from scrapers.thumbnails import Thumbnail, cache_thumbnail, encode_thumbnail
+from tracing import span
+
+logger = setup_logging("stock_thumbnails")
+
+DEFAULT_TERM = "food"
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Generic food image shipped with the app, used while nothing could be downloaded
+FALLBACK_IMAGE = os.path.join(_ROOT, "static", "stock", "food.jpg")
+DEFAULT_CACHE_DIR = os.path.join(_ROOT, "instance", "stock_thumbnails")
+UNSPLASH_URL = "https://images.unsplash.com/photo-1504674900247-0877df9cc836?auto=format&fit=crop&w=640&q=80"
+
+
+def download_stock_image(term, timeout=10):
+    """
+    Downloads a random image for `term` from loremflickr, or the generic
+    Unsplash image if that fails.
+
+    Returns:
+        bytes or None: The image, None if both sources failed.
+    """
+    # Every word is a tag, `lock` picks a different (but stable) image per number
+    tags = ",".join(requests.utils.quote(tag) for tag in re.split(r"[-\s]+", term) if tag)
+    sources = [
+        f"https://loremflickr.com/640/480/{tags or DEFAULT_TERM}?lock={random.randint(1, 100000)}",
+        UNSPLASH_URL,
+    ]
+    for url in sources:
+        try:
+            response = requests.get(url, timeout=timeout)
+            if response.status_code == 200:
+                return response.content
+            logger.info(f"Failed to fetch stock image from {url}, status: {response.status_code}")
+        except Exception as e:
+            logger.info(f"Error fetching stock image from {url}: {e}")
+    return None
+
+
+class StockThumbnailCache:
+    """
+    Cache of stock images for the Docker setup, where no video can be
+    captured. Images are kept per search term, the least recently used terms
+    are evicted once the images take more than `max_bytes`. With a
+    `cache_dir` downloads are also written to disk and loaded again on the
+    next start, so the cache isn't cold after every restart.
+
+    `get` never waits for the network: it returns a cached image, falls back
+    to a generic food image or the bundled offline image, and leaves the
+    download to a background thread that keeps `images_per_term` images per term.
+    """
+
+    def __init__(self, fetch, max_bytes=20 * 1024 * 1024, images_per_term=5, fallback_path=FALLBACK_IMAGE, cache_dir=None):
+        """
+        Args:
+            fetch (callable): Function returning the raw bytes of a new image for a term, or None.
+            max_bytes (int): Maximum size of all cached images.
+            images_per_term (int): Number of different images kept per term.
+            fallback_path (str): Image used while nothing is cached.
+            cache_dir (str, optional): Directory the downloaded images are kept in.
+        """
+        self.fetch = fetch
+        self.max_bytes = max_bytes
+        self.images_per_term = max(1, images_per_term)
+        self.fallback_path = fallback_path
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._fallback = None
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._worker = None
+        self._stats = {"hits": 0, "misses": 0, "fallbacks": 0, "downloads": 0, "download_failures": 0, "evictions": 0}
+        if cache_dir:
+            self._load(cache_dir)
+
+    @staticmethod
+    def term_key(term):
+        """Normalizes a search term, the key doubles as directory name in `cache_dir`"""
+        term = re.sub(r"[^\w\s-]", "", (term or "").lower())
+        return "-".join(term.split())[:64] or DEFAULT_TERM
+
+    def get(self, term=DEFAULT_TERM):
+        """
+        Returns:
+            Thumbnail or None: An image for `term`, a generic one if none is
+                cached yet, None only if the bundled fallback is missing.
+        """
+        term = self.term_key(term)
+        with self._lock:
+            images = self._entries.get(term)
+            if images:
+                self._entries.move_to_end(term)
+                self._stats["hits"] += 1
+            else:
+                self._stats["misses"] += 1
+                images = self._entries.get(DEFAULT_TERM)
+            thumbnail = random.choice(images) if images else None
+
+        self.prefetch(term)
+        if term != DEFAULT_TERM:
+            self.prefetch(DEFAULT_TERM)
+        if thumbnail is None:
+            thumbnail = self._fallback_thumbnail()
+        if thumbnail is None:
+            return None
+        # Cached images are shared, every job gets its own copy
+        return Thumbnail(thumbnail.data, thumbnail.extension)
+
+    def prefetch(self, term=DEFAULT_TERM):
+        """Queue downloads for `term` in the background if it has fewer than `images_per_term` images"""
+        term = self.term_key(term)
+        with self._lock:
+            if term in self._queued or len(self._entries.get(term, ())) >= self.images_per_term:
+                return
+            self._queued.add(term)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._worker_loop, name="stock-thumbnails", daemon=True)
+                self._worker.start()
+        self._queue.put(term)
+
+    def _fallback_thumbnail(self):
+        with self._lock:
+            self._stats["fallbacks"] += 1
+            if self._fallback is not None:
+                return self._fallback
+        try:
+            with open(self.fallback_path, "rb") as f:
+                fallback = encode_thumbnail(f.read())
+        except Exception as e:
+            logger.error(f"Failed to load fallback thumbnail {self.fallback_path}: {e}")
+            return None
+        with self._lock:
+            self._fallback = fallback
+        return fallback
+
+    def _load(self, cache_dir):
+        """Loads the images kept in `cache_dir`, the most recently used terms first"""
+        try:
+            terms = [entry for entry in os.scandir(cache_dir) if entry.is_dir()]
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.warning(f"Failed to read stock image cache {cache_dir}: {e}")
+            return
+        loaded = []
+        for entry in sorted(terms, key=lambda entry: entry.stat().st_mtime, reverse=True):
+            images = []
+            for name in sorted(os.listdir(entry.path))[:self.images_per_term]:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(entry.path, name)
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                except OSError:
+                    continue
+                if self._bytes + len(data) > self.max_bytes:
+                    break
+                images.append(Thumbnail(data, os.path.splitext(name)[1].lstrip(".").lower(), path=path))
+                self._bytes += len(data)
+            if not images:
+                # Over the size limit, the directory is dropped like an evicted term
+                shutil.rmtree(entry.path, ignore_errors=True)
+                continue
+            loaded.append((entry.name, images))
+        # OrderedDict keeps the least recently used term first
+        for term, images in reversed(loaded):
+            self._entries[term] = images
+        if loaded:
+            logger.info(f"Loaded {sum(len(images) for _, images in loaded)} stock images from {cache_dir}")
+
+    def _save(self, term, thumbnail):
+        """Writes a downloaded image to `cache_dir`, named after its content"""
+        if not self.cache_dir:
+            return
+        directory = os.path.join(self.cache_dir, term)
+        path = os.path.join(directory, f"{hashlib.sha256(thumbnail.data).hexdigest()[:32]}.{thumbnail.extension}")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(thumbnail.data)
+            os.replace(temp_path, path)
+            thumbnail.path = path
+        except OSError as e:
+            logger.warning(f"Failed to store stock image for {term}: {e}")
+
+    def _forget(self, term):
+        if self.cache_dir:
+            shutil.rmtree(os.path.join(self.cache_dir, term), ignore_errors=True)
+
+    def _worker_loop(self):
+        while True:
+            term = self._queue.get()
+            try:
+                self._fill(term)
+            except Exception as e:
+                logger.error(f"Failed to prefetch stock images for {term}: {e}", exc_info=True)
+            finally:
+                with self._lock:
+                    self._queued.discard(term)
+
+    def _count(self, term):
+        with self._lock:
+            return len(self._entries.get(term, ()))
+
+    def _fill(self, term):
+        while self._count(term) < self.images_per_term:
+            raw = self.fetch(term)
+            if raw is None:
+                with self._lock:
+                    self._stats["download_failures"] += 1
+                return
+            try:
+                thumbnail = encode_thumbnail(raw)
+            except Exception as e:
+                logger.info(f"Failed to encode stock image for {term}: {e}")
+                with self._lock:
+                    self._stats["download_failures"] += 1
+                return
+            if not self._add(term, thumbnail):
+                return
+
+    def _add(self, term, thumbnail):
+        size = len(thumbnail.data)
+        evicted_terms = []
+        with self._lock:
+            self._stats["downloads"] += 1
+            # Make room by dropping the least recently used other terms
+            while self._bytes + size > self.max_bytes and any(key != term for key in self._entries):
+                key = next(key for key in self._entries if key != term)
+                evicted = self._entries.pop(key)
+                self._bytes -= sum(len(image.data) for image in evicted)
+                self._stats["evictions"] += 1
+                evicted_terms.append(key)
+            if self._bytes + size > self.max_bytes:
+                added = False
+            else:
+                self._entries.setdefault(term, []).append(thumbnail)
+                self._entries.move_to_end(term)
+                self._bytes += size
+                added = True
+        for key in evicted_terms:
+            self._forget(key)
+        if not added:
+            return False
+        self._save(term, thumbnail)
+        logger.info(f"Cached stock image for {term}: {thumbnail}")
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "terms": len(self._entries),
+                "images": sum(len(images) for images in self._entries.values()),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_stock_thumbnail_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            timeout = float(os.getenv("STOCK_THUMBNAIL_TIMEOUT", 10))
+            _cache = StockThumbnailCache(
+                lambda term: download_stock_image(term, timeout=timeout),
+                max_bytes=int(os.getenv("STOCK_THUMBNAIL_CACHE_BYTES", 20 * 1024 * 1024)),
+                images_per_term=int(os.getenv("STOCK_THUMBNAIL_PREFETCH", 5)),
+                cache_dir=os.getenv("STOCK_THUMBNAIL_DIR", DEFAULT_CACHE_DIR) or None
+            )
+    return _cache
+
+def get_stock_thumbnail(term=DEFAULT_TERM):
+    """
+    Returns a stock image for `term` without waiting for a download, see
+    `StockThumbnailCache`. The copy is written to the thumbnail cache if enabled.
+
+    Returns:
+        Thumbnail or None: The thumbnail of this job.
+    """
+    thumbnail = get_stock_thumbnail_cache().get(term)
+    return cache_thumbnail(thumbnail) if thumbnail else None
+
+def uses_stock_thumbnails():
+    """In the Docker image (BROWSER=docker) no video can be captured, recipes get stock images instead"""
+    return os.getenv("BROWSER") == "docker"
+
+def thumbnail_or_stock(thumbnail, recipe_name):
+    """
+    Returns the thumbnail of the post, or in the Docker image a stock image
+    searched by the recipe name if the post had none.
+    """
+    if thumbnail is not None or not uses_stock_thumbnails():
+        return thumbnail
+    with span("thumbnail.capture", source="stock"):
+        thumbnail = get_stock_thumbnail(recipe_name or DEFAULT_TERM)
+    logger.info(f"Using stock thumbnail for {recipe_name}: {thumbnail}")
+    return thumbnail
+
+def get_stock_thumbnail_stats():
+    """Returns the stats of the stock image cache, None if it was never used"""
+    with _cache_lock:
+        return _cache.stats() if _cache else None
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import threading
+from io import BytesIO
+
+from PIL import Image, features
+
+from logs import setup_logging
+
+logger = setup_logging("thumbnails")
+
+THUMBNAIL_DIR = 'thumbnails'
+# THUMBNAIL_FORMAT -> (PIL format, file extension, content type)
+FORMATS = {
+    "jpeg": ("JPEG", "jpg", "image/jpeg"),
+    "webp": ("WEBP", "webp", "image/webp"),
+}
+CONTENT_TYPES = {extension: content_type for _, extension, content_type in FORMATS.values()}
+
+
+class Thumbnail:
+    """
+    Encoded thumbnail, carried in memory from the capture to the upload.
+    `path` is only set if the thumbnail was also written to the disk cache.
+    """
+
+    def __init__(self, data, extension, path=None):
+        """
+        Args:
+            data (bytes): The encoded image.
+            extension (str): File extension of the encoding ("jpg" or "webp").
+            path (str, optional): Location in the thumbnail cache.
+        """
+        self.data = data
+        self.extension = extension
+        self.path = path
+
+    @property
+    def content_type(self):
+        return CONTENT_TYPES.get(self.extension, f"image/{self.extension}")
+
+    @property
+    def filename(self):
+        return os.path.basename(self.path) if self.path else f"thumbnail.{self.extension}"
+
+    def __repr__(self):
+        return f"<Thumbnail {self.filename} {len(self.data)} bytes>"
+
+
+def _output_format():
+    name = os.getenv("THUMBNAIL_FORMAT", "jpeg").lower()
+    if name not in FORMATS:
+        logger.warning(f"Unknown THUMBNAIL_FORMAT {name}, using jpeg")
+        name = "jpeg"
+    if name == "webp" and not features.check("webp"):
+        logger.warning("Pillow was built without WebP support, using jpeg")
+        name = "jpeg"
+    return FORMATS[name]
+
+def encode_thumbnail(raw):
+    """
+    Decodes a captured or downloaded image once, scales it down to fit into
+    THUMBNAIL_MAX_SIZE pixels and encodes it as THUMBNAIL_FORMAT.
+
+    Args:
+        raw (bytes): The image as captured (PNG screenshot, JPEG download, ...).
+
+    Returns:
+        Thumbnail: The encoded thumbnail, not written to disk.
+    """
+    pil_format, extension, _ = _output_format()
+    max_size = int(os.getenv("THUMBNAIL_MAX_SIZE", 1024))
+    quality = int(os.getenv("THUMBNAIL_QUALITY", 85))
+
+    with Image.open(BytesIO(raw)) as img:
+        # JPEGs are scaled down by the decoder already, the rest in `thumbnail`
+        img.draft("RGB", (max_size, max_size))
+        if img.mode in ("RGBA", "LA", "P"):
+            # Transparent areas become white instead of black
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_size, max_size))
+        output = BytesIO()
+        img.save(output, format=pil_format, quality=quality)
+    return Thumbnail(output.getvalue(), extension)
+
+def create_thumbnail(raw):
+    """
+    Encodes a captured image and, if THUMBNAIL_CACHE is enabled, stores it in
+    the thumbnail cache so a retry of the job can upload it again.
+
+    Args:
+        raw (bytes): The image as captured.
+
+    Returns:
+        Thumbnail or None: The thumbnail, None if the image could not be decoded.
+    """
+    try:
+        thumbnail = encode_thumbnail(raw)
+    except Exception as e:
+        logger.info(f"Failed to encode thumbnail: {e}")
+        return None
+    return cache_thumbnail(thumbnail)
+
+def cache_thumbnail(thumbnail):
+    """
+    Writes the thumbnail to the thumbnail cache if THUMBNAIL_CACHE is enabled.
+    Cached files are named after their content, so concurrent jobs never collide.
+
+    Returns:
+        Thumbnail: The same thumbnail, with `path` set if it was cached.
+    """
+    if os.getenv("THUMBNAIL_CACHE", "false").lower() != "true":
+        return thumbnail
+    path = os.path.join(THUMBNAIL_DIR, f"{hashlib.sha256(thumbnail.data).hexdigest()[:32]}.{thumbnail.extension}")
+    try:
+        os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+        if os.path.exists(path):
+            # Keeps the retention cleanup from removing it as unused
+            os.utime(path)
+        else:
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(thumbnail.data)
+            os.replace(temp_path, path)
+        thumbnail.path = path
+    except OSError as e:
+        logger.warning(f"Failed to cache thumbnail: {e}")
+    return thumbnail
+
+def load_thumbnail(path):
+    """
+    Returns:
+        Thumbnail or None: The cached thumbnail at `path`, None if it is gone.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        logger.warning(f"Failed to read cached thumbnail {path}: {e}")
+        return None
+    return Thumbnail(data, os.path.splitext(path)[1].lstrip(".").lower(), path=path)
@@ -0,0 +1,173 @@
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+
+from logs import setup_logging
+
+logger = setup_logging("url_utils")
+
+INSTAGRAM_POST_PATTERN = re.compile(r'/(?:[A-Za-z0-9_.]+/)?(?:p|reel|reels|tv)/([A-Za-z0-9_\-]+)')
+TIKTOK_VIDEO_PATTERN = re.compile(r'/(@[A-Za-z0-9_.\-]+)/video/([0-9]+)')
+TIKTOK_SHORT_HOSTS = ("vm.tiktok.com", "vt.tiktok.com")
+
+# Successfully resolved short links, failures are tried again next time
+_resolved_urls = OrderedDict()
+_resolved_urls_lock = threading.Lock()
+RESOLVED_URLS_MAX_ENTRIES = 1024
+
+def _split_url(url):
+    """
+    Returns:
+        tuple: (host without `www.`/`m.`, path without trailing slash) of the URL.
+    """
+    url = url.strip()
+    if "://" not in url:
+        url = f"https://{url}"
+    parts = urlsplit(url)
+    host = parts.netloc.lower().split(":")[0]
+    for prefix in ("www.", "m."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    return host, parts.path.rstrip("/")
+
+def is_short_url(url):
+    """Returns True for short links that only redirect to a post (e.g. vm.tiktok.com/...)"""
+    host, path = _split_url(url)
+    return host in TIKTOK_SHORT_HOSTS or (host == "tiktok.com" and path.startswith("/t/"))
+
+def resolve_short_url(url, timeout=5):
+    """
+    Follows the redirect of a short link (e.g. vm.tiktok.com/...). This blocks
+    on the network, so it's done by the job workers, never while handling a request.
+    
+    Args:
+        url (str): The URL of the post.
+        timeout (float, optional): Seconds to wait for the redirect.
+    
+    Returns:
+        str: The URL the short link points to, or the input if it is no short
+            link or can't be resolved.
+    """
+    if not is_short_url(url):
+        return url
+    with _resolved_urls_lock:
+        if url in _resolved_urls:
+            _resolved_urls.move_to_end(url)
+            return _resolved_urls[url]
+    try:
+        resolved = requests.head(url, allow_redirects=True, timeout=timeout).url
+    except Exception as e:
+        logger.info(f"Failed to resolve short link {url}: {e}")
+        return url
+    if not resolved or is_short_url(resolved):
+        logger.info(f"Short link {url} did not redirect to a post")
+        return url
+    with _resolved_urls_lock:
+        _resolved_urls[url] = resolved
+        while len(_resolved_urls) > RESOLVED_URLS_MAX_ENTRIES:
+            _resolved_urls.popitem(last=False)
+    return resolved
+
+def canonicalize_url(url, resolve=False):
+    """
+    Normalizes a post URL so that different links to the same post map to the same key.
+    Forces https and drops `www.`/`m.` prefixes, query parameters, fragments and trailing slashes
+    and maps Instagram reel/tv links to /p/.
+    
+    Args:
+        url (str): The URL of the social media post.
+        resolve (bool, optional): Resolve short links over the network, see `resolve_short_url`.
+            Off by default, the fetch stage resolves the URL of a job once.
+    
+    Returns:
+        str: The canonical URL.
+    """
+    if resolve and is_short_url(url):
+        resolved = resolve_short_url(url)
+        if resolved != url:
+            return canonicalize_url(resolved)
+
+    host, path = _split_url(url)
+    if host == "instagram.com":
+        match = INSTAGRAM_POST_PATTERN.match(path)
+        if match:
+            path = f"/p/{match.group(1)}"
+    elif host == "tiktok.com":
+        match = TIKTOK_VIDEO_PATTERN.match(path)
+        if match:
+            path = f"/{match.group(1).lower()}/video/{match.group(2)}"
+
+    return f"https://{host}{path}"
+
+PLATFORM_ALIASES = {"instagram": "instagram", "i": "instagram", "tiktok": "tiktok", "t": "tiktok"}
+
+def is_valid_url(url, platform):
+    """
+    Check if the given URL is a valid post URL of the platform.
+    Args:
+        url (str): The URL to be validated.
+        platform (str): The platform ("instagram"/"i" or "tiktok"/"t").
+    Returns:
+        bool: True if the URL matches the URL pattern of the platform, False otherwise.
+    """
+    
+    match platform:
+        case "instagram" | "i":
+            url_pattern = re.compile(r'^(https?:\/\/)?(www\.)?instagram\.com\/[A-Za-z0-9_.\-\/]+\/?(\?.*)?$')
+        case "tiktok" | "t":
+            # Handles may contain dots, short links are resolved by the worker
+            if is_short_url(url):
+                url_pattern = re.compile(r'^(https?:\/\/)?((vm|vt)\.tiktok\.com|(www\.)?tiktok\.com\/t)\/[A-Za-z0-9_\-]+\/?(\?.*)?$')
+            else:
+                url_pattern = re.compile(r'^(https?:\/\/)?(www\.|m\.)?tiktok\.com\/@?[A-Za-z0-9_.\-\/]+\/video\/[0-9]+\/?(\?.*)?$')
+        case _:
+            return False
+            
+    return re.match(url_pattern, url) is not None
+
+def detect_platform(url):
+    """
+    Returns:
+        str or None: "instagram" or "tiktok" depending on the host of the URL.
+    """
+    host = urlsplit(url if "://" in url else f"https://{url}").netloc.lower()
+    if host == "instagram.com" or host.endswith(".instagram.com"):
+        return "instagram"
+    if host == "tiktok.com" or host.endswith(".tiktok.com"):
+        return "tiktok"
+    return None
+
+def prepare_batch(entries, platform=None):
+    """
+    Validates and deduplicates a list of post URLs for a bulk import.
+    Two links count as duplicates if they point to the same post.
+    
+    Args:
+        entries (list): URLs, or (url, platform) tuples for entries with their own platform.
+        platform (str, optional): Platform of entries without one. Detected from the URL if missing.
+    
+    Returns:
+        tuple: (valid, duplicates, invalid) where `valid` is a list of (url, platform)
+            tuples in input order and `duplicates` and `invalid` are lists of URLs.
+    """
+    valid, duplicates, invalid = [], [], []
+    seen = set()
+    for entry in entries:
+        url, entry_platform = entry if isinstance(entry, (tuple, list)) else (entry, None)
+        url = (url or "").strip()
+        if not url:
+            continue
+        entry_platform = PLATFORM_ALIASES.get((entry_platform or platform or "").lower()) or detect_platform(url)
+        if not entry_platform or not is_valid_url(url, entry_platform):
+            invalid.append(url)
+            continue
+        key = canonicalize_url(url)
+        if key in seen:
+            duplicates.append(url)
+            continue
+        seen.add(key)
+        valid.append((url, entry_platform))
+    return valid, duplicates, invalid
@@ -0,0 +1,30 @@
+import threading
+
+from scheduler import JobScheduler
+from scrapers.cancellation import JobCancelled
+
+
+def test_worker_survives_job_cancelled():
+    done = threading.Event()
+    handled = []
+    refills = []
+
+    def handler(job_id):
+        handled.append(job_id)
+        if job_id == "cancelled":
+            raise JobCancelled("Job was cancelled")
+        done.set()
+
+    scheduler = JobScheduler(handler, worker_count=1, max_queue_size=5, refill=refills.append)
+    scheduler.start()
+    try:
+        scheduler.submit("cancelled")
+        scheduler.submit("next")
+        assert done.wait(5), "the only worker died on JobCancelled"
+    finally:
+        scheduler.shutdown(timeout=5)
+
+    assert handled == ["cancelled", "next"]
+    # The refill after the cancelled job still ran
+    assert refills
+    assert scheduler.stats()["running"] == 0
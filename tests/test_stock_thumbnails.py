@@ -0,0 +1,31 @@
+from io import BytesIO
+
+from PIL import Image
+
+from scrapers.stock_thumbnails import StockThumbnailCache
+from scrapers.thumbnails import encode_thumbnail
+
+
+def _thumbnail(color):
+    output = BytesIO()
+    Image.new("RGB", (32, 32), color).save(output, format="PNG")
+    return encode_thumbnail(output.getvalue())
+
+
+def test_offline_cache_returns_bundled_fallback(tmp_path):
+    cache = StockThumbnailCache(lambda term: None, cache_dir=str(tmp_path))
+    thumbnail = cache.get("Creamy garlic pasta")
+    assert thumbnail is not None
+    assert cache.stats()["fallbacks"] == 1
+
+
+def test_downloads_are_loaded_again_after_a_restart(tmp_path):
+    cache = StockThumbnailCache(lambda term: None, images_per_term=2, cache_dir=str(tmp_path))
+    for color in ("red", "green"):
+        assert cache._add("garlic-pasta", _thumbnail(color))
+
+    restarted = StockThumbnailCache(lambda term: None, images_per_term=2, cache_dir=str(tmp_path))
+    assert restarted.stats()["images"] == 2
+    assert restarted.get("Garlic pasta") is not None
+    assert restarted.stats()["hits"] == 1
+
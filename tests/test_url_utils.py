@@ -0,0 +1,50 @@
+from unittest import mock
+
+import requests
+
+from scrapers import url_utils
+from scrapers.url_utils import canonicalize_url, is_valid_url, resolve_short_url
+
+SHORT_URL = "https://vm.tiktok.com/ZMabc123/"
+VIDEO_URL = "https://www.tiktok.com/@chef.anna/video/7312345678901234567?lang=en"
+
+
+def test_failed_short_link_resolution_is_not_cached():
+    answers = [requests.Timeout("timed out"), mock.Mock(url=VIDEO_URL)]
+
+    def head(url, **kwargs):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    url_utils._resolved_urls.clear()
+    with mock.patch.object(url_utils.requests, "head", side_effect=head) as head_mock:
+        assert resolve_short_url(SHORT_URL) == SHORT_URL
+        assert resolve_short_url(SHORT_URL) == VIDEO_URL
+        # Successful resolutions are remembered
+        assert resolve_short_url(SHORT_URL) == VIDEO_URL
+    assert head_mock.call_count == 2
+
+
+def test_canonicalize_url_does_not_resolve_by_default():
+    with mock.patch.object(url_utils.requests, "head") as head_mock:
+        assert canonicalize_url(SHORT_URL) == "https://vm.tiktok.com/ZMabc123"
+    head_mock.assert_not_called()
+
+
+def test_tiktok_handles_with_dots_are_valid():
+    assert is_valid_url("https://www.tiktok.com/@chef.anna/video/123", "tiktok")
+    assert is_valid_url("https://www.tiktok.com/@chef.anna/video/123?is_from_webapp=1", "tiktok")
+
+
+def test_tiktok_short_links_are_valid():
+    assert is_valid_url("https://vm.tiktok.com/ZMabc123/", "tiktok")
+    assert is_valid_url("https://vt.tiktok.com/ZSabc123", "t")
+    assert is_valid_url("https://www.tiktok.com/t/ZTabc123/", "tiktok")
+
+
+def test_invalid_post_urls_are_rejected():
+    assert not is_valid_url("https://evil.com/?tiktok.com", "tiktok")
+    assert not is_valid_url("https://www.tiktok.com/@chef.anna", "tiktok")
+    assert not is_valid_url("https://vm.tiktok.com/ZMabc123/", "instagram")
@@ -0,0 +1,115 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from metrics import counter, histogram
+
+SPAN_SECONDS = histogram("recipe_span_duration_seconds", "Duration of the instrumented operations of a job", ("span",))
+SPAN_ERRORS = counter("recipe_span_errors_total", "Instrumented operations that raised an exception", ("span",))
+# Keeps the spans column of a job small even if an AI module retries a lot
+MAX_SPANS = 500
+
+_current_trace = ContextVar("job_trace", default=None)
+_current_span = ContextVar("job_span", default=None)
+_traces = {}
+_traces_lock = threading.Lock()
+
+
+class JobTrace:
+    """
+    The spans recorded for one job. The stages of a job run in different
+    worker threads, they all add to the same trace until the job is finished.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.started = time.perf_counter()
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._spans = []
+
+    def add(self, record):
+        with self._lock:
+            if len(self._spans) >= MAX_SPANS:
+                self.dropped += 1
+                return
+            self._spans.append(record)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def spans(self):
+        """Returns the spans ordered by their start"""
+        with self._lock:
+            return sorted(self._spans, key=lambda record: record["start"])
+
+
+@contextmanager
+def job_trace(job_id):
+    """Records the spans of the enclosed code into the trace of `job_id`"""
+    with _traces_lock:
+        trace = _traces.get(job_id)
+        if trace is None:
+            trace = _traces[job_id] = JobTrace(job_id)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def get_trace(job_id):
+    """Returns the trace of a running job, None if it has none"""
+    with _traces_lock:
+        return _traces.get(job_id)
+
+def finish_trace(job_id):
+    """
+    Removes the trace of a finished job.
+
+    Returns:
+        JobTrace or None: The trace, None if no span was recorded for the job.
+    """
+    with _traces_lock:
+        return _traces.pop(job_id, None)
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Measures the enclosed code. The duration goes into the
+    recipe_span_duration_seconds histogram and, inside a `job_trace`, into
+    the spans of the job.
+
+    Args:
+        name (str): Name of the operation, e.g. "page.load".
+        **attributes: Details stored with the span, None values are left out.
+
+    Yields:
+        dict: The attributes, add results like token counts to it.
+    """
+    trace = _current_trace.get()
+    parent = _current_span.get()
+    token = _current_span.set(name)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield attributes
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _current_span.reset(token)
+        SPAN_SECONDS.observe(duration, span=name)
+        if error:
+            SPAN_ERRORS.inc(span=name)
+        if trace is not None:
+            record = {"name": name, "start": round(start - trace.started, 4), "duration": round(duration, 4)}
+            if parent:
+                record["parent"] = parent
+            details = {key: value for key, value in attributes.items() if value is not None}
+            if details:
+                record["attributes"] = details
+            if error:
+                record["error"] = error
+            trace.add(record)
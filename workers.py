@@ -1,114 +1,391 @@
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
+import json
+import os
+import socket
+import threading
 import traceback
+import uuid
 
+from events import event_bus
+from job_store import FINISHED_STATUSES, JobStateStore
 from logs import setup_logging
-from models import db, Job
+from metrics import counter, histogram
+from models import compress_result, db, Job
+from scrapers import cache_control
+from scrapers.cancellation import CancelToken, JobCancelled, JobTimedOut, cancel_scope
+from scrapers.progress import describe_progress, report_to
 from scrapers.scraper_service import ScraperService
+from scrapers.url_utils import is_valid_url
+from tracing import finish_trace, job_trace, span
 
 logger = setup_logging("job_processor")
 
-def update_job_status(job_id, status, progress=None, message=None, result=None, result_url=None):
-    """Update job status in the database"""
+JOBS_FINISHED = counter("recipe_jobs_finished_total", "Jobs finished by this process", ("status",))
+JOB_SECONDS = histogram("recipe_job_duration_seconds", "Time from the start of the first stage to the end of a job", ("status",))
+
+# Job progress of the provider events, the stage handlers set the steps in between
+EVENT_PROGRESS = {'caption': 25, 'upload': 72, 'recipe_created': 75, 'thumbnail_uploaded': 78}
+# The extracted parts of a recipe move the progress from 40 to 59
+EXTRACT_PROGRESS = (40, 59)
+
+# Identifies this process in the claimed_by column of the jobs it works on
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Cancel tokens of the jobs this process works on, from their claim until they are finished
+cancel_tokens = {}
+cancel_tokens_lock = threading.Lock()
+
+def write_job_updates(changes):
+    """Write batched job updates (job id -> changed fields) in one transaction"""
     from app import app
     with app.app_context():
-        job = Job.query.get(job_id)
-        if job:
-            job.status = status
-            if progress is not None:
-                job.progress = progress
-            if message is not None:
-                job.message = message
-            if result is not None:
-                job.result = result
-            if result_url is not None:
-                job.result_url = result_url
-            
-            if status in ['completed', 'failed']:
-                job.completed_at = datetime.now()
-                
-            db.session.commit()
-
-def is_valid_url(url, platform):
-    """Validate URL format"""
-    if platform == 'instagram':
-        return 'instagram.com' in url
-    elif platform == 'tiktok':
-        return 'tiktok.com' in url
-    return False
-
-def process_scraping_job(job_id):
-    """Process a scraping job"""
+        for job_id, fields in changes.items():
+            if fields.get('result'):
+                fields = {**fields, 'result': compress_result(fields['result'], app.config['RESULT_COMPRESS_THRESHOLD'])}
+            Job.query.filter_by(id=job_id).update(fields, synchronize_session=False)
+        db.session.commit()
+
+# Progress updates are kept in memory and written in batches, finished jobs right away
+job_store = JobStateStore(write_job_updates)
+
+def start_cancel_token(job_id, timeout):
+    """
+    Creates the cancel token of a job that is about to be claimed. Its
+    deadline starts now, the time spent waiting in the queue doesn't count.
+    """
+    token = CancelToken(timeout or None)
+    with cancel_tokens_lock:
+        cancel_tokens[job_id] = token
+    return token
+
+def get_cancel_token(job_id):
+    with cancel_tokens_lock:
+        return cancel_tokens.get(job_id)
+
+def drop_cancel_token(job_id):
+    with cancel_tokens_lock:
+        cancel_tokens.pop(job_id, None)
+
+def cancel_job(job_id):
+    """
+    Cancels a job. Pending jobs are cancelled right away, running jobs stop
+    at their next check point (before a prompt, a browser or an upload) and
+    hand their browser and AI session back to the pools. Jobs running in
+    another process are flagged and stopped by that process.
+
+    Returns:
+        str or None: 'cancelled' if the job was pending, 'cancelling' if it's
+            running, None if it's already finished.
+    """
+    from app import app
+    with app.app_context():
+        now = datetime.now()
+        cancelled = Job.query.filter_by(id=job_id, status='pending').update(
+            {'status': 'cancelled', 'message': 'Cancelled', 'completed_at': now, 'cancel_requested': True},
+            synchronize_session=False
+        )
+        flagged = 0
+        if not cancelled:
+            flagged = Job.query.filter_by(id=job_id, status='processing').update(
+                {'cancel_requested': True}, synchronize_session=False
+            )
+        db.session.commit()
+
+    if cancelled:
+        JOBS_FINISHED.inc(status='cancelled')
+        event_bus.publish(job_event({'id': job_id, 'status': 'cancelled', 'message': 'Cancelled'}))
+        return 'cancelled'
+    token = get_cancel_token(job_id)
+    if token:
+        token.cancel()
+        return 'cancelling'
+    # Running in another process, or finished in memory but not written yet
+    state = get_job_state(job_id)
+    if state and state.get('status') in FINISHED_STATUSES:
+        return None
+    return 'cancelling' if flagged else None
+
+def apply_cancel_requests():
+    """Stops the jobs of this process that were cancelled through another process"""
+    from app import app
+    with app.app_context():
+        rows = db.session.query(Job.id).filter(
+            Job.status == 'processing',
+            Job.claimed_by == WORKER_ID,
+            Job.cancel_requested.is_(True)
+        ).all()
+    for (job_id,) in rows:
+        token = get_cancel_token(job_id)
+        if token and not token.cancelled:
+            logger.info(f"Cancelling job {job_id} as requested")
+            token.cancel()
+
+def claim_job(job_id):
+    """
+    Atomically moves a pending job to processing for this process. Several
+    processes may have queued the same job, only the first claim succeeds.
+
+    Returns:
+        bool: True if this process owns the job now.
+    """
+    from app import app
+    with app.app_context():
+        now = datetime.now()
+        claimed = Job.query.filter_by(id=job_id, status='pending').update(
+            {'status': 'processing', 'claimed_by': WORKER_ID, 'heartbeat_at': now},
+            synchronize_session=False
+        )
+        db.session.commit()
+    return claimed == 1
+
+def update_job_status(job_id, status, progress=None, message=None, result=None, result_url=None):
+    """
+    Update the job status in memory, it's written to the database in the background.
+    Finishing a job also stores the spans recorded for it.
+    """
+    completed_at = None
+    spans = None
+    if status in FINISHED_STATUSES:
+        completed_at = datetime.now()
+        drop_cancel_token(job_id)
+        JOBS_FINISHED.inc(status=status)
+        trace = finish_trace(job_id)
+        if trace:
+            JOB_SECONDS.observe(trace.elapsed(), status=status)
+            spans = json.dumps(trace.spans())
+    state = job_store.update(
+        job_id,
+        status=status,
+        progress=progress,
+        message=message,
+        result=result,
+        result_url=result_url,
+        completed_at=completed_at,
+        spans=spans
+    )
+    # Push the change to open job and history pages
+    event_bus.publish(job_event(state))
+
+def get_job_state(job_id):
+    """Returns the in-memory state of a running job, None if it's not running"""
+    return job_store.get(job_id)
+
+def job_event(job):
+    """Returns the status of a job (model or in-memory state) as sent to the job and history pages"""
+    if not isinstance(job, dict):
+        job = {key: getattr(job, key) for key in ('id', 'status', 'progress', 'message', 'result_url')}
+    return {
+        'id': job['id'],
+        'status': job.get('status'),
+        'progress': job.get('progress') or 0,
+        'message': job.get('message'),
+        'result_url': job.get('result_url') if job.get('status') == 'completed' else None
+    }
+
+def job_progress(job_id):
+    """
+    Returns a progress callback for the provider stages (see
+    `scrapers.progress.report_progress`) that updates the job state.
+    The progress never moves back, e.g. when more steps than expected are extracted.
+    """
+    last = 0
+
+    def report(event, details):
+        nonlocal last
+        if event == 'extract':
+            low, high = EXTRACT_PROGRESS
+            progress = low + (high - low) * details['done'] // max(details['total'], 1)
+        else:
+            progress = EVENT_PROGRESS.get(event)
+        if progress is not None and progress <= last:
+            progress = None
+        last = progress or last
+        update_job_status(job_id, 'processing', progress, describe_progress(event, details))
+    return report
+
+@contextmanager
+def job_stage(job_id, name, bypass_cache=False):
+    """
+    Runs a provider stage of a job with its cache settings, span, progress
+    reporting and cancel token. A finished stage is never undone, a job
+    cancelled meanwhile stops when its next stage starts.
+
+    Raises:
+        JobCancelled: If the job is cancelled or times out before or during the stage.
+    """
+    token = get_cancel_token(job_id) or CancelToken()
+    token.check()
+    with cache_control.bypass_cache() if bypass_cache else nullcontext():
+        with job_trace(job_id), span(f'stage.{name}'), report_to(job_progress(job_id)), cancel_scope(token):
+            yield
+
+def _load_job(job_id):
     from app import app
-    
     with app.app_context():
         job = Job.query.get(job_id)
         if not job:
             logger.info(f"Job {job_id} not found")
-            return
+            return None
+        return {'url': job.url, 'platform': job.platform, 'target': job.target}
+
+def _stop_job(job_id, e):
+    """Marks a job cancelled or timed out, keeping the progress it reached"""
+    if isinstance(e, JobTimedOut):
+        logger.info(f"Job {job_id} timed out: {e}")
+        update_job_status(job_id, 'timed_out', None, str(e))
+    else:
+        logger.info(f"Job {job_id} was cancelled")
+        update_job_status(job_id, 'cancelled', None, 'Cancelled')
+
+def _fail_job(job_id, e):
+    # Errors of a job that was stopped meanwhile, like a browser pool
+    # timeout cut short by the deadline, count as cancelled or timed out
+    token = get_cancel_token(job_id)
+    stopped = token.error() if token else None
+    if stopped:
+        _stop_job(job_id, stopped)
+        return
+    error_details = traceback.format_exc()
+    logger.info(f"Error in job {job_id}: {str(e)}", exc_info=True)
+    update_job_status(
+        job_id, 
+        'failed', 
+        0, 
+        f'Error: {str(e)}',
+        result=error_details
+    )
+
+def _finish_job(job_id, result):
+    """Mark a job completed or failed depending on the provider result"""
+    # Check if result indicates an error
+    if isinstance(result, dict) and result.get('status') == 'error':
+        error_message = result.get('error', 'Unknown error')
+        logger.error(f"API error in job {job_id}: {error_message}")
+        update_job_status(
+            job_id, 
+            'failed', 
+            0, 
+            f'Error scraping recipe',
+            result=str(result)
+        )
+        return
+    
+    update_job_status(job_id, 'processing', 80, 'Finishing up...')
+    
+    # Get the result URL if available
+    result_url = None
+    if isinstance(result, dict) and 'url' in result:
+        result_url = result['url']
         
-        try:
-            # Update status to processing
-            update_job_status(job_id, 'processing', 10, 'Starting job...')
-            logger.info(f"Starting job {job_id} for URL: {job.url}")
-            
-            # Validate URL
-            if not is_valid_url(job.url, job.platform):
-                logger.info(f"Invalid {job.platform} URL format: {job.url}")
-                update_job_status(job_id, 'failed', 0, f'Invalid {job.platform} URL format')
-                return
-            
-            update_job_status(job_id, 'processing', 20, 'Scraping content...')
-            logger.info(f"Scraping content from {job.url}")
-            
-            # Process based on target
-            result = None
-            if job.target == 'tandoor':
-                update_job_status(job_id, 'processing', 40, 'Processing for Tandoor...')
-                logger.info(f"Processing for Tandoor: {job.url}")
-                result = ScraperService.scrape_recipe(job.url, job.platform)
-            elif job.target == 'mealie':
-                update_job_status(job_id, 'processing', 40, 'Processing for Mealie...')
-                logger.info(f"Processing for Mealie: {job.url}")
-                result = ScraperService.scrape_recipe(job.url, job.platform)
-                
-            # Check if result indicates an error
-            if isinstance(result, dict) and result.get('status') == 'error':
-                error_message = result.get('error', 'Unknown error')
-                logger.error(f"API error in job {job_id}: {error_message}")
-                update_job_status(
-                    job_id, 
-                    'failed', 
-                    0, 
-                    f'Error scraping recipe',
-                    result=str(result)
-                )
-                return
-            
-            update_job_status(job_id, 'processing', 80, 'Finishing up...')
-            
-            # Get the result URL if available
-            result_url = None
-            if isinstance(result, dict) and 'url' in result:
-                result_url = result['url']
-                
-            # Mark job as completed
-            logger.info(f"Job {job_id} completed successfully")
-            update_job_status(
-                job_id, 
-                'completed', 
-                100, 
-                'Recipe successfully scraped and uploaded!',
-                result=str(result),
-                result_url=result_url
-            )
-            
-        except Exception as e:
-            error_details = traceback.format_exc()
-            logger.info(f"Error in job {job_id}: {str(e)}", exc_info=True)
-            update_job_status(
-                job_id, 
-                'failed', 
-                0, 
-                f'Error: {str(e)}',
-                result=error_details
-            )
\ No newline at end of file
+    # Mark job as completed
+    logger.info(f"Job {job_id} completed successfully")
+    if isinstance(result, dict) and result.get('already_imported'):
+        message = 'Recipe was already imported, skipped scraping'
+    else:
+        message = 'Recipe successfully scraped and uploaded!'
+    update_job_status(
+        job_id, 
+        'completed', 
+        100, 
+        message,
+        result=str(result),
+        result_url=result_url
+    )
+
+def fetch_job(job_id, bypass_cache=False, timeout=None):
+    """
+    First stage of a scraping job: validates the URL and gets the caption and thumbnail.
+    
+    Args:
+        job_id (str): The id of the job.
+        bypass_cache (bool, optional): Ignore cached captions, recipes and AI responses.
+        timeout (float, optional): Seconds the job may run, defaults to JOB_TIMEOUT.
+    
+    Returns:
+        dict or None: Keyword arguments for `extract_job`, None if the job is finished.
+    """
+    from app import app
+    job = _load_job(job_id)
+    if not job:
+        return None
+    start_cancel_token(job_id, app.config['JOB_TIMEOUT'] if timeout is None else timeout)
+    if not claim_job(job_id):
+        drop_cancel_token(job_id)
+        logger.info(f"Job {job_id} was already claimed by another worker")
+        return None
+    
+    try:
+        # Update status to processing
+        update_job_status(job_id, 'processing', 10, 'Starting job...')
+        logger.info(f"Starting job {job_id} for URL: {job['url']}")
+        
+        # Validate URL
+        if not is_valid_url(job['url'], job['platform']):
+            logger.info(f"Invalid {job['platform']} URL format: {job['url']}")
+            update_job_status(job_id, 'failed', 0, f"Invalid {job['platform']} URL format")
+            return None
+        
+        if job['target'] not in ('tandoor', 'mealie'):
+            _finish_job(job_id, None)
+            return None
+        
+        update_job_status(job_id, 'processing', 20, 'Scraping content...')
+        logger.info(f"Scraping content from {job['url']}")
+        with job_stage(job_id, 'fetch', bypass_cache):
+            state = ScraperService.get_provider().fetch(job['url'], job['platform'])
+        
+        if 'result' in state:
+            _finish_job(job_id, state['result'])
+            return None
+        
+        update_job_status(job_id, 'processing', 30, 'Waiting for AI extraction...')
+        return {'state': state, 'job': job, 'bypass_cache': bypass_cache}
+    
+    except JobCancelled as e:
+        _stop_job(job_id, e)
+        return None
+    except Exception as e:
+        _fail_job(job_id, e)
+        return None
+
+def extract_job(job_id, state, job, bypass_cache=False):
+    """
+    Second stage of a scraping job: turns the caption into the recipe payload.
+    
+    Returns:
+        dict or None: Keyword arguments for `upload_job`, None if the job failed.
+    """
+    try:
+        target = 'Tandoor' if job['target'] == 'tandoor' else 'Mealie'
+        update_job_status(job_id, 'processing', 40, f'Processing for {target}...')
+        logger.info(f"Processing for {target}: {job['url']}")
+        with job_stage(job_id, 'extract', bypass_cache):
+            ScraperService.get_provider().extract(state)
+        
+        update_job_status(job_id, 'processing', 60, f'Waiting for upload to {target}...')
+        return {'state': state, 'job': job, 'bypass_cache': bypass_cache}
+    
+    except JobCancelled as e:
+        _stop_job(job_id, e)
+        return None
+    except Exception as e:
+        _fail_job(job_id, e)
+        return None
+
+def upload_job(job_id, state, job, bypass_cache=False):
+    """
+    Last stage of a scraping job: sends the payload to Tandoor or Mealie.
+    """
+    try:
+        update_job_status(job_id, 'processing', 70, 'Uploading recipe...')
+        with job_stage(job_id, 'upload', bypass_cache):
+            ScraperService.get_provider().upload(state)
+        _finish_job(job_id, state['result'])
+    
+    except JobCancelled as e:
+        _stop_job(job_id, e)
+    except Exception as e:
+        _fail_job(job_id, e)
+    
+    return None